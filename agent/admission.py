@@ -0,0 +1,307 @@
+"""
+Load-aware admission control and degraded audio processing.
+
+Every session runs noise cancellation, Silero VAD and the turn detector on
+the worker CPU. A worker that takes more calls than it can process in real
+time makes all of them stutter together. Two mechanisms prevent that:
+
+  * Admission (worker process). `WorkerLoad` is the worker's
+    `WorkerOptions.load_fnc`. It reports machine CPU plus the cost of one
+    more session (current CPU / active jobs) to the LiveKit dispatcher, so
+    the worker stops taking jobs before it is saturated rather than after
+    (`load_threshold`). `admit` is the `request_fnc`: it rejects requests
+    that arrive between two load reports once the worker is full.
+    `WORKER_MAX_JOBS` adds a hard cap.
+
+  * Degradation (job). A session that starts while the machine is busy gets
+    cheaper audio processing:
+
+        full      BVC noise cancellation, multilingual turn detector
+        reduced   NC (lighter noise cancellation), multilingual turn detector
+        minimal   no noise cancellation, VAD-only endpointing
+
+    livekit fixes noise cancellation and turn detection when a session
+    starts, so running calls keep their level. New calls come in cheaper
+    until the pressure is gone.
+
+While a call runs, `report_load` samples this process's CPU and hands a
+`LoadMetrics` record to the session every LOAD_SAMPLE_SECONDS. Its
+`session_cpu` is the real-time factor: CPU seconds spent per second of call
+audio, with the process CPU split across the sessions it hosts.
+
+Machine CPU is measured from `psutil.cpu_times()` deltas, never with
+`psutil.cpu_percent()`, whose single module-wide baseline would be reset by
+whichever reader came last. `WorkerLoad` keeps its own deltas between load
+reports. In a job process, `SYSTEM_CPU` samples on a background thread
+(started from prewarm, before any call arrives) and reports utilization over
+the last CPU_WINDOW seconds. Until it has two samples it falls back to the
+1-minute load average per core.
+"""
+import asyncio
+import collections
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import psutil
+
+from agent import settings
+from agent.lifecycle import PROCESS_JOBS
+
+LEVELS = ("full", "reduced", "minimal")
+
+# An accepted job that never shows up in active_jobs stops counting after this
+PENDING_TIMEOUT = 30.0
+
+# Machine CPU of a job process: sampled this often, reported over this window
+CPU_SAMPLE_INTERVAL = 0.5
+CPU_WINDOW = 2.0
+
+
+@dataclass
+class LoadMetrics:
+    """One load sample of the process hosting a session"""
+
+    level: str
+    sessions: int
+    # CPU of this process, in cores
+    process_cpu: float
+    # CPU seconds per second of call audio for one session (real-time factor)
+    session_cpu: float
+    # whole machine, 0..1
+    system_cpu: float
+    # event-loop lag p99 over the last minute, if the loop monitor runs
+    loop_lag_p99: float = 0.0
+    timestamp: float = field(default_factory=time.time)
+    type: str = "load_metrics"
+
+
+def load_summary(store, level: str) -> List[str]:
+    """Final-summary line for the load samples of one session (agent/store.py)"""
+    records = list(store.rows("load"))
+    if not records:
+        return []
+    rtf = sum(record["session_cpu"] for record in records) / len(records)
+    peak = max(record["system_cpu"] for record in records)
+    return [f"  • Load: {level} processing, mean real-time factor {rtf:.3f}, peak system CPU {peak * 100:.0f}%"]
+
+
+# -- machine CPU ---------------------------------------------------------------
+
+
+def cpu_times() -> Tuple[float, float]:
+    """(busy, total) CPU seconds of the whole machine since boot"""
+    times = psutil.cpu_times()
+    total = sum(times)
+    return total - times.idle - getattr(times, "iowait", 0.0), total
+
+
+def cpu_between(before: Tuple[float, float], after: Tuple[float, float]) -> Optional[float]:
+    """Machine CPU 0..1 between two `cpu_times()` readings, None if no time passed"""
+    busy, total = after[0] - before[0], after[1] - before[1]
+    if total <= 0:
+        return None
+    return min(1.0, max(0.0, busy / total))
+
+
+def load_average() -> float:
+    """1-minute load average per core, 0..1"""
+    try:
+        return min(1.0, psutil.getloadavg()[0] / (psutil.cpu_count() or 1))
+    except (AttributeError, OSError):
+        return 0.0
+
+
+class CpuSampler:
+    """Machine CPU over the last `window` seconds, from cpu_times() sampled on a daemon thread"""
+
+    def __init__(self, interval: float = CPU_SAMPLE_INTERVAL, window: float = CPU_WINDOW) -> None:
+        self.interval = interval
+        self._samples: "collections.deque[Tuple[float, float]]" = collections.deque(
+            maxlen=max(2, int(round(window / interval)) + 1)
+        )
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start sampling in this process (a forked job process starts its own thread)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._samples.clear()
+            self._samples.append(cpu_times())
+            self._thread = threading.Thread(target=self._run, name="cpu-sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            sample = cpu_times()
+            with self._lock:
+                self._samples.append(sample)
+
+    def utilization(self) -> float:
+        """0..1 over the window; the load average until there are two samples"""
+        with self._lock:
+            oldest, newest = (self._samples[0], self._samples[-1]) if len(self._samples) >= 2 else (None, None)
+        if oldest is not None:
+            cpu = cpu_between(oldest, newest)
+            if cpu is not None:
+                return cpu
+        return load_average()
+
+
+# -- worker process: load reporting and admission --------------------------
+
+
+class WorkerLoad:
+    def __init__(self, threshold: float, max_jobs: int = 0, smoothing: float = 0.5) -> None:
+        self.threshold = threshold
+        self.max_jobs = max_jobs
+        self.smoothing = smoothing
+        self.cpu = 0.0
+        self.reports = 0
+        self.jobs = 0
+        self.load = 0.0
+        # job id -> accept time, for accepted jobs not yet visible in active_jobs
+        self.accepted: Dict[str, float] = {}
+        # this reader's own baseline: machine CPU since the previous report
+        self._times = cpu_times()
+
+    @property
+    def pending(self) -> int:
+        return len(self.accepted)
+
+    def accept(self, job_id: str) -> None:
+        self.accepted[job_id] = time.monotonic()
+
+    def __call__(self, worker: Any) -> float:
+        """`WorkerOptions.load_fnc`: 0..1, called by the worker every few seconds"""
+        times = cpu_times()
+        cpu = cpu_between(self._times, times)
+        self._times = times
+        if cpu is None:
+            cpu = self.cpu
+        self.cpu = cpu if not self.reports else self.smoothing * cpu + (1 - self.smoothing) * self.cpu
+        self.reports += 1
+        active = getattr(worker, "active_jobs", ())
+        self.jobs = len(active)
+        # a job stops being pending once it runs; the report may come before it does
+        running = {info.job.id for info in active}
+        expired = time.monotonic() - PENDING_TIMEOUT
+        self.accepted = {job_id: at for job_id, at in self.accepted.items() if job_id not in running and at > expired}
+        self.load = self.projected()
+        return min(1.0, self.load)
+
+    def projected(self) -> float:
+        """Load with one more session, assuming it costs what the current ones do on average"""
+        jobs = self.jobs + self.pending
+        per_job = self.cpu / self.jobs if self.jobs else 0.0
+        load = self.cpu + per_job * (self.pending + 1)
+        if self.max_jobs:
+            load = max(load, self.threshold * jobs / self.max_jobs)
+        return load
+
+    def full(self) -> bool:
+        return self.projected() >= self.threshold
+
+
+async def admit(request: Any) -> None:
+    """`WorkerOptions.request_fnc`: accept a job unless the worker is already full"""
+    if WORKER_LOAD.full():
+        print(
+            f"Rejecting job for room {request.room.name}: load {WORKER_LOAD.projected():.2f} "
+            f">= {WORKER_LOAD.threshold:.2f} ({WORKER_LOAD.jobs + WORKER_LOAD.pending} jobs)"
+        )
+        await request.reject()
+        return
+    WORKER_LOAD.accept(request.id)
+    await request.accept()
+
+
+WORKER_LOAD = WorkerLoad(settings.WORKER_LOAD_THRESHOLD, settings.WORKER_MAX_JOBS)
+
+
+# -- job: processing level and per-session load -----------------------------
+
+
+def _loop_lag_p99() -> float:
+    from agent.loop_monitor import LoopMonitor
+
+    lag = LoopMonitor.for_running_loop().lag.window(60.0)
+    return lag.quantile(0.99) if lag.count else 0.0
+
+
+def processing_level() -> str:
+    """Audio processing level for a session starting now"""
+    if settings.AGENT_PROCESSING_LEVEL in LEVELS:
+        return settings.AGENT_PROCESSING_LEVEL
+    system = PROCESS_LOAD.system()
+    level = 2 if system >= settings.DEGRADE_MINIMAL_CPU else 1 if system >= settings.DEGRADE_REDUCED_CPU else 0
+    # a loop that already lags cannot take a full-cost session either
+    if level < 2 and _loop_lag_p99() > settings.LOOP_STALL_MS / 1000:
+        level += 1
+    return LEVELS[level]
+
+
+def audio_processing(level: str, turn_detector: Any) -> Tuple[Optional[Any], Any]:
+    """(noise cancellation, turn detection) for a processing level"""
+    # registered by entry.py on the main thread; this only looks the module up
+    from livekit.plugins import noise_cancellation
+
+    if level == "full":
+        return noise_cancellation.BVC(), turn_detector
+    if level == "reduced":
+        return noise_cancellation.NC(), turn_detector
+    return None, "vad"
+
+
+class ProcessLoad:
+    """CPU of this process between samples, shared by the sessions it hosts"""
+
+    def __init__(self, system: CpuSampler) -> None:
+        self._system = system
+        self._last: Optional[Tuple[float, float]] = None
+        self._sample: Tuple[float, float] = (0.0, 0.0)
+        self._sampled_at = 0.0
+
+    def system(self) -> float:
+        """Machine CPU 0..1 over the sampler's window, without blocking"""
+        self._system.start()
+        return self._system.utilization()
+
+    def sample(self, min_interval: float) -> Tuple[float, float]:
+        """(process CPU in cores, machine CPU 0..1); sessions sampling together share one reading"""
+        now = time.perf_counter()
+        if self._last is not None and now - self._sampled_at < min_interval / 2:
+            return self._sample
+        cpu = time.process_time()
+        if self._last is not None:
+            wall, before = self._last
+            self._sample = ((cpu - before) / max(now - wall, 1e-6), self.system())
+        self._last = (now, cpu)
+        self._sampled_at = now
+        return self._sample
+
+
+# Started by agent/prewarm.py in each job process (or lazily on first use)
+SYSTEM_CPU = CpuSampler()
+PROCESS_LOAD = ProcessLoad(SYSTEM_CPU)
+
+
+async def report_load(metrics_agent, level: str, interval: float = 10.0) -> None:
+    """Submit a LoadMetrics record every `interval` seconds until cancelled"""
+    PROCESS_LOAD.sample(interval)
+    while True:
+        await asyncio.sleep(interval)
+        process_cpu, system_cpu = PROCESS_LOAD.sample(interval)
+        sessions = max(1, PROCESS_JOBS["started"] - PROCESS_JOBS["finished"])
+        metrics_agent.submit_metrics(LoadMetrics(
+            level=level,
+            sessions=sessions,
+            process_cpu=process_cpu,
+            session_cpu=process_cpu / sessions,
+            system_cpu=system_cpu,
+            loop_lag_p99=_loop_lag_p99(),
+        ))
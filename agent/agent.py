@@ -1,329 +1,345 @@
-from dotenv import load_dotenv
-from livekit import agents
-from livekit.agents import AgentSession, Agent, RoomInputOptions, MetricsCollectedEvent
-from livekit.plugins import (
-    openai,
-    cartesia,
-    deepgram,
-    noise_cancellation,
-    silero,
-)
-from livekit.plugins.turn_detector.multilingual import MultilingualModel
+from livekit.agents import Agent
+from livekit.plugins import silero
 from livekit.agents.metrics import STTMetrics, TTSMetrics, EOUMetrics, LLMMetrics
 import asyncio
+import uuid
 from rich.console import Console
-from rich.table import Table
-from rich import box
 from datetime import datetime
-import pandas as pd
-import os
-from pathlib import Path
-
-load_dotenv()
+from agent import settings
+from agent.admission import LoadMetrics, load_summary
+from agent.context import ContextManager, ContextMetrics
+from agent.display import make_display
+from agent.exporter import EXPORTER
+from agent.llm_cache import RESPONSE_CACHE, CachingLLM, LLMCacheMetrics, cache_summary
+from agent.loop_monitor import LoopMetrics
+from agent.phrase_cache import PHRASE_CACHE, phrase_audio, phrase_summary
+from agent.providers import ROUTERS, build_llm, build_stt, build_tts
+from agent.report import export_excel
+from agent.routing import RoutingLLM, RoutingMetrics, RoutingTTS, routing_summary
+from agent.sink import MetricsSink
+from agent.speculative import SpeculationMetrics, SpeculativeLLM, speculation_summary
+from agent.sketch import LatencyStats
+from agent.store import MetricsStore, extract_row
+from agent.trace import make_trace
+from agent.turns import TurnCorrelator
+from agent.writer import MetricsWriter
 
 console = Console()
 
+# Metric event class -> kind (the store/sink/report name of its series)
+METRIC_KINDS = {
+    LLMMetrics: "llm",
+    TTSMetrics: "tts",
+    STTMetrics: "stt",
+    EOUMetrics: "eou",
+    LLMCacheMetrics: "llm_cache",
+    SpeculationMetrics: "speculation",
+    ContextMetrics: "context",
+    RoutingMetrics: "routing",
+    LoopMetrics: "loop",
+    LoadMetrics: "load",
+}
+
+
+def _model_name(model) -> str:
+    """Model name of an STT/LLM/TTS instance, for the session manifest"""
+    opts = getattr(model, "_opts", None)
+    return str(getattr(model, "model", None) or getattr(opts, "model", None) or model.label)
+
+
+def _find_wrapper(model, cls):
+    """The `cls` layer of a chain of LLM wrappers (each keeps the next in `.inner`)"""
+    while model is not None and not isinstance(model, cls):
+        model = getattr(model, "inner", None)
+    return model
+
 
 class MetricsAgent(Agent):
-    def __init__(self) -> None:
+    def __init__(self, *, vad=None, room: str = "", stt=None, llm=None, tts=None, summary_llm=None) -> None:
+        # stt/llm/tts (and the context summarizer) can be injected (e.g. the
+        # fakes in agent/fakes.py); otherwise they come from the configured
+        # provider pools
+        llm = llm or build_llm()
+        if settings.LLM_CACHE_ENABLED and not isinstance(llm, CachingLLM):
+            if settings.LLM_CACHE_SCOPE not in ("room", "shared"):
+                raise ValueError(f"unknown LLM_CACHE_SCOPE {settings.LLM_CACHE_SCOPE!r}, expected 'room' or 'shared'")
+            llm = CachingLLM(
+                llm,
+                context_turns=settings.LLM_CACHE_CONTEXT_TURNS,
+                scope=room if settings.LLM_CACHE_SCOPE == "room" else "",
+            )
+        if settings.SPECULATIVE_LLM_ENABLED and not isinstance(llm, SpeculativeLLM):
+            # outermost, so speculative requests can be answered from the cache
+            llm = SpeculativeLLM(
+                llm,
+                stable_seconds=settings.SPECULATIVE_STABLE_MS / 1000,
+                min_words=settings.SPECULATIVE_MIN_WORDS,
+            )
         super().__init__(
             instructions="""
                 You are a helpful AI assistant that can help with various tasks and questions.
             """,
-            stt=deepgram.STT(model="nova-2", language="en"),
-            llm=openai.LLM(model="gpt-4o-mini"),
-            tts=cartesia.TTS(model="sonic-2", voice="f786b574-daa5-4673-aa0c-cbe3e8534c02"),
-            vad=silero.VAD.load()
+            stt=stt or build_stt(),
+            llm=llm,
+            tts=tts or build_tts(),
+            # Prefer the process-wide VAD loaded by agent.prewarm
+            vad=vad or silero.VAD.load()
         )
         
-        # Initialize metrics storage
-        self.llm_metrics_data = []
-        self.tts_metrics_data = []
-        self.stt_metrics_data = []
-        self.eou_metrics_data = []
+        # Room this agent serves (label for exported metrics)
+        self.room = room
+        
+        # Initialize metrics storage (typed columns, formatted only on export)
+        self.store = MetricsStore(chunk_size=settings.METRICS_STORE_CHUNK)
+        
+        # Joins EOU/LLM/TTS on speech_id into per-turn voice-to-voice latency
+        self.turns = TurnCorrelator(
+            max_pending=settings.TURN_MAX_PENDING,
+            ttl=settings.TURN_TTL_SECONDS,
+        )
         
         # Create metrics directory if it doesn't exist
-        self.metrics_dir = Path("metrics_reports")
+        self.metrics_dir = settings.METRICS_DIR
         self.metrics_dir.mkdir(exist_ok=True)
         
-        # Generate unique filename with timestamp
+        # Generate unique filename with timestamp; raw records stream into a
+        # directory of the same name and the workbook is exported from it.
+        # The short suffix keeps sessions started in the same second apart.
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.excel_filename = self.metrics_dir / f"agent_metrics_{timestamp}.xlsx"
-
-    def save_to_excel(self):
-        """Save all collected metrics to Excel file with multiple sheets"""
-        try:
-            with pd.ExcelWriter(self.excel_filename, engine='openpyxl') as writer:
-                # Save LLM metrics
-                if self.llm_metrics_data:
-                    llm_df = pd.DataFrame(self.llm_metrics_data)
-                    llm_df.to_excel(writer, sheet_name='LLM_Metrics', index=False)
-                    console.print(f"[green]✅ Saved {len(self.llm_metrics_data)} LLM metrics records[/green]")
-                
-                # Save TTS metrics
-                if self.tts_metrics_data:
-                    tts_df = pd.DataFrame(self.tts_metrics_data)
-                    tts_df.to_excel(writer, sheet_name='TTS_Metrics', index=False)
-                    console.print(f"[blue]✅ Saved {len(self.tts_metrics_data)} TTS metrics records[/blue]")
-                
-                # Save STT metrics
-                if self.stt_metrics_data:
-                    stt_df = pd.DataFrame(self.stt_metrics_data)
-                    stt_df.to_excel(writer, sheet_name='STT_Metrics', index=False)
-                    console.print(f"[cyan]✅ Saved {len(self.stt_metrics_data)} STT metrics records[/cyan]")
-                
-                # Save EOU metrics
-                if self.eou_metrics_data:
-                    eou_df = pd.DataFrame(self.eou_metrics_data)
-                    eou_df.to_excel(writer, sheet_name='EOU_Metrics', index=False)
-                    console.print(f"[yellow]✅ Saved {len(self.eou_metrics_data)} EOU metrics records[/yellow]")
-                
-                # Create summary sheet
-                summary_data = {
-                    'Metric Type': ['LLM', 'TTS', 'STT', 'EOU'],
-                    'Total Records': [
-                        len(self.llm_metrics_data),
-                        len(self.tts_metrics_data), 
-                        len(self.stt_metrics_data),
-                        len(self.eou_metrics_data)
-                    ],
-                    'Report Generated': [datetime.now().strftime('%Y-%m-%d %H:%M:%S')] * 4,
-                    'Configuration Notes': [
-                        'LLM metrics from GPT-4o-mini',
-                        'TTS metrics from Cartesia Sonic-2',
-                        'STT metrics from Deepgram Nova-2 (may be 0 with some configs)',
-                        'EOU metrics require VAD/turn detection (may be 0)'
-                    ]
-                }
-                summary_df = pd.DataFrame(summary_data)
-                summary_df.to_excel(writer, sheet_name='Summary', index=False)
-                
-            console.print(f"[bold green]📊 Excel report saved to: {self.excel_filename}[/bold green]")
-            
-        except Exception as e:
-            console.print(f"[red]❌ Error saving Excel file: {str(e)}[/red]")
+        self.session_id = f"{timestamp}_{uuid.uuid4().hex[:6]}"
+        self.excel_filename = self.metrics_dir / f"agent_metrics_{self.session_id}.xlsx"
+        self.sink = MetricsSink(
+            self.metrics_dir / f"agent_metrics_{self.session_id}",
+            max_records_per_segment=settings.METRICS_SEGMENT_RECORDS,
+        )
 
-    def handle_metrics(self, metrics):
-        """Handle different types of metrics"""
-        if isinstance(metrics, LLMMetrics):
-            self.handle_llm_metrics(metrics)
-        elif isinstance(metrics, TTSMetrics):
-            self.handle_tts_metrics(metrics)
-        elif isinstance(metrics, STTMetrics):
-            self.handle_stt_metrics(metrics)
-        elif isinstance(metrics, EOUMetrics):
-            self.handle_eou_metrics(metrics)
-        else:
-            console.print(f"[dim]🔍 Unknown metrics type: {type(metrics)}[/dim]")
+        # Stage timeline for Perfetto, or None when this session is sampled out
+        self.trace = make_trace(self.session_id, room, settings.TRACE_SAMPLE_RATE, settings.TRACE_MAX_EVENTS)
 
-    def handle_llm_metrics(self, metrics: LLMMetrics) -> None:
-        # Store metrics data
-        metrics_dict = {
-            'timestamp': datetime.fromtimestamp(metrics.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
-            'type': str(metrics.type),
-            'label': str(metrics.label),
-            'request_id': str(metrics.request_id),
-            'duration_seconds': round(metrics.duration, 4),
-            'time_to_first_token_seconds': round(metrics.ttft, 4),
-            'cancelled': metrics.cancelled,
-            'completion_tokens': metrics.completion_tokens,
-            'prompt_tokens': metrics.prompt_tokens,
-            'total_tokens': metrics.total_tokens,
-            'tokens_per_second': round(metrics.tokens_per_second, 2),
-            'speech_id': getattr(metrics, 'speech_id', 'N/A')
-        }
-        self.llm_metrics_data.append(metrics_dict)
-        
-        # Display table
-        table = Table(
-            title="[bold red]LLM Metrics Report[/bold red]",
-            box=box.ROUNDED,
-            highlight=True,
-            show_header=True,
-            header_style="bold cyan"
-        )
-        
-        table.add_column("Metric", style="bold green")
-        table.add_column("Value", style="yellow")
-        
-        table.add_row("Type", str(metrics.type))
-        table.add_row("Label", str(metrics.label))
-        table.add_row("Request ID", str(metrics.request_id))
-        table.add_row("Timestamp", metrics_dict['timestamp'])
-        table.add_row("Duration", f"[white]{metrics_dict['duration_seconds']}[/white]s")
-        table.add_row("Time to First Token", f"[white]{metrics_dict['time_to_first_token_seconds']}[/white]s")
-        table.add_row("Cancelled", "✓" if metrics.cancelled else "✗")
-        table.add_row("Completion Tokens", str(metrics.completion_tokens))
-        table.add_row("Prompt Tokens", str(metrics.prompt_tokens))
-        table.add_row("Total Tokens", str(metrics.total_tokens))
-        table.add_row("Tokens/Second", str(metrics_dict['tokens_per_second']))
-        table.add_row("Speech ID", str(metrics_dict['speech_id']))
+        # Rolling p50/p95/p99 sketches per latency field (1m, 15m, session)
+        self.latency = LatencyStats(slot_seconds=settings.LATENCY_SLOT_SECONDS)
+        self._finalized = False
         
-        console.print("\n")
-        console.print(table)
-        console.print(f"[dim]📝 LLM Record #{len(self.llm_metrics_data)} saved[/dim]")
-        console.print("\n")
-        
-        # Auto-save every 3 records
-        if len(self.llm_metrics_data) % 3 == 0:
-            self.save_to_excel()
-    
-    def handle_tts_metrics(self, metrics: TTSMetrics) -> None:
-        # Store metrics data
-        metrics_dict = {
-            'timestamp': datetime.fromtimestamp(metrics.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
-            'type': str(metrics.type),
-            'label': str(metrics.label),
-            'request_id': str(metrics.request_id),
-            'ttfb_seconds': round(metrics.ttfb, 4),
-            'duration_seconds': round(metrics.duration, 4),
-            'audio_duration_seconds': round(metrics.audio_duration, 4),
-            'cancelled': metrics.cancelled,
-            'characters_count': metrics.characters_count,
-            'streamed': metrics.streamed,
-            'speech_id': str(getattr(metrics, 'speech_id', 'N/A'))
-        }
-        self.tts_metrics_data.append(metrics_dict)
-        
-        # Display table
-        table = Table(
-            title="[bold blue]TTS Metrics Report[/bold blue]",
-            box=box.ROUNDED,
-            highlight=True,
-            show_header=True,
-            header_style="bold cyan"
+        # Console rendering: live panel, one-line logs, full tables or nothing
+        self.display_mode = settings.METRICS_DISPLAY
+        self.display = make_display(
+            self.display_mode,
+            self.sink.directory.name,
+            self.latency,
+            refresh_per_second=settings.METRICS_LIVE_REFRESH,
+            job_executor=settings.AGENT_JOB_EXECUTOR,
         )
         
-        table.add_column("Metric", style="bold green")
-        table.add_column("Value", style="yellow")
-        
-        table.add_row("Type", str(metrics.type))
-        table.add_row("Label", str(metrics.label))
-        table.add_row("Request ID", str(metrics.request_id))
-        table.add_row("Timestamp", metrics_dict['timestamp'])
-        table.add_row("TTFB", f"[white]{metrics_dict['ttfb_seconds']}[/white]s")
-        table.add_row("Duration", f"[white]{metrics_dict['duration_seconds']}[/white]s")
-        table.add_row("Audio Duration", f"[white]{metrics_dict['audio_duration_seconds']}[/white]s")
-        table.add_row("Cancelled", "✓" if metrics.cancelled else "✗")
-        table.add_row("Characters Count", str(metrics.characters_count))
-        table.add_row("Streamed", "✓" if metrics.streamed else "✗")
-        table.add_row("Speech ID", str(metrics_dict['speech_id']))
+        # Session startup timings (prewarm state, time to first greeting)
+        self.startup = {}
         
-        console.print("\n")
-        console.print(table)
-        console.print(f"[dim]📝 TTS Record #{len(self.tts_metrics_data)} saved[/dim]")
-        console.print("\n")
-        
-        # Auto-save every 3 records
-        if len(self.tts_metrics_data) % 3 == 0:
-            self.save_to_excel()
+        # Canned phrases played from the phrase cache in this session
+        self.phrase_stats = {"hits": 0, "misses": 0}
 
-    def handle_stt_metrics(self, metrics: STTMetrics) -> None:
-        # Store metrics data
-        metrics_dict = {
-            'timestamp': datetime.fromtimestamp(metrics.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
-            'type': str(metrics.type),
-            'label': str(metrics.label),
-            'request_id': str(metrics.request_id),
-            'duration_seconds': round(metrics.duration, 4),
-            'audio_duration_seconds': round(metrics.audio_duration, 4),
-            'streamed': metrics.streamed,
-            'speech_id': str(getattr(metrics, 'speech_id', 'N/A')),
-            'error': str(getattr(metrics, 'error', 'None'))
-        }
-        self.stt_metrics_data.append(metrics_dict)
-        
-        # Display table
-        table = Table(
-            title="[bold green]STT Metrics Report[/bold green]",
-            box=box.ROUNDED,
-            highlight=True,
-            show_header=True,
-            header_style="bold cyan"
+        # Metrics are handled on a background thread so console and disk I/O
+        # never run on the event loop that carries the audio
+        self.writer = MetricsWriter(
+            self.handle_metrics,
+            maxsize=settings.METRICS_QUEUE_SIZE,
+            policy=settings.METRICS_OVERFLOW_POLICY,
+            sample_every=settings.METRICS_SAMPLE_EVERY,
+            block_timeout=settings.METRICS_BLOCK_TIMEOUT,
         )
+        EXPORTER.track_session(self)
         
-        table.add_column("Metric", style="bold green")
-        table.add_column("Value", style="yellow")
-        
-        table.add_row("Type", str(metrics.type))
-        table.add_row("Label", str(metrics.label))
-        table.add_row("Request ID", str(metrics.request_id))
-        table.add_row("Timestamp", metrics_dict['timestamp'])
-        table.add_row("Duration", f"[white]{metrics_dict['duration_seconds']}[/white]s")
-        table.add_row("Audio Duration", f"[white]{metrics_dict['audio_duration_seconds']}[/white]s")
-        table.add_row("Streamed", "✓" if metrics.streamed else "✗")
-        table.add_row("Speech ID", str(metrics_dict['speech_id']))
-        table.add_row("Error", str(metrics_dict['error']))
-        
-        console.print("\n")
-        console.print(table)
-        console.print(f"[dim]📝 STT Record #{len(self.stt_metrics_data)} saved[/dim]")
-        console.print("\n")
-        
-        # Auto-save every 3 records
-        if len(self.stt_metrics_data) % 3 == 0:
-            self.save_to_excel()
-    
-    def handle_eou_metrics(self, metrics: EOUMetrics) -> None:
-        # Store metrics data
-        metrics_dict = {
-            'timestamp': datetime.fromtimestamp(metrics.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
-            'type': str(metrics.type),
-            'end_of_utterance_delay_seconds': round(metrics.end_of_utterance_delay, 4),
-            'transcription_delay_seconds': round(metrics.transcription_delay, 4),
-            'on_user_turn_completed_delay_seconds': round(getattr(metrics, 'on_user_turn_completed_delay', 0), 4),
-            'speech_id': str(metrics.speech_id)
-        }
-        self.eou_metrics_data.append(metrics_dict)
-        
-        # Display table
-        table = Table(
-            title="[bold yellow]End of Utterance Metrics Report[/bold yellow]",
-            box=box.ROUNDED,
-            highlight=True,
-            show_header=True,
-            header_style="bold cyan"
-        )
+        # What this session ran with, so sessions can be compared later (agent/analytics.py)
+        self.sink.write_manifest({
+            "session_id": self.session_id,
+            "room": room,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "config_label": settings.METRICS_CONFIG_LABEL,
+            "models": {"stt": _model_name(self.stt), "llm": _model_name(self.llm), "tts": _model_name(self.tts)},
+            "settings": {
+                "stt_pool": settings.STT_POOL,
+                "llm_pool": settings.LLM_POOL,
+                "tts_pool": settings.TTS_POOL,
+                "llm_cache": settings.LLM_CACHE_ENABLED,
+                "speculative_llm": settings.SPECULATIVE_LLM_ENABLED,
+                "context_token_budget": settings.CONTEXT_TOKEN_BUDGET,
+                "job_executor": settings.AGENT_JOB_EXECUTOR,
+            },
+        })
         
-        table.add_column("Metric", style="bold green")
-        table.add_column("Value", style="yellow")
+        # Cache lookups and speculations go through the same writer as LLMMetrics
+        self.caching_llm = _find_wrapper(self.llm, CachingLLM)
+        self.speculative_llm = _find_wrapper(self.llm, SpeculativeLLM)
+        if self.caching_llm is not None:
+            self.caching_llm.on("cache_metrics", self.submit_metrics)
+        if self.speculative_llm is not None:
+            self.speculative_llm.on("speculation_metrics", self.submit_metrics)
         
-        table.add_row("Type", str(metrics.type))
-        table.add_row("Timestamp", metrics_dict['timestamp'])
-        table.add_row("End of Utterance Delay", f"[white]{metrics_dict['end_of_utterance_delay_seconds']}[/white]s")
-        table.add_row("Transcription Delay", f"[white]{metrics_dict['transcription_delay_seconds']}[/white]s")
-        table.add_row("Turn Completed Delay", f"[white]{metrics_dict['on_user_turn_completed_delay_seconds']}[/white]s")
-        table.add_row("Speech ID", str(metrics.speech_id))
+        # Which pool backend served each request (the router itself is process-wide)
+        self.routing = [model for model in (_find_wrapper(self.llm, RoutingLLM), self.tts)
+                        if isinstance(model, (RoutingLLM, RoutingTTS))]
+        for model in self.routing:
+            model.on("routing_metrics", self.submit_metrics)
         
-        console.print("\n")
-        console.print(table)
-        console.print(f"[dim]📝 EOU Record #{len(self.eou_metrics_data)} saved[/dim]")
-        console.print("\n")
+        # Set by create_session (agent/session.py) when LOOP_MONITOR_ENABLED
+        self.loop_monitor = None
         
-        # Auto-save every 3 records
-        if len(self.eou_metrics_data) % 3 == 0:
-            self.save_to_excel()
+        # Optional token budget on the chat history. Summaries get an LLM of
+        # their own: the session records LLMMetrics from self.llm, and summary
+        # usage is only counted in the ContextMetrics records
+        self.context = None
+        if settings.CONTEXT_TOKEN_BUDGET > 0:
+            self.context = ContextManager(
+                self,
+                # own router: summary requests must not skew the conversation pool's latency windows
+                summary_llm or build_llm(kind="summary"),
+                token_budget=settings.CONTEXT_TOKEN_BUDGET,
+                keep_turns=settings.CONTEXT_KEEP_TURNS,
+            )
+
+    def save_to_excel(self):
+        """Export all collected metrics to an Excel file with multiple sheets.
+
+        The workbook is built from the streaming segment files, so this is
+        only meant to run once at the end of a call (or on demand).
+        """
+        try:
+            sections = {
+                "Pipeline": [{"Metric": k, "Value": v} for k, v in self.writer.stats().items()],
+                "Startup": [{"Metric": k, "Value": v} for k, v in self.startup.items()],
+                "Critical_Path": self.turns.summary(),
+                "Percentiles": self.latency.rows(),
+                "LLM_Cache_Stats": [{"Metric": k, "Value": v} for k, v in RESPONSE_CACHE.stats().items()],
+                "Phrase_Cache": [{"Metric": f"session_{k}", "Value": v} for k, v in self.phrase_stats.items()]
+                + [{"Metric": f"cache_{k}", "Value": v} for k, v in PHRASE_CACHE.stats().items()],
+                "Routing": [{"kind": kind, "pool": spec, **row}
+                            for (kind, spec), router in ROUTERS.items() for row in router.rows()],
+                "Event_Loop": self.loop_monitor.rows(self) if self.loop_monitor is not None else [],
+            }
+            export_excel(self.sink, self.excel_filename, sections)
+            console.print(f"[bold green]📊 Excel report saved to: {self.excel_filename}[/bold green]")
+            
+        except Exception as e:
+            console.print(f"[red]❌ Error saving Excel file: {str(e)}[/red]")
+
+    def timed(self, name: str):
+        """Decorator timing an event handler with the loop monitor (a no-op without one)"""
+        if self.loop_monitor is None:
+            return lambda callback: callback
+        return self.loop_monitor.timed(name)
+
+    async def say_phrase(self, text: str, **kwargs):
+        """Speak a fixed phrase from the phrase cache (no LLM, no TTS request on a hit) and wait for its playout"""
+        audio, hit = await phrase_audio(self.tts, text)
+        self.phrase_stats["hits" if hit else "misses"] += 1
+        if EXPORTER.running:
+            EXPORTER.phrase_cache.inc(("hit" if hit else "miss",))
+        handle = self.session.say(text, audio=audio, **kwargs)
+        await handle
+        return handle
+
+    async def on_user_turn_completed(self, turn_ctx, new_message) -> None:
+        # Context size for this turn's LLM request
+        if self.context is not None:
+            self.submit_metrics(self.context.turn_metrics(turn_ctx, new_message))
+
+    def submit_metrics(self, metrics) -> bool:
+        """Hand a metrics event to the background writer (safe to call on the event loop)"""
+        return self.writer.submit(metrics)
+
+    def handle_metrics(self, metrics):
+        """Store a metrics event, then render it in the configured display mode (runs on the writer thread)"""
+        kind = METRIC_KINDS.get(type(metrics))
+        if kind is None:
+            if self.display_mode in ("log", "table"):
+                console.print(f"[dim]🔍 Unknown metrics type: {type(metrics)}[/dim]")
+            return
+        record = self._record(kind, metrics)
+        self.display.show(kind, metrics, record, self.store.count(kind))
+
+    def _record(self, kind: str, metrics) -> dict:
+        """Store the raw metric values; formatting happens at export time"""
+        row = extract_row(kind, metrics)
+        record = dict(zip(self.store.tables[kind].names, row))
+        self.store.append(kind, row)
+        self.sink.append(kind, record)
+        self.latency.add(kind, record, record["timestamp"])
+        if EXPORTER.running:
+            EXPORTER.observe(kind, record, self.room)
+        if self.trace is not None:
+            self.trace.add(kind, record)
+
+        turn = self.turns.add(kind, record)
+        if turn is not None:
+            self.latency.add("turn", turn, turn["timestamp"])
+            if EXPORTER.running:
+                EXPORTER.observe("turn", turn, self.room)
+            self.store.append("turn", tuple(turn[name] for name in self.store.tables["turn"].names))
+            self.sink.append("turn", turn)
+            self.display.show_turn(turn)
+        return record
 
     async def finalize_metrics(self):
-        """Final save when agent shuts down"""
+        """Final save when agent shuts down (runs once per session)"""
+        if self._finalized:
+            return
+        self._finalized = True
         console.print("[bold cyan]🔄 Finalizing metrics and saving to Excel...[/bold cyan]")
-        self.save_to_excel()
+        # Let the writer catch up, then export off the event loop
+        await asyncio.to_thread(self.writer.flush, 10.0)
+        # Sketch buckets are merged across sessions by `python -m agent.analytics percentiles`
+        await asyncio.to_thread(self.sink.write_latency, self.latency.to_dict())
+        await asyncio.to_thread(self.save_to_excel)
+        if self.trace is not None:
+            await asyncio.to_thread(self.trace.write, self.sink.directory / "trace.json")
         
         # Print final summary
-        total_records = (len(self.llm_metrics_data) + len(self.tts_metrics_data) + 
-                        len(self.stt_metrics_data) + len(self.eou_metrics_data))
+        total_records = (self.store.count('llm') + self.store.count('tts') + 
+                        self.store.count('stt') + self.store.count('eou'))
         
         console.print(f"[bold green]📊 Final Summary:[/bold green]")
-        console.print(f"  • LLM Metrics: {len(self.llm_metrics_data)} records")
-        console.print(f"  • TTS Metrics: {len(self.tts_metrics_data)} records")
-        console.print(f"  • STT Metrics: {len(self.stt_metrics_data)} records")
-        console.print(f"  • EOU Metrics: {len(self.eou_metrics_data)} records")
-        console.print(f"  • Total Records: {total_records}")
+        console.print(f"  • LLM Metrics: {self.store.count('llm')} records")
+        console.print(f"  • TTS Metrics: {self.store.count('tts')} records")
+        console.print(f"  • STT Metrics: {self.store.count('stt')} records")
+        console.print(f"  • EOU Metrics: {self.store.count('eou')} records")
+        console.print(f"  • Total Records: {total_records} ({self.store.nbytes / 1024:.1f} KiB in memory)")
+        # Feature lines come from the modules that own them
+        lines = self.turns.summary_lines() + self.latency.summary_lines() + self.writer.summary_lines()
+        if self.caching_llm is not None:
+            lines += cache_summary(self.store)
+        if self.speculative_llm is not None:
+            lines += speculation_summary(self.store)
+        if self.context is not None:
+            lines += self.context.summary_lines(self.store)
+        if self.routing:
+            lines += routing_summary(self.store)
+        if self.loop_monitor is not None:
+            lines += self.loop_monitor.summary_lines(self, self.store)
+        lines += load_summary(self.store, self.startup.get("processing_level", "full"))
+        if self.trace is not None:
+            lines += self.trace.summary_lines(self.sink.directory / "trace.json")
+        lines += phrase_summary(self.phrase_stats)
+        for line in lines:
+            console.print(line)
         console.print(f"[bold green]📁 Excel file: {self.excel_filename}[/bold green]")
         
         # Print diagnostic info if no STT/EOU metrics
-        if len(self.stt_metrics_data) == 0:
+        if self.store.count('stt') == 0:
             console.print("[yellow]ℹ️  No STT metrics: This is normal with some configurations[/yellow]")
-        if len(self.eou_metrics_data) == 0:
+        if self.store.count('eou') == 0:
             console.print("[yellow]ℹ️  No EOU metrics: Requires VAD-based turn detection[/yellow]")
 
+
+    async def aclose(self):
+        """Release everything this session holds so the worker can host the next call"""
+        if self.speculative_llm is not None:
+            # before the writer closes, so the wasted speculation is recorded
+            await self.speculative_llm.cancel()
+        if self.loop_monitor is not None:
+            self.loop_monitor.unsubscribe(self)
+        if self.context is not None:
+            await self.context.aclose()
+        await self.finalize_metrics()
+        await asyncio.to_thread(self.writer.close, 10.0)
+        self.sink.close()
+        self.display.close()
+        EXPORTER.untrack_session(self)
+        self.store.clear()
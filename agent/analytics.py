@@ -0,0 +1,472 @@
+"""
+Cross-session analytics over the metrics archive (METRICS_DIR).
+
+Every session leaves a directory of JSONL segments plus a `session.json`
+manifest (models, config label, settings). This module loads the latency
+fields of many sessions into one long pandas frame
+
+    session | day | config | model | metric | timestamp | value
+
+and answers two questions:
+
+  * how are latencies distributed per day, per model or per config label
+  * did a time range or config label get slower than a baseline
+
+`percentiles` answers the first one without reading any samples: it merges
+the latency sketch buckets each session leaves in `latency.json`
+(agent/sketch.py), so tail latency across thousands of calls costs one
+small file per call.
+
+    python -m agent.analytics summary --by day --since 2025-06-01
+    python -m agent.analytics summary --by model --metric llm.ttft
+    python -m agent.analytics percentiles --by config --metric turn.voice_to_voice
+    python -m agent.analytics compare --baseline 2025-06-01:2025-06-07 --candidate 2025-06-08:2025-06-14
+    python -m agent.analytics compare --baseline-config baseline --candidate-config gpt-4.1-trial --fail-on-regression
+
+Reading stays fast over months of calls: sessions outside --since/--until
+are skipped by their directory name, only the latency columns are read,
+and each session's columns are cached next to its segments in
+`columns.parquet`, with the segment signature it was built from in
+`columns.json` (rebuilt when the segments change; not cached without
+pyarrow). Sessions from before the JSONL archive are read once from their
+.xlsx workbook and cached the same way. Segments are parsed line by line: a
+line cut short by a crashed worker, or any other unreadable line, is
+skipped and reported on stderr rather than failing the whole archive.
+
+A metric regresses when its candidate p50 or p95 is worse than the
+baseline by more than --threshold percent and a one-sided Mann-Whitney U
+test on the raw samples agrees (p < --alpha).
+"""
+import argparse
+import json
+import math
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from agent import settings
+from agent.report import SHEETS
+from agent.sketch import LATENCY_FIELDS, QUANTILES, LatencySketch
+from agent.store import EXPORT_COLUMNS
+
+CACHE_NAME = "columns.parquet"
+CACHE_SIGNATURE_NAME = "columns.json"
+LATENCY_NAME = "latency.json"
+CACHE_VERSION = 2
+
+# Fields where a larger value is the better one
+HIGHER_IS_BETTER = {"llm.tokens_per_second", "llm_cache.ttft_saved", "speculation.head_start"}
+
+# Which model of the session manifest a metric type belongs to
+MODEL_OF_KIND = {"stt": "stt", "eou": "stt", "llm": "llm", "llm_cache": "llm", "speculation": "llm", "tts": "tts"}
+
+_SESSION_TIME = re.compile(r"agent_metrics_(\d{8}_\d{6})")
+
+COLUMNS = ["session", "day", "config", "model", "metric", "timestamp", "value"]
+
+
+def session_time(path: Path) -> Optional[datetime]:
+    """Start time encoded in a session directory or workbook name"""
+    match = _SESSION_TIME.search(path.name)
+    return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S") if match else None
+
+
+def find_sessions(root: Path, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Path]:
+    """Session directories (or legacy workbooks without one) started in [since, until)"""
+    sessions = []
+    for path in sorted(root.glob("agent_metrics_*")):
+        if path.suffix == ".xlsx" and path.with_suffix("").is_dir():
+            continue
+        if not path.is_dir() and path.suffix != ".xlsx":
+            continue
+        started = session_time(path)
+        if started is None:
+            continue
+        if (since and started < since) or (until and started >= until):
+            continue
+        sessions.append(path)
+    return sessions
+
+
+def _signature(path: Path) -> List[List[Any]]:
+    files = [path] if path.is_file() else sorted(path.glob("*.jsonl")) + sorted(path.glob("session.json"))
+    return [[p.name, p.stat().st_size, p.stat().st_mtime_ns] for p in files]
+
+
+def _read_jsonl(path: Path, fields: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    """`fields` of every readable record in one segment; bad lines are skipped and reported"""
+    records = []
+    bad = 0
+    with open(path, "r", encoding="utf-8", errors="replace") as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                bad += 1
+                continue
+            if isinstance(record, dict):
+                records.append({name: record[name] for name in fields if name in record})
+            else:
+                bad += 1
+    if bad:
+        print(f"{path}: skipped {bad} unreadable line(s)", file=sys.stderr)
+    return records
+
+
+def _read_segments(directory: Path) -> Dict[str, pd.DataFrame]:
+    frames = {}
+    for kind, fields in LATENCY_FIELDS.items():
+        wanted = ("timestamp",) + fields
+        records = [record for path in sorted(directory.glob(f"{kind}_*.jsonl")) for record in _read_jsonl(path, wanted)]
+        if not records:
+            continue
+        frame = pd.DataFrame.from_records(records)
+        frames[kind] = frame[[name for name in wanted if name in frame.columns]]
+    return frames
+
+
+def _read_workbook(path: Path) -> Dict[str, pd.DataFrame]:
+    """Raw-named latency columns from an exported workbook"""
+    frames = {}
+    sheets = pd.read_excel(path, sheet_name=None)
+    for kind, fields in LATENCY_FIELDS.items():
+        sheet = SHEETS.get(kind, (None,))[0]
+        if sheet not in sheets:
+            continue
+        frame = sheets[sheet]
+        raw_names = {column: name for name, (column, _) in EXPORT_COLUMNS.get(kind, {}).items()}
+        frame = frame.rename(columns=raw_names)
+        # the workbook has local wall-clock times
+        frame["timestamp"] = pd.to_datetime(frame["timestamp"]).map(lambda t: t.to_pydatetime().timestamp())
+        frames[kind] = frame[[name for name in ("timestamp",) + fields if name in frame.columns]]
+    return frames
+
+
+def _manifest(path: Path) -> Dict[str, Any]:
+    manifest_path = path / "session.json"
+    if path.is_dir() and manifest_path.exists():
+        return json.loads(manifest_path.read_text(encoding="utf-8"))
+    return {}
+
+
+def load_session(path: Path) -> pd.DataFrame:
+    """Long-format latency samples of one session, from its cache when current"""
+    cache_dir = path if path.is_dir() else path.parent / f".{path.stem}"
+    cache, cache_signature = cache_dir / CACHE_NAME, cache_dir / CACHE_SIGNATURE_NAME
+    signature = _signature(path)
+    if cache.exists() and cache_signature.exists():
+        try:
+            cached = json.loads(cache_signature.read_text(encoding="utf-8"))
+            if cached.get("version") == CACHE_VERSION and cached.get("signature") == signature:
+                return pd.read_parquet(cache)
+        except Exception:
+            pass
+
+    manifest = _manifest(path)
+    models = manifest.get("models", {})
+    frames = _read_segments(path) if path.is_dir() else _read_workbook(path)
+    parts = []
+    for kind, frame in frames.items():
+        long = frame.melt(id_vars="timestamp", var_name="field", value_name="value").dropna()
+        long["metric"] = kind + "." + long.pop("field")
+        long["model"] = models.get(MODEL_OF_KIND.get(kind), "+".join(models.values()) or "unknown")
+        parts.append(long)
+
+    if parts:
+        frame = pd.concat(parts, ignore_index=True)
+    else:
+        frame = pd.DataFrame({"timestamp": [], "metric": [], "model": [], "value": []})
+    frame["session"] = path.stem
+    frame["config"] = manifest.get("config_label") or ""
+    local = datetime.now().astimezone().tzinfo
+    frame["day"] = pd.to_datetime(frame["timestamp"], unit="s", utc=True).dt.tz_convert(local).dt.strftime("%Y-%m-%d")
+    frame = frame[COLUMNS].astype({"session": "category", "day": "category", "config": "category",
+                                   "model": "category", "metric": "category", "timestamp": "float64", "value": "float64"})
+
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        frame.to_parquet(cache, index=False)
+        # written last: a cache without a matching signature is rebuilt
+        cache_signature.write_text(json.dumps({"version": CACHE_VERSION, "signature": signature}), encoding="utf-8")
+    except ImportError:
+        # no parquet engine (pyarrow) installed: read the segments every time
+        pass
+    except OSError as e:
+        print(f"{cache}: not cached ({e})", file=sys.stderr)
+    return frame
+
+
+def load_sketches(path: Path) -> Dict[str, LatencySketch]:
+    """Whole-session latency sketches of one session directory ({} if it has none)"""
+    latency_path = path / LATENCY_NAME
+    if not path.is_dir() or not latency_path.exists():
+        return {}
+    try:
+        data = json.loads(latency_path.read_text(encoding="utf-8"))
+        return {metric: LatencySketch.from_dict(sketch) for metric, sketch in data.items()}
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Skipping unreadable {latency_path}: {e}", file=sys.stderr)
+        return {}
+
+
+def merged_percentiles(sessions: List[Path], by: List[str], metrics: Optional[List[str]] = None) -> pd.DataFrame:
+    """Sample count, p50/p95/p99, mean and max per group, from the merged sketches of `sessions`"""
+    groups: Dict[Tuple, LatencySketch] = {}
+    counts: Dict[Tuple, int] = {}
+    for path in sessions:
+        sketches = load_sketches(path)
+        if not sketches:
+            continue
+        manifest = _manifest(path)
+        models = manifest.get("models", {})
+        started = session_time(path)
+        for metric, sketch in sketches.items():
+            if metrics and metric not in metrics:
+                continue
+            kind = metric.split(".")[0]
+            values = {
+                "session": path.stem,
+                "day": started.strftime("%Y-%m-%d"),
+                "config": manifest.get("config_label") or "",
+                "model": models.get(MODEL_OF_KIND.get(kind), "+".join(models.values()) or "unknown"),
+            }
+            key = tuple(values[name] for name in by) + (metric,)
+            if key not in groups:
+                groups[key] = LatencySketch(sketch.relative_accuracy, sketch.min_value)
+            groups[key].merge(sketch)
+            counts[key] = counts.get(key, 0) + 1
+
+    rows = []
+    for key, sketch in sorted(groups.items()):
+        row: Dict[str, Any] = dict(zip(by + ["metric"], key))
+        row["count"] = sketch.count
+        for q in QUANTILES:
+            row[f"p{int(q * 100)}"] = round(sketch.quantile(q), 4)
+        row["mean"] = round(sketch.mean, 4)
+        row["max"] = round(sketch.max, 4)
+        row["sessions"] = counts[key]
+        rows.append(row)
+    return pd.DataFrame(rows, columns=by + ["metric", "count", "p50", "p95", "p99", "mean", "max", "sessions"])
+
+
+def load_archive(
+    root: Path,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    metrics: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    frames = [load_session(path) for path in find_sessions(root, since, until)]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    # categories differ per session; concatenate as strings, then re-categorize once
+    frame = pd.concat([f.astype({c: "object" for c in ("session", "day", "config", "model", "metric")}) for f in frames],
+                      ignore_index=True)
+    if metrics:
+        frame = frame[frame["metric"].isin(metrics)]
+    return frame.astype({c: "category" for c in ("session", "day", "config", "model", "metric")})
+
+
+def distribution(frame: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+    """Sample count, p50/p95/p99 and mean of every metric per group"""
+    grouped = frame.groupby(by + ["metric"], observed=True)["value"]
+    table = grouped.quantile([0.5, 0.95, 0.99]).unstack()
+    table.columns = ["p50", "p95", "p99"]
+    table.insert(0, "count", grouped.size())
+    table["mean"] = grouped.mean()
+    table["sessions"] = frame.groupby(by + ["metric"], observed=True)["session"].nunique()
+    return table.round(4).reset_index()
+
+
+def mann_whitney_p(baseline: pd.Series, candidate: pd.Series) -> float:
+    """One-sided p-value that `candidate` tends to be larger (normal approximation)"""
+    n1, n2 = len(baseline), len(candidate)
+    ranks = pd.concat([baseline, candidate], ignore_index=True).rank()
+    u = ranks.iloc[n1:].sum() - n2 * (n2 + 1) / 2
+    sigma = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(
+    baseline: pd.DataFrame,
+    candidate: pd.DataFrame,
+    *,
+    threshold: float = 10.0,
+    alpha: float = 0.01,
+    min_samples: int = 20,
+) -> pd.DataFrame:
+    """Per-metric baseline vs candidate p50/p95 with a regression verdict"""
+    rows = []
+    for metric in sorted(set(baseline["metric"].astype(str)) | set(candidate["metric"].astype(str))):
+        a = baseline.loc[baseline["metric"] == metric, "value"]
+        b = candidate.loc[candidate["metric"] == metric, "value"]
+        row: Dict[str, Any] = {"metric": metric, "baseline_n": len(a), "candidate_n": len(b)}
+        if len(a) < min_samples or len(b) < min_samples:
+            rows.append({**row, "verdict": "too few samples"})
+            continue
+
+        # +1 when a larger value is worse
+        sign = -1 if metric in HIGHER_IS_BETTER else 1
+        worse = better = False
+        for q in (0.5, 0.95):
+            name = f"p{int(q * 100)}"
+            base, cand = a.quantile(q), b.quantile(q)
+            change = (cand - base) / base * 100 if base else 0.0
+            row[f"baseline_{name}"] = round(base, 4)
+            row[f"candidate_{name}"] = round(cand, 4)
+            row[f"{name}_change_pct"] = round(change, 1)
+            worse |= sign * change > threshold
+            better |= sign * change < -threshold
+        p_worse = mann_whitney_p(a, b) if sign > 0 else mann_whitney_p(b, a)
+        p_better = mann_whitney_p(b, a) if sign > 0 else mann_whitney_p(a, b)
+        row["p_value"] = round(min(p_worse, p_better), 5)
+        if worse and p_worse < alpha:
+            row["verdict"] = "REGRESSION"
+        elif better and p_better < alpha:
+            row["verdict"] = "improved"
+        else:
+            row["verdict"] = "ok"
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# -- command line -------------------------------------------------------------
+
+
+def _date(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def _range(value: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """`2025-06-01:2025-06-08` (end exclusive); either side may be empty"""
+    start, _, end = value.partition(":")
+    return (_date(start) if start else None, _date(end) if end else None)
+
+
+def _select(frame: pd.DataFrame, time_range: Optional[str], config: Optional[str]) -> pd.DataFrame:
+    if time_range:
+        start, end = _range(time_range)
+        stamps = frame["timestamp"]
+        if start:
+            frame = frame[stamps >= start.timestamp()]
+            stamps = frame["timestamp"]
+        if end:
+            frame = frame[stamps < end.timestamp()]
+    if config is not None:
+        frame = frame[frame["config"] == config]
+    return frame
+
+
+def compact(result: pd.DataFrame) -> pd.DataFrame:
+    """One short line per metric: `baseline -> candidate (change)` for p50 and p95"""
+    rows = []
+    for row in result.to_dict("records"):
+        out = {"metric": row["metric"], "n": f"{row['baseline_n']} / {row['candidate_n']}"}
+        for name in ("p50", "p95"):
+            if f"baseline_{name}" in row and not pd.isna(row.get(f"baseline_{name}")):
+                out[name] = (f"{row[f'baseline_{name}']:.3f} -> {row[f'candidate_{name}']:.3f} "
+                             f"({row[f'{name}_change_pct']:+.0f}%)")
+            else:
+                out[name] = ""
+        p_value = row.get("p_value", float("nan"))
+        out["p"] = "" if pd.isna(p_value) else ("<1e-05" if p_value == 0 else f"{p_value:.3g}")
+        out["verdict"] = row["verdict"]
+        rows.append(out)
+    return pd.DataFrame(rows)
+
+
+def print_table(frame: pd.DataFrame, title: str) -> None:
+    from rich import box
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title=f"[bold cyan]{title}[/bold cyan]", box=box.ROUNDED, header_style="bold cyan")
+    for column in frame.columns:
+        table.add_column(str(column))
+    for record in frame.itertuples(index=False):
+        cells = []
+        for value in record:
+            if value == "REGRESSION":
+                value = "[bold red]REGRESSION[/bold red]"
+            cells.append("" if value is None or (isinstance(value, float) and math.isnan(value)) else str(value))
+        table.add_row(*cells)
+    Console().print(table)
+
+
+def main() -> int:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--dir", type=Path, default=settings.METRICS_DIR, help="metrics archive (METRICS_DIR)")
+    common.add_argument("--since", type=_date, help="first session start to include (YYYY-MM-DD[THH:MM])")
+    common.add_argument("--until", type=_date, help="sessions started before this")
+    common.add_argument("--metric", action="append", help="only this metric, e.g. llm.ttft (repeatable)")
+    common.add_argument("--json", help="write the result table to this JSON file")
+
+    parser = argparse.ArgumentParser(description="Latency distributions and regressions across archived sessions")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summary = commands.add_parser("summary", parents=[common], help="latency distribution per group")
+    summary.add_argument("--by", action="append", choices=("day", "model", "config", "session"),
+                         help="grouping (repeatable; default: day)")
+
+    percentiles = commands.add_parser("percentiles", parents=[common],
+                                      help="p50/p95/p99 per group from the merged per-session sketches")
+    percentiles.add_argument("--by", action="append", choices=("day", "model", "config", "session"),
+                             help="grouping (repeatable; default: none, one row per metric)")
+
+    comparison = commands.add_parser("compare", parents=[common], help="candidate vs baseline regression check")
+    comparison.add_argument("--baseline", help="time range START:END of the baseline")
+    comparison.add_argument("--candidate", help="time range START:END of the candidate")
+    comparison.add_argument("--baseline-config", help="config label (METRICS_CONFIG_LABEL) of the baseline")
+    comparison.add_argument("--candidate-config", help="config label of the candidate")
+    comparison.add_argument("--threshold", type=float, default=10.0, help="percent p50/p95 change that counts")
+    comparison.add_argument("--alpha", type=float, default=0.01, help="significance level")
+    comparison.add_argument("--min-samples", type=int, default=20)
+    comparison.add_argument("--fail-on-regression", action="store_true", help="exit 1 if any metric regressed")
+    args = parser.parse_args()
+
+    if args.command == "percentiles":
+        sessions = find_sessions(args.dir, args.since, args.until)
+        result = merged_percentiles(sessions, args.by or [], args.metric)
+        if result.empty:
+            print(f"No latency sketches found in {args.dir}")
+            return 0
+        print_table(result, f"Merged latency sketches ({len(sessions)} sessions)")
+        if args.json:
+            Path(args.json).write_text(result.to_json(orient="records", indent=2))
+        return 0
+
+    frame = load_archive(args.dir, args.since, args.until, args.metric)
+    if frame.empty:
+        print(f"No metrics found in {args.dir}")
+        return 0
+    sessions = frame["session"].nunique()
+    if args.command == "summary":
+        by = args.by or ["day"]
+        result = distribution(frame, by)
+        print_table(result, f"Latency by {', '.join(by)} ({sessions} sessions, {len(frame)} samples)")
+    else:
+        baseline = _select(frame, args.baseline, args.baseline_config)
+        candidate = _select(frame, args.candidate, args.candidate_config)
+        result = compare(baseline, candidate, threshold=args.threshold, alpha=args.alpha, min_samples=args.min_samples)
+        print_table(compact(result), (
+            f"Candidate ({candidate['session'].nunique()} sessions) vs "
+            f"baseline ({baseline['session'].nunique()} sessions)"
+        ))
+
+    if args.json:
+        Path(args.json).write_text(result.to_json(orient="records", indent=2))
+    if args.command == "compare" and args.fail_on_regression and "verdict" in result:
+        return 1 if (result["verdict"] == "REGRESSION").any() else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Bounded chat context with an incremental, rolling summary.
+
+Without a bound, every turn re-sends the whole conversation, so
+`prompt_tokens` (and with it TTFT and cost) grows for the whole call.
+`ContextManager` keeps the agent's chat history under a token budget:
+
+  * the instructions and the last `keep_turns` exchanges stay verbatim
+  * older messages are folded into one summary message, which is itself
+    re-summarized together with the next batch of old messages
+
+Compaction runs between turns (when the agent goes back to listening), never
+in front of an LLM request. Messages that arrive while a summary is being
+written are kept: only the summarized messages are removed from the context
+that is current when the summary is applied.
+
+Token counts are estimated from text length (about 4 characters per token),
+which is enough to enforce a budget and report the savings. Each user turn
+produces a `ContextMetrics` record with the context size, the size the
+unbounded history would have had, and the difference (tokens saved).
+
+The summarizer must be an LLM instance of its own that the session never
+subscribes to, so summary requests do not show up as conversational
+LLMMetrics. Their tokens are counted here instead (`summary_prompt_tokens`,
+`summary_completion_tokens`), and the manager closes the summarizer with the
+session.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from livekit.agents import llm
+
+logger = logging.getLogger("context-manager")
+
+SUMMARY_ID = "conversation_summary"
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a phone conversation between a user and an AI assistant. "
+    "Merge the existing summary with the new messages into one concise summary. Keep names, numbers, "
+    "dates, requests and anything the assistant promised. Reply with the summary only."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English
+    return max(1, len(text) // 4)
+
+
+def _is_message(item) -> bool:
+    return getattr(item, "type", None) == "message"
+
+
+def context_tokens(chat_ctx: llm.ChatContext) -> int:
+    return sum(estimate_tokens(item.text_content or "") for item in chat_ctx.items if _is_message(item))
+
+
+@dataclass
+class ContextMetrics:
+    """Context size for one user turn"""
+
+    context_tokens: int
+    full_tokens: int
+    tokens_saved: int
+    messages: int
+    summarized_messages: int
+    compactions: int
+    summary_seconds: float
+    # spent on summary requests so far this session
+    summary_prompt_tokens: int = 0
+    summary_completion_tokens: int = 0
+    speech_id: str = ""
+    timestamp: float = field(default_factory=time.time)
+    type: str = "context_metrics"
+
+
+class ContextManager:
+    def __init__(self, agent, summarizer: llm.LLM, *, token_budget: int = 2000, keep_turns: int = 4) -> None:
+        self.agent = agent
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+
+        self.summary = ""
+        self.summarized_messages = 0
+        self.compactions = 0
+        self.summary_seconds = 0.0
+        self.summary_prompt_tokens = 0
+        self.summary_completion_tokens = 0
+        # estimated tokens folded out of the context, less the summary that replaced them
+        self._removed_tokens = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def turn_metrics(self, chat_ctx: llm.ChatContext, new_message: Optional[llm.ChatMessage] = None) -> ContextMetrics:
+        """Measure the context an LLM request is about to be made with.
+
+        In `on_user_turn_completed` the turn's context does not hold the
+        user's new message yet; pass it as `new_message` so it is counted.
+        """
+        tokens = context_tokens(chat_ctx)
+        messages = sum(1 for item in chat_ctx.items if _is_message(item))
+        if new_message is not None:
+            tokens += estimate_tokens(new_message.text_content or "")
+            messages += 1
+        full = tokens + self._removed_tokens
+        return ContextMetrics(
+            context_tokens=tokens,
+            full_tokens=full,
+            tokens_saved=full - tokens,
+            messages=messages,
+            summarized_messages=self.summarized_messages,
+            compactions=self.compactions,
+            summary_seconds=round(self.summary_seconds, 4),
+            summary_prompt_tokens=self.summary_prompt_tokens,
+            summary_completion_tokens=self.summary_completion_tokens,
+        )
+
+    def summary_lines(self, store) -> List[str]:
+        """Final-summary line, from this session's context records (agent/store.py)"""
+        if not store.count("context"):
+            return []
+        saved = sum(sum(view) for view in store.column_views("context", "tokens_saved"))
+        return [
+            f"  • Context: {self.compactions} compactions, {self.summarized_messages} messages summarized, "
+            f"~{saved} prompt tokens saved over {store.count('context')} turns, "
+            f"{self.summary_prompt_tokens + self.summary_completion_tokens} tokens spent on summaries"
+        ]
+
+    def schedule(self) -> None:
+        """Compact in the background if the context is over budget (call between turns)"""
+        if self._task is not None and not self._task.done():
+            return
+        if context_tokens(self.agent.chat_ctx) <= self.token_budget:
+            return
+        self._task = asyncio.create_task(self._compact())
+
+    async def _compact(self) -> None:
+        start = time.perf_counter()
+        items = list(self.agent.chat_ctx.items)
+        dialogue = [item for item in items if _is_message(item) and item.role in ("user", "assistant")]
+        old = dialogue[: max(0, len(dialogue) - 2 * self.keep_turns)]
+        if not old:
+            return
+        # tool calls made before the verbatim window go with the old messages
+        cutoff = items.index(old[-1])
+        folded = [item for item in items[: cutoff + 1] if getattr(item, "id", None) != SUMMARY_ID
+                  and (not _is_message(item) or item.role in ("user", "assistant"))]
+
+        transcript = "\n".join(f"{item.role}: {item.text_content}" for item in old)
+        try:
+            summary = await self._summarize(transcript)
+        except Exception:
+            logger.exception("could not summarize the conversation, keeping the full context")
+            return
+        if not summary:
+            return
+
+        folded_ids = {item.id for item in folded}
+        current = [item for item in self.agent.chat_ctx.items
+                   if item.id not in folded_ids and getattr(item, "id", None) != SUMMARY_ID]
+        summary_ctx = llm.ChatContext.empty()
+        summary_ctx.add_message(role="system", id=SUMMARY_ID, content=f"Summary of the earlier conversation: {summary}")
+        # the summary goes right after the instructions
+        position = 0
+        while position < len(current) and _is_message(current[position]) and current[position].role in ("system", "developer"):
+            position += 1
+        current[position:position] = summary_ctx.items
+        await self.agent.update_chat_ctx(llm.ChatContext(current))
+
+        previous_summary = estimate_tokens(self.summary) if self.summary else 0
+        self._removed_tokens += (
+            sum(estimate_tokens(item.text_content or "") for item in old)
+            + previous_summary
+            - estimate_tokens(summary)
+        )
+        self.summary = summary
+        self.summarized_messages += len(old)
+        self.compactions += 1
+        self.summary_seconds = time.perf_counter() - start
+
+    async def _summarize(self, transcript: str) -> str:
+        chat_ctx = llm.ChatContext.empty()
+        chat_ctx.add_message(role="system", content=SUMMARY_PROMPT)
+        chat_ctx.add_message(
+            role="user",
+            content=f"Existing summary:\n{self.summary or '(none)'}\n\nNew messages:\n{transcript}",
+        )
+        parts = []
+        usage = None
+        try:
+            async with self.summarizer.chat(chat_ctx=chat_ctx) as stream:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.delta is not None and chunk.delta.content:
+                        parts.append(chunk.delta.content)
+        finally:
+            if usage is not None:
+                self.summary_prompt_tokens += usage.prompt_tokens
+                self.summary_completion_tokens += usage.completion_tokens
+            else:
+                self.summary_prompt_tokens += context_tokens(chat_ctx)
+                self.summary_completion_tokens += estimate_tokens("".join(parts)) if parts else 0
+        return "".join(parts).strip()
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.summarizer.aclose()
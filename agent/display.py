@@ -0,0 +1,427 @@
+"""
+Console display modes for collected metrics.
+
+Selected with METRICS_DISPLAY:
+
+    live   a single `rich.live.Live` panel, refreshed at a fixed rate, with
+           rolling aggregates per session. With the process executor each
+           call is its own process, so job processes forward their records
+           to the worker's main process, which renders the one panel
+           (`RelayDisplay`, `WorkerDashboard`)
+    log    one compact structured log line per metric event
+    table  the original full Rich table per metric event (default)
+    off    nothing is rendered
+
+Everything here runs on the metrics writer thread (the live panel's rows on
+the Live refresh thread), never on the event loop.
+Rich tables and the live panel are only imported and built when their mode
+is enabled.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from rich.console import Console
+
+from agent.exporter import EXPORTER
+from agent.sketch import LatencyStats
+
+console = Console()
+logger = logging.getLogger("metrics")
+
+DISPLAY_MODES = ("live", "log", "table", "off")
+
+# Record fields left out of log lines; a sampled stack is only flagged (the
+# watchdog already logged it, and the Event_Loop_Stalls sheet keeps it)
+LOG_OMITTED = ("timestamp", "type", "stack")
+
+
+def _format_timestamp(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class NullDisplay:
+    """METRICS_DISPLAY=off"""
+
+    def __init__(self, session: str, latency: LatencyStats) -> None:
+        self.session = session
+        self.latency = latency
+
+    def show(self, kind: str, metrics: Any, record: Dict[str, Any], count: int) -> None:
+        pass
+
+    def show_turn(self, turn: Dict[str, Any]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class LogDisplay(NullDisplay):
+    """One structured line per event: `llm session=... ttft=0.412 ...`"""
+
+    def show(self, kind: str, metrics: Any, record: Dict[str, Any], count: int) -> None:
+        fields = " ".join(
+            f"{name}={round(value, 4) if isinstance(value, float) else value}"
+            for name, value in record.items()
+            if name not in LOG_OMITTED and value != ""
+        )
+        if record.get("stack"):
+            fields += " stack=sampled"
+        logger.info(f"{kind} session={self.session} n={count} {fields}", extra={"metrics": record})
+
+    def show_turn(self, turn: Dict[str, Any]) -> None:
+        logger.info(
+            f"turn session={self.session} speech_id={turn['speech_id']} "
+            f"v2v={turn['voice_to_voice']:.4f} eou={turn['end_of_utterance']:.4f} "
+            f"llm_ttft={turn['llm_ttft']:.4f} tts_ttfb={turn['tts_ttfb']:.4f} "
+            f"critical={turn['critical_stage']}",
+            extra={"metrics": turn},
+        )
+
+
+class TableDisplay(NullDisplay):
+    """The original per-event Rich tables"""
+
+    def show(self, kind: str, metrics: Any, record: Dict[str, Any], count: int) -> None:
+        from rich.table import Table
+        from rich import box
+
+        title, rows = getattr(self, f"_{kind}_rows")(metrics)
+        table = Table(
+            title=title,
+            box=box.ROUNDED,
+            highlight=True,
+            show_header=True,
+            header_style="bold cyan"
+        )
+
+        table.add_column("Metric", style="bold green")
+        table.add_column("Value", style="yellow")
+        for name, value in rows:
+            table.add_row(name, value)
+
+        console.print("\n")
+        console.print(table)
+        console.print(f"[dim]📝 {kind.upper()} Record #{count} saved[/dim]")
+        console.print("\n")
+
+    def show_turn(self, turn: Dict[str, Any]) -> None:
+        console.print(
+            f"[bold magenta]🔁 Turn {turn['speech_id']}: voice-to-voice "
+            f"{turn['voice_to_voice']:.3f}s (EOU {turn['end_of_utterance']:.3f}s + "
+            f"LLM TTFT {turn['llm_ttft']:.3f}s + TTS TTFB {turn['tts_ttfb']:.3f}s)[/bold magenta]"
+        )
+
+    def _llm_rows(self, metrics):
+        return "[bold red]LLM Metrics Report[/bold red]", [
+            ("Type", str(metrics.type)),
+            ("Label", str(metrics.label)),
+            ("Request ID", str(metrics.request_id)),
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("Duration", f"[white]{round(metrics.duration, 4)}[/white]s"),
+            ("Time to First Token", f"[white]{round(metrics.ttft, 4)}[/white]s"),
+            ("Cancelled", "✓" if metrics.cancelled else "✗"),
+            ("Completion Tokens", str(metrics.completion_tokens)),
+            ("Prompt Tokens", str(metrics.prompt_tokens)),
+            ("Total Tokens", str(metrics.total_tokens)),
+            ("Tokens/Second", str(round(metrics.tokens_per_second, 2))),
+            ("Speech ID", str(getattr(metrics, 'speech_id', None) or 'N/A')),
+        ]
+
+    def _tts_rows(self, metrics):
+        return "[bold blue]TTS Metrics Report[/bold blue]", [
+            ("Type", str(metrics.type)),
+            ("Label", str(metrics.label)),
+            ("Request ID", str(metrics.request_id)),
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("TTFB", f"[white]{round(metrics.ttfb, 4)}[/white]s"),
+            ("Duration", f"[white]{round(metrics.duration, 4)}[/white]s"),
+            ("Audio Duration", f"[white]{round(metrics.audio_duration, 4)}[/white]s"),
+            ("Cancelled", "✓" if metrics.cancelled else "✗"),
+            ("Characters Count", str(metrics.characters_count)),
+            ("Streamed", "✓" if metrics.streamed else "✗"),
+            ("Speech ID", str(getattr(metrics, 'speech_id', None) or 'N/A')),
+        ]
+
+    def _stt_rows(self, metrics):
+        return "[bold green]STT Metrics Report[/bold green]", [
+            ("Type", str(metrics.type)),
+            ("Label", str(metrics.label)),
+            ("Request ID", str(metrics.request_id)),
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("Duration", f"[white]{round(metrics.duration, 4)}[/white]s"),
+            ("Audio Duration", f"[white]{round(metrics.audio_duration, 4)}[/white]s"),
+            ("Streamed", "✓" if metrics.streamed else "✗"),
+            ("Speech ID", str(getattr(metrics, 'speech_id', None) or 'N/A')),
+            ("Error", str(getattr(metrics, 'error', None))),
+        ]
+
+    def _llm_cache_rows(self, metrics):
+        return "[bold green]LLM Cache Report[/bold green]", [
+            ("Label", str(metrics.label)),
+            ("Request ID", str(metrics.request_id)),
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("Hit", "✓" if metrics.hit else "✗"),
+            ("Time to First Token", f"[white]{round(metrics.ttft, 4)}[/white]s"),
+            ("TTFT Saved", f"[white]{round(metrics.ttft_saved, 4)}[/white]s"),
+            ("Completion Tokens Saved", str(metrics.completion_tokens_saved)),
+            ("Prompt Tokens Saved", str(metrics.prompt_tokens_saved)),
+        ]
+
+    def _speculation_rows(self, metrics):
+        return "[bold green]Speculative LLM Report[/bold green]", [
+            ("Label", str(metrics.label)),
+            ("Request ID", str(metrics.request_id or 'N/A')),
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("Trigger", str(metrics.trigger)),
+            ("Hit", "✓" if metrics.hit else "✗"),
+            ("Head Start", f"[white]{round(metrics.head_start, 4)}[/white]s"),
+            ("Time to First Token", f"[white]{round(metrics.ttft, 4)}[/white]s"),
+            ("Wasted Prompt Tokens", str(metrics.wasted_prompt_tokens)),
+            ("Wasted Completion Tokens", str(metrics.wasted_completion_tokens)),
+        ]
+
+    def _context_rows(self, metrics):
+        return "[bold cyan]Chat Context Report[/bold cyan]", [
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("Context Tokens", str(metrics.context_tokens)),
+            ("Full History Tokens", str(metrics.full_tokens)),
+            ("Tokens Saved", str(metrics.tokens_saved)),
+            ("Messages", str(metrics.messages)),
+            ("Summarized Messages", str(metrics.summarized_messages)),
+            ("Compactions", str(metrics.compactions)),
+            ("Summary Prompt Tokens", str(metrics.summary_prompt_tokens)),
+            ("Summary Completion Tokens", str(metrics.summary_completion_tokens)),
+        ]
+
+    def _routing_rows(self, metrics):
+        return "[bold blue]Provider Routing Report[/bold blue]", [
+            ("Label", str(metrics.label)),
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("Kind", str(metrics.kind)),
+            ("Backend", str(metrics.backend)),
+            ("Time to First Chunk", f"[white]{round(metrics.ttft, 4)}[/white]s"),
+            ("Hedged", "✓" if metrics.hedged else "✗"),
+            ("Failovers", str(metrics.failovers)),
+        ]
+
+    def _loop_rows(self, metrics):
+        return "[bold red]Event Loop Stall Report[/bold red]", [
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("Source", str(metrics.source)),
+            ("Callback", str(metrics.name or 'N/A')),
+            ("Duration", f"[white]{round(metrics.duration, 4)}[/white]s"),
+            ("Speech ID", str(metrics.speech_id or 'N/A')),
+            ("Stack Sampled", "✓" if metrics.stack else "✗"),
+        ]
+
+    def _load_rows(self, metrics):
+        return "[bold yellow]Load Report[/bold yellow]", [
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("Processing Level", str(metrics.level)),
+            ("Sessions In Process", str(metrics.sessions)),
+            ("Process CPU", f"[white]{round(metrics.process_cpu, 3)}[/white] cores"),
+            ("Real-Time Factor", f"[white]{round(metrics.session_cpu, 3)}[/white]"),
+            ("System CPU", f"[white]{round(metrics.system_cpu * 100, 1)}[/white]%"),
+            ("Loop Lag p99", f"[white]{round(metrics.loop_lag_p99 * 1000, 1)}[/white]ms"),
+        ]
+
+    def _eou_rows(self, metrics):
+        return "[bold yellow]End of Utterance Metrics Report[/bold yellow]", [
+            ("Type", str(metrics.type)),
+            ("Timestamp", _format_timestamp(metrics.timestamp)),
+            ("End of Utterance Delay", f"[white]{round(metrics.end_of_utterance_delay, 4)}[/white]s"),
+            ("Transcription Delay", f"[white]{round(metrics.transcription_delay, 4)}[/white]s"),
+            ("Turn Completed Delay", f"[white]{round(getattr(metrics, 'on_user_turn_completed_delay', 0), 4)}[/white]s"),
+            ("Speech ID", str(metrics.speech_id)),
+        ]
+
+
+class RelayDisplay(NullDisplay):
+    """METRICS_DISPLAY=live in a job process: records go to the worker's panel"""
+
+    def show(self, kind: str, metrics: Any, record: Dict[str, Any], count: int) -> None:
+        EXPORTER.forward_record(kind, {name: value for name, value in record.items() if name != "stack"}, self.session)
+
+    def show_turn(self, turn: Dict[str, Any]) -> None:
+        EXPORTER.forward_record("turn", turn, self.session)
+
+    def close(self) -> None:
+        EXPORTER.forward_record("closed", {}, self.session)
+
+
+class LiveDashboard:
+    """Process-wide `rich.live.Live` panel with one row per active session.
+
+    Rich allows a single live display per console, so concurrent sessions
+    share this panel. Rows are built by the Live refresh thread itself from
+    each session's counters and latency sketches, so the latest event shows
+    up on the next refresh and the 1m windows age out while a call is idle.
+    """
+
+    def __init__(self, refresh_per_second: float) -> None:
+        self.refresh_per_second = refresh_per_second
+        # reentrant: Live renders once from register() while the lock is held
+        self._lock = threading.RLock()
+        self._sessions: Dict[str, "LiveDisplay"] = {}
+        self._live = None
+
+    def register(self, display: "LiveDisplay") -> None:
+        with self._lock:
+            self._sessions[display.session] = display
+            if self._live is None:
+                from rich.live import Live
+
+                self._live = Live(
+                    get_renderable=self._render,
+                    console=console,
+                    refresh_per_second=self.refresh_per_second,
+                    transient=False,
+                )
+                self._live.start()
+
+    def unregister(self, session: str) -> None:
+        live = None
+        with self._lock:
+            self._sessions.pop(session, None)
+            if not self._sessions:
+                live, self._live = self._live, None
+        # stop() joins the refresh thread, which takes the lock in _render
+        if live is not None:
+            live.stop()
+
+    def _render(self):
+        from rich.table import Table
+        from rich import box
+
+        table = Table(
+            title="[bold cyan]Live Agent Metrics (last 1m p50 / p95)[/bold cyan]",
+            box=box.ROUNDED,
+            header_style="bold cyan",
+        )
+        for column in ("Session", "LLM", "TTS", "STT", "EOU", "LLM TTFT", "TTS TTFB", "EOU delay", "Voice-to-voice", "Last turn"):
+            table.add_column(column)
+
+        with self._lock:
+            displays = list(self._sessions.values())
+        for display in displays:
+            snap = display.snapshot()
+            counts = snap["counts"]
+            table.add_row(
+                display.session,
+                *(str(counts.get(kind, 0)) for kind in ("llm", "tts", "stt", "eou")),
+                *(snap.get(key, "-") for key in ("llm.ttft", "tts.ttfb", "eou.end_of_utterance_delay", "turn.voice_to_voice")),
+                snap["last_turn"],
+            )
+        return table
+
+
+_dashboard: Optional[LiveDashboard] = None
+_dashboard_lock = threading.Lock()
+
+
+def _get_dashboard(refresh_per_second: float) -> LiveDashboard:
+    global _dashboard
+    with _dashboard_lock:
+        if _dashboard is None:
+            _dashboard = LiveDashboard(refresh_per_second)
+        return _dashboard
+
+
+class LiveDisplay(NullDisplay):
+    """Feeds this session's rolling aggregates into the shared live panel"""
+
+    def __init__(self, session: str, latency: LatencyStats, refresh_per_second: float = 2.0) -> None:
+        super().__init__(session, latency)
+        self._counts: Dict[str, int] = {}
+        self._last_turn = "-"
+        self._dashboard = _get_dashboard(refresh_per_second)
+        self._dashboard.register(self)
+
+    def show(self, kind: str, metrics: Any, record: Dict[str, Any], count: int) -> None:
+        self._counts[kind] = count
+
+    def show_turn(self, turn: Dict[str, Any]) -> None:
+        self._last_turn = f"{turn['voice_to_voice']:.3f}s ({turn['critical_stage']})"
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Counters and last-minute p50/p95 per field; called from the Live refresh thread"""
+        snapshot: Dict[str, Any] = {"counts": dict(self._counts), "last_turn": self._last_turn}
+        for metric, sketch in self.latency.window(60.0, now).items():
+            snapshot[metric] = f"{sketch.quantile(0.5):.3f} / {sketch.quantile(0.95):.3f}"
+        return snapshot
+
+    def close(self) -> None:
+        self._dashboard.unregister(self.session)
+
+
+class WorkerDashboard:
+    """Live panel in the worker's main process, fed by `RelayDisplay` in job processes.
+
+    Each forwarded session gets a `LiveDisplay` with its own counters and
+    sketches here, so the panel looks the same as with the thread executor.
+    Records arrive on the exporter's per-job receive threads.
+    """
+
+    def __init__(self, refresh_per_second: float = 2.0, slot_seconds: float = 15.0) -> None:
+        self.refresh_per_second = refresh_per_second
+        self.slot_seconds = slot_seconds
+        self._lock = threading.Lock()
+        self._displays: Dict[str, LiveDisplay] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, record: Dict[str, Any], session: str) -> None:
+        try:
+            if kind == "closed":
+                with self._lock:
+                    display = self._displays.pop(session, None)
+                    self._counts.pop(session, None)
+                if display is not None:
+                    display.close()
+                return
+            with self._lock:
+                display = self._displays.get(session)
+                if display is None:
+                    display = self._displays[session] = LiveDisplay(
+                        session, LatencyStats(slot_seconds=self.slot_seconds), self.refresh_per_second
+                    )
+                    self._counts[session] = {}
+                counts = self._counts[session]
+                counts[kind] = counts.get(kind, 0) + 1
+            display.latency.add(kind, record, record.get("timestamp"))
+            if kind == "turn":
+                display.show_turn(record)
+            else:
+                display.show(kind, None, record, counts[kind])
+        except Exception:
+            logger.exception(f"error showing a forwarded {kind} record")
+
+
+def make_display(
+    mode: str,
+    session: str,
+    latency: LatencyStats,
+    refresh_per_second: float = 2.0,
+    job_executor: str = "thread",
+) -> NullDisplay:
+    if mode not in DISPLAY_MODES:
+        raise ValueError(f"unknown display mode {mode!r}, expected one of {DISPLAY_MODES}")
+    if mode == "live" and job_executor == "process":
+        # Every call would open its own Live panel on the shared terminal and
+        # the panels would overwrite each other; the worker renders the one panel.
+        if EXPORTER.forwarding:
+            return RelayDisplay(session, latency)
+        console.print(
+            "[bold yellow]⚠️  METRICS_DISPLAY=live: worker panel not reachable from this job process, "
+            "using log lines (run entry.py, or set AGENT_JOB_EXECUTOR=thread)[/bold yellow]"
+        )
+        mode = "log"
+    if mode == "live":
+        return LiveDisplay(session, latency, refresh_per_second)
+    if mode == "log":
+        return LogDisplay(session, latency)
+    if mode == "table":
+        return TableDisplay(session, latency)
+    return NullDisplay(session, latency)
@@ -0,0 +1,504 @@
+"""
+Prometheus/OpenMetrics exporter for agent metrics.
+
+A small HTTP endpoint in the worker's main process, using only the standard
+library, serves the text exposition format on /metrics:
+
+    METRICS_EXPORTER_PORT=9464 python entry.py dev
+    curl -s localhost:9464/metrics
+
+Counters and histograms are built from LLM/TTS/STT/EOU metrics (and the
+correlated turns), labelled by room and model label. Gauges report active
+sessions and metrics queue depth. Metric records update them from the
+metrics writer thread, but a few updates do run on the event loop: the loop
+lag sample every monitor interval, the phrase-cache hit/miss counter and the
+per-level session counter at admission. Each update only takes a per-metric
+lock around a dict update (or, in a job process, a non-blocking queue put),
+so the loop is never held up by a scrape. Scrapes snapshot under the same
+locks.
+
+Rooms are labels, so the number of series grows with calls; only the most
+recent `max_rooms` rooms are kept.
+
+With the process job executor every call runs in its own process, so the
+main process also listens on a local `multiprocessing.connection` socket
+(`serve_jobs`). Its address goes to the job processes through the
+environment, and each job process calls `connect_to_worker` instead of
+starting a server. A sender thread then forwards that process's counter and
+histogram updates in batches, plus its gauge values once a second. The
+counters outlive the job process, and gauges of a job that went away are
+dropped. The same connection carries raw metric records for the live
+console panel (`forward_record`), which the main process hands to
+`on_record` (see agent/display.py).
+"""
+import logging
+import math
+import os
+import queue
+import threading
+import weakref
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from agent import settings
+
+logger = logging.getLogger("metrics-exporter")
+
+# Where job processes find the worker's exporter (set by `serve_jobs`)
+ADDRESS_ENV = "AGENT_METRICS_EXPORTER_ADDRESS"
+AUTHKEY_ENV = "AGENT_METRICS_EXPORTER_AUTHKEY"
+
+# Updates a job process buffers for the sender thread before dropping them
+FORWARD_QUEUE_SIZE = 10000
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        # set in job processes: updates go to the worker's exporter instead
+        self.forward: Optional[Callable[[tuple], None]] = None
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1.0) -> None:
+        if self.forward is not None:
+            self.forward(("inc", self.name, labels, amount))
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def forget(self, predicate: Callable[[Tuple[str, ...]], bool]) -> None:
+        with self._lock:
+            for labels in [labels for labels in self._values if predicate(labels)]:
+                del self._values[labels]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total counter"]
+        for labels, value in values:
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # labels -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+        self.forward: Optional[Callable[[tuple], None]] = None
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        if self.forward is not None:
+            self.forward(("observe", self.name, labels, value))
+            return
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def forget(self, predicate: Callable[[Tuple[str, ...]], bool]) -> None:
+        with self._lock:
+            for labels in [labels for labels in self._values if predicate(labels)]:
+                del self._values[labels]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, series in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} "
+                    f"{_format_value(cumulative)}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{label_text} {_format_value(series[-1])}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time, plus the job processes' values"""
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        # job process -> its last reported value
+        self.remote: Dict[int, float] = {}
+
+    def render(self) -> List[str]:
+        try:
+            value = _format_value(self.function() + sum(list(self.remote.values())))
+        except Exception:
+            logger.exception(f"error reading gauge {self.name}")
+            value = "NaN"
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {value}",
+        ]
+
+
+class PrometheusExporter:
+    def __init__(self, max_rooms: int = 500) -> None:
+        self.max_rooms = max_rooms
+        self._rooms: "OrderedDict[str, None]" = OrderedDict()
+        self._rooms_lock = threading.Lock()
+        self._sessions: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._listener: Optional[Listener] = None
+        self._client: Optional[Connection] = None
+        self._outbox: "queue.Queue[tuple]" = queue.Queue(maxsize=FORWARD_QUEUE_SIZE)
+        self.forward_dropped = 0
+        # main process: called with (kind, record, session) for records forwarded by job processes
+        self.on_record: Optional[Callable[[str, Dict[str, Any], str], None]] = None
+
+        labels = ("room", "label")
+        self.requests = Counter("agent_requests", "Provider requests by metric type", ("room", "label", "kind"))
+        self.cancelled = Counter("agent_cancelled_requests", "Cancelled LLM/TTS requests", ("room", "label", "kind"))
+        self.llm_tokens = Counter("agent_llm_tokens", "LLM tokens by direction", ("room", "label", "direction"))
+        self.tts_characters = Counter("agent_tts_characters", "Characters synthesized", labels)
+        self.audio_seconds = Counter("agent_audio_seconds", "Audio seconds synthesized (tts) or transcribed (stt)", ("room", "label", "kind"))
+        self.llm_ttft = Histogram("agent_llm_ttft_seconds", "LLM time to first token", labels)
+        self.llm_duration = Histogram("agent_llm_duration_seconds", "LLM request duration", labels)
+        self.tts_ttfb = Histogram("agent_tts_ttfb_seconds", "TTS time to first byte", labels)
+        self.tts_duration = Histogram("agent_tts_duration_seconds", "TTS request duration", labels)
+        self.stt_duration = Histogram("agent_stt_duration_seconds", "STT request duration", labels)
+        self.eou_delay = Histogram("agent_eou_delay_seconds", "End of utterance delay", ("room",))
+        self.transcription_delay = Histogram("agent_transcription_delay_seconds", "Transcription delay", ("room",))
+        self.voice_to_voice = Histogram("agent_voice_to_voice_seconds", "EOU delay + LLM TTFT + TTS TTFB per turn", ("room",))
+        self.llm_cache = Counter("agent_llm_cache_requests", "LLM response cache lookups by result (hit/miss)", ("room", "label", "result"))
+        self.llm_cache_ttft_saved = Counter("agent_llm_cache_ttft_saved_seconds", "TTFT saved by LLM response cache hits", labels)
+        self.speculation = Counter("agent_speculative_requests", "Speculative LLM requests by result (hit/miss)", ("room", "label", "result"))
+        self.speculation_wasted = Counter("agent_speculative_wasted_tokens", "Tokens spent on discarded speculative requests", ("room", "label", "direction"))
+        self.context_tokens = Histogram(
+            "agent_context_tokens", "Estimated chat context tokens per user turn", ("room",),
+            buckets=(250, 500, 1000, 2000, 4000, 8000, 16000),
+        )
+        self.context_tokens_saved = Counter("agent_context_tokens_saved", "Estimated prompt tokens saved by context summarization", ("room",))
+        self.routed = Counter("agent_routed_requests", "Pool requests by serving backend and whether they were hedged", ("room", "kind", "backend", "hedged"))
+        self.routing_failovers = Counter("agent_routing_failovers", "Pool backends that failed before their first chunk", ("room", "kind"))
+        self.loop_stalls = Counter("agent_loop_stalls", "Event-loop stalls and slow event handlers", ("room", "source", "name"))
+        self.loop_lag = Histogram(
+            "agent_loop_lag_seconds", "Event-loop scheduling lag (one sample per monitor interval)",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+        )
+        self.session_cpu = Histogram(
+            "agent_session_cpu_ratio", "CPU seconds per second of call audio per session (real-time factor)", ("room", "level"),
+            buckets=(0.02, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0),
+        )
+        self.sessions_by_level = Counter("agent_sessions_by_processing_level", "Sessions started, by audio processing level", ("level",))
+        self.phrase_cache = Counter("agent_phrase_cache_requests", "Canned phrases played, by cache result (hit/miss)", ("result",))
+
+        self.active_sessions = Gauge("agent_active_sessions", "Sessions currently hosted by this process", lambda: len(self._sessions))
+        self.queue_depth = Gauge(
+            "agent_metrics_queue_depth",
+            "Metric events waiting for the writer thread",
+            lambda: sum(session.writer.depth for session in list(self._sessions)),
+        )
+        self.dropped = Gauge(
+            "agent_metrics_dropped",
+            "Metric events dropped or sampled out by active sessions",
+            lambda: sum(session.writer.dropped + session.writer.sampled_out for session in list(self._sessions)),
+        )
+
+        self._metrics = [
+            self.requests, self.cancelled, self.llm_tokens, self.tts_characters, self.audio_seconds,
+            self.llm_ttft, self.llm_duration, self.tts_ttfb, self.tts_duration, self.stt_duration,
+            self.eou_delay, self.transcription_delay, self.voice_to_voice,
+            self.llm_cache, self.llm_cache_ttft_saved, self.speculation, self.speculation_wasted,
+            self.context_tokens, self.context_tokens_saved, self.routed, self.routing_failovers,
+            self.loop_stalls, self.loop_lag, self.session_cpu, self.sessions_by_level, self.phrase_cache,
+            self.active_sessions, self.queue_depth, self.dropped,
+        ]
+
+    # -- sessions -----------------------------------------------------------
+
+    def track_session(self, session: Any) -> None:
+        """Count a MetricsAgent (anything with a `.writer`) as active"""
+        self._sessions.add(session)
+
+    def untrack_session(self, session: Any) -> None:
+        self._sessions.discard(session)
+
+    def _touch_room(self, room: str) -> None:
+        if self._client is not None:
+            self._forward(("room", room))
+            return
+        with self._rooms_lock:
+            self._rooms[room] = None
+            self._rooms.move_to_end(room)
+            if len(self._rooms) <= self.max_rooms:
+                return
+            oldest, _ = self._rooms.popitem(last=False)
+        for metric in self._metrics:
+            if hasattr(metric, "forget"):
+                metric.forget(lambda labels: labels[:1] == (oldest,))
+
+    # -- updates ------------------------------------------------------------
+
+    def observe(self, kind: str, record: Dict[str, Any], room: str) -> None:
+        """Update counters/histograms from one raw metric record"""
+        self._touch_room(room)
+        label = record.get("label") or kind
+        labels = (room, label)
+
+        if kind == "llm":
+            self.requests.inc((room, label, kind))
+            if record["cancelled"]:
+                self.cancelled.inc((room, label, kind))
+            self.llm_tokens.inc((room, label, "prompt"), record["prompt_tokens"])
+            self.llm_tokens.inc((room, label, "completion"), record["completion_tokens"])
+            self.llm_ttft.observe(labels, record["ttft"])
+            self.llm_duration.observe(labels, record["duration"])
+        elif kind == "tts":
+            self.requests.inc((room, label, kind))
+            if record["cancelled"]:
+                self.cancelled.inc((room, label, kind))
+            self.tts_characters.inc(labels, record["characters_count"])
+            self.audio_seconds.inc((room, label, kind), record["audio_duration"])
+            self.tts_ttfb.observe(labels, record["ttfb"])
+            self.tts_duration.observe(labels, record["duration"])
+        elif kind == "stt":
+            self.requests.inc((room, label, kind))
+            self.audio_seconds.inc((room, label, kind), record["audio_duration"])
+            self.stt_duration.observe(labels, record["duration"])
+        elif kind == "eou":
+            self.eou_delay.observe((room,), record["end_of_utterance_delay"])
+            self.transcription_delay.observe((room,), record["transcription_delay"])
+        elif kind == "llm_cache":
+            self.llm_cache.inc((room, label, "hit" if record["hit"] else "miss"))
+            self.llm_cache_ttft_saved.inc(labels, record["ttft_saved"])
+        elif kind == "speculation":
+            self.speculation.inc((room, label, "hit" if record["hit"] else "miss"))
+            if not record["hit"]:
+                self.speculation_wasted.inc((room, label, "prompt"), record["wasted_prompt_tokens"])
+                self.speculation_wasted.inc((room, label, "completion"), record["wasted_completion_tokens"])
+        elif kind == "context":
+            self.context_tokens.observe((room,), record["context_tokens"])
+            self.context_tokens_saved.inc((room,), record["tokens_saved"])
+        elif kind == "routing":
+            self.routed.inc((room, record["kind"], record["backend"], "true" if record["hedged"] else "false"))
+            self.routing_failovers.inc((room, record["kind"]), record["failovers"])
+        elif kind == "loop":
+            self.loop_stalls.inc((room, record["source"], record["name"]))
+        elif kind == "load":
+            self.session_cpu.observe((room, record["level"]), record["session_cpu"])
+        elif kind == "turn":
+            self.voice_to_voice.observe((room,), record["voice_to_voice"])
+
+    # -- exposition ---------------------------------------------------------
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def start(self, port: int, host: str = "0.0.0.0") -> bool:
+        """Serve /metrics on a daemon thread; returns False if the port is taken"""
+        if self._server is not None:
+            return True
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logger.warning(f"metrics exporter not started on {host}:{port}: {e}")
+            return False
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-exporter", daemon=True).start()
+        logger.info(f"metrics exporter listening on http://{host}:{port}/metrics")
+        return True
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def port(self) -> Optional[int]:
+        """Port /metrics is served on (the bound one when started with port 0)"""
+        return self._server.server_address[1] if self._server is not None else None
+
+    @property
+    def running(self) -> bool:
+        """True when updates go somewhere: this process serves /metrics or forwards to the worker"""
+        return self._server is not None or self._client is not None
+
+    # -- job processes ------------------------------------------------------
+
+    def serve_jobs(self) -> None:
+        """Accept updates from job processes; call in the worker's main process before it spawns jobs"""
+        if self._listener is not None:
+            return
+        authkey = os.urandom(16)
+        self._listener = Listener(("127.0.0.1", 0), authkey=authkey)
+        host, port = self._listener.address
+        # inherited by the job processes the worker spawns
+        os.environ[ADDRESS_ENV] = f"{host}:{port}"
+        os.environ[AUTHKEY_ENV] = authkey.hex()
+        threading.Thread(target=self._accept, name="metrics-exporter-jobs", daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                return
+            except Exception as e:
+                # e.g. a client with the wrong authkey
+                logger.warning(f"metrics exporter rejected a job connection: {e}")
+                continue
+            threading.Thread(target=self._receive, args=(connection,), name="metrics-exporter-job", daemon=True).start()
+
+    def _receive(self, connection: Connection) -> None:
+        job = id(connection)
+        by_name = {metric.name: metric for metric in self._metrics}
+        try:
+            while True:
+                for message in connection.recv():
+                    if message[0] == "room":
+                        self._touch_room(message[1])
+                    elif message[0] == "inc":
+                        by_name[message[1]].inc(message[2], message[3])
+                    elif message[0] == "observe":
+                        by_name[message[1]].observe(message[2], message[3])
+                    elif message[0] == "record":
+                        if self.on_record is not None:
+                            self.on_record(message[1], message[2], message[3])
+                    elif message[0] == "gauges":
+                        for name, value in message[1].items():
+                            by_name[name].remote[job] = value
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+            for metric in self._metrics:
+                if isinstance(metric, Gauge):
+                    metric.remote.pop(job, None)
+
+    def connect_to_worker(self) -> bool:
+        """In a job process: forward updates to the worker's exporter (see `serve_jobs`)"""
+        if self.running:
+            return True
+        address = os.environ.get(ADDRESS_ENV)
+        if not address:
+            return False
+        host, port = address.rsplit(":", 1)
+        try:
+            self._client = Client((host, int(port)), authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"metrics exporter at {address} not reachable: {e}")
+            return False
+        for metric in self._metrics:
+            if not isinstance(metric, Gauge):
+                metric.forward = self._forward
+        threading.Thread(target=self._send, name="metrics-exporter-forward", daemon=True).start()
+        return True
+
+    @property
+    def forwarding(self) -> bool:
+        """True in a job process connected to the worker's exporter"""
+        return self._client is not None
+
+    def forward_record(self, kind: str, record: Dict[str, Any], session: str) -> None:
+        """In a job process: send one raw metric record to the worker's `on_record`"""
+        if self._client is not None:
+            self._forward(("record", kind, record, session))
+
+    def _forward(self, message: tuple) -> None:
+        try:
+            self._outbox.put_nowait(message)
+        except queue.Full:
+            self.forward_dropped += 1
+
+    def _send(self) -> None:
+        gauges = [metric for metric in self._metrics if isinstance(metric, Gauge)]
+        while self._client is not None:
+            batch = []
+            try:
+                batch.append(self._outbox.get(timeout=1.0))
+                while len(batch) < 1000:
+                    batch.append(self._outbox.get_nowait())
+            except queue.Empty:
+                pass
+            values = {}
+            for gauge in gauges:
+                try:
+                    values[gauge.name] = gauge.function()
+                except Exception:
+                    logger.exception(f"error reading gauge {gauge.name}")
+            batch.append(("gauges", values))
+            try:
+                self._client.send(batch)
+            except (OSError, ValueError) as e:
+                logger.warning(f"metrics exporter connection lost: {e}")
+                self._client = None
+                for metric in self._metrics:
+                    if not isinstance(metric, Gauge):
+                        metric.forward = None
+
+
+# One exporter per worker process, shared by all sessions it hosts
+EXPORTER = PrometheusExporter(max_rooms=settings.METRICS_EXPORTER_MAX_ROOMS)
@@ -0,0 +1,394 @@
+"""
+In-process fake STT/LLM/TTS providers and synthetic audio I/O.
+
+They stand in for Deepgram, OpenAI and Cartesia so an `AgentSession` can run
+entirely offline with configurable, deterministic latencies. They go
+through the regular livekit-agents base classes, so the session emits the
+usual STT/LLM/TTS/EOU metrics and the whole metrics pipeline is exercised.
+
+    stt = FakeSTT(utterance_seconds=2.0, final_delay=0.15)
+    llm = FakeLLM(ttft=0.35, tokens_per_second=60)
+    tts = FakeTTS(ttfb=0.2)
+
+`error_rate` makes that share of LLM/TTS requests fail before their first
+chunk, for exercising failover.
+
+The STT emits a user turn every `utterance_seconds + pause_seconds` of
+audio it receives, so use it with `turn_detection="stt"` and feed the
+session from `SyntheticAudioInput`. Like a real streaming STT it sends an
+interim transcript only when the text changes (a word at a time), not on
+every audio frame.
+"""
+import asyncio
+import inspect
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from livekit import rtc
+from livekit.agents import (
+    DEFAULT_API_CONNECT_OPTIONS,
+    APIConnectionError,
+    APIConnectOptions,
+    llm,
+    stt,
+    tts,
+    utils,
+)
+from livekit.agents.voice import io
+
+SAMPLE_RATE = 24000
+FRAME_MS = 20
+
+_UTTERANCES = (
+    "what are your opening hours",
+    "who am I speaking with",
+    "can you tell me more about your pricing",
+    "I would like to book an appointment for tomorrow",
+    "thanks that is all for today",
+)
+
+_RESPONSE = (
+    "Sure, happy to help with that. We are open from nine in the morning until six in the "
+    "evening, Monday to Friday. Is there anything else I can do for you today?"
+)
+
+
+@dataclass
+class LatencyProfile:
+    """Base latency plus uniform jitter, in seconds"""
+
+    base: float
+    jitter: float = 0.0
+
+    def sample(self) -> float:
+        return max(0.0, self.base + random.uniform(-self.jitter, self.jitter))
+
+
+def _maybe_fail(error_rate: float, label: str) -> None:
+    if error_rate > 0 and random.random() < error_rate:
+        raise APIConnectionError(f"{label}: injected failure", retryable=True)
+
+
+def _silence(duration: float, sample_rate: int = SAMPLE_RATE) -> bytes:
+    return bytes(int(duration * sample_rate) * 2)
+
+
+def _compatible_kwargs(cls, **kwargs):
+    """Keep only the constructor arguments this livekit-agents version accepts"""
+    params = inspect.signature(cls.__init__).parameters
+    return {name: value for name, value in kwargs.items() if name in params}
+
+
+# -- STT ----------------------------------------------------------------------
+
+
+class FakeSTT(stt.STT):
+    def __init__(
+        self,
+        *,
+        utterance_seconds: float = 2.0,
+        pause_seconds: float = 3.0,
+        final_delay: float = 0.15,
+        jitter: float = 0.0,
+    ) -> None:
+        super().__init__(capabilities=stt.STTCapabilities(streaming=True, interim_results=True))
+        self.utterance_seconds = utterance_seconds
+        self.pause_seconds = pause_seconds
+        self.final_delay = LatencyProfile(final_delay, jitter)
+
+    @property
+    def label(self) -> str:
+        return "fake.STT"
+
+    async def _recognize_impl(self, buffer, *, language=None, conn_options=DEFAULT_API_CONNECT_OPTIONS):
+        await asyncio.sleep(self.final_delay.sample())
+        return stt.SpeechEvent(
+            type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+            alternatives=[stt.SpeechData(language="en", text=random.choice(_UTTERANCES))],
+        )
+
+    def stream(self, *, language=None, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS):
+        return FakeRecognizeStream(stt=self, conn_options=conn_options)
+
+
+class FakeRecognizeStream(stt.RecognizeStream):
+    async def _run(self) -> None:
+        fake: FakeSTT = self._stt
+        cycle = fake.utterance_seconds + fake.pause_seconds
+        utterances = itertools.cycle(_UTTERANCES)
+        audio_seconds = 0.0
+        usage_seconds = 0.0
+        speaking = False
+        text = next(utterances)
+        # words of the current utterance already sent as an interim
+        shown_words = 0
+        pending = set()
+
+        async for frame in self._input_ch:
+            if isinstance(frame, self._FlushSentinel):
+                continue
+            audio_seconds += frame.samples_per_channel / frame.sample_rate
+            usage_seconds += frame.samples_per_channel / frame.sample_rate
+            position = audio_seconds % cycle
+
+            if not speaking and position < fake.utterance_seconds:
+                speaking = True
+                shown_words = 0
+                self._event_ch.send_nowait(stt.SpeechEvent(type=stt.SpeechEventType.START_OF_SPEECH))
+            elif speaking and position < fake.utterance_seconds:
+                words = text.split()
+                shown = max(1, int(len(words) * position / fake.utterance_seconds))
+                if shown != shown_words:
+                    shown_words = shown
+                    self._event_ch.send_nowait(
+                        stt.SpeechEvent(
+                            type=stt.SpeechEventType.INTERIM_TRANSCRIPT,
+                            alternatives=[stt.SpeechData(language="en", text=" ".join(words[:shown]))],
+                        )
+                    )
+            elif speaking:
+                speaking = False
+                final_text, text = text, next(utterances)
+                task = asyncio.create_task(self._finalize(final_text, fake.final_delay.sample()))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if usage_seconds >= 5.0:
+                self._event_ch.send_nowait(
+                    stt.SpeechEvent(
+                        type=stt.SpeechEventType.RECOGNITION_USAGE,
+                        recognition_usage=stt.RecognitionUsage(audio_duration=usage_seconds),
+                    )
+                )
+                usage_seconds = 0.0
+
+    async def _finalize(self, text: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._event_ch.send_nowait(
+            stt.SpeechEvent(
+                type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+                alternatives=[stt.SpeechData(language="en", text=text)],
+            )
+        )
+        self._event_ch.send_nowait(stt.SpeechEvent(type=stt.SpeechEventType.END_OF_SPEECH))
+
+
+# -- LLM ----------------------------------------------------------------------
+
+
+class FakeLLM(llm.LLM):
+    def __init__(
+        self,
+        *,
+        ttft: float = 0.35,
+        tokens_per_second: float = 60.0,
+        jitter: float = 0.0,
+        response: str = _RESPONSE,
+        label: str = "fake.LLM",
+        error_rate: float = 0.0,
+    ) -> None:
+        super().__init__()
+        self.ttft = LatencyProfile(ttft, jitter)
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.response = response
+        self._label = label
+
+    @property
+    def label(self) -> str:
+        return self._label
+
+    @property
+    def model(self) -> str:
+        return self._label
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools=None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        **kwargs,
+    ) -> "FakeLLMStream":
+        return FakeLLMStream(self, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options)
+
+
+class FakeLLMStream(llm.LLMStream):
+    async def _run(self) -> None:
+        fake: FakeLLM = self._llm
+        request_id = utils.shortuuid()
+        await asyncio.sleep(fake.ttft.sample())
+        _maybe_fail(fake.error_rate, fake.label)
+
+        tokens = [word + " " for word in fake.response.split()]
+        for token in tokens:
+            self._event_ch.send_nowait(
+                llm.ChatChunk(id=request_id, delta=llm.ChoiceDelta(role="assistant", content=token))
+            )
+            await asyncio.sleep(1.0 / fake.tokens_per_second)
+
+        prompt_tokens = sum(len(str(item).split()) for item in self._chat_ctx.items)
+        self._event_ch.send_nowait(
+            llm.ChatChunk(
+                id=request_id,
+                usage=llm.CompletionUsage(
+                    completion_tokens=len(tokens),
+                    prompt_tokens=prompt_tokens,
+                    total_tokens=len(tokens) + prompt_tokens,
+                ),
+            )
+        )
+
+
+# -- TTS ----------------------------------------------------------------------
+
+
+class FakeTTS(tts.TTS):
+    def __init__(
+        self,
+        *,
+        ttfb: float = 0.2,
+        jitter: float = 0.0,
+        seconds_per_character: float = 0.06,
+        realtime_factor: float = 0.1,
+        sample_rate: int = SAMPLE_RATE,
+        label: str = "fake.TTS",
+        error_rate: float = 0.0,
+    ) -> None:
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=False),
+            sample_rate=sample_rate,
+            num_channels=1,
+        )
+        self.ttfb = LatencyProfile(ttfb, jitter)
+        self.seconds_per_character = seconds_per_character
+        self.realtime_factor = realtime_factor
+        self.error_rate = error_rate
+        self._label = label
+
+    @property
+    def label(self) -> str:
+        return self._label
+
+    @property
+    def model(self) -> str:
+        return self._label
+
+    def synthesize(self, text: str, *, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS):
+        return FakeChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+
+class FakeChunkedStream(tts.ChunkedStream):
+    async def _run(self, output_emitter) -> None:
+        fake: FakeTTS = self._tts
+        output_emitter.initialize(
+            request_id=utils.shortuuid(),
+            sample_rate=fake.sample_rate,
+            num_channels=1,
+            mime_type="audio/pcm",
+        )
+        await asyncio.sleep(fake.ttfb.sample())
+        _maybe_fail(fake.error_rate, fake.label)
+
+        duration = max(0.2, len(self._input_text) * fake.seconds_per_character)
+        chunk = _silence(0.1, fake.sample_rate)
+        for _ in range(int(duration / 0.1)):
+            output_emitter.push(chunk)
+            # synthesis runs faster than real time, like a real provider
+            await asyncio.sleep(0.1 * fake.realtime_factor)
+        output_emitter.flush()
+
+
+# -- audio I/O ----------------------------------------------------------------
+
+
+class SyntheticAudioInput(io.AudioInput):
+    """Real-time paced 20 ms frames of low-level noise (the fake STT drives turns)"""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE) -> None:
+        super().__init__(**_compatible_kwargs(io.AudioInput, label="synthetic"))
+        self.sample_rate = sample_rate
+        self.samples_per_frame = sample_rate * FRAME_MS // 1000
+        noise = bytearray(random.getrandbits(8) & 0x0F for _ in range(self.samples_per_frame * 2))
+        self._frame_data = bytes(noise)
+        self._next_at: Optional[float] = None
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        if self._closed:
+            raise StopAsyncIteration
+        now = time.perf_counter()
+        if self._next_at is None:
+            self._next_at = now
+        self._next_at += FRAME_MS / 1000
+        if self._next_at > now:
+            await asyncio.sleep(self._next_at - now)
+        return rtc.AudioFrame(
+            data=self._frame_data,
+            sample_rate=self.sample_rate,
+            num_channels=1,
+            samples_per_channel=self.samples_per_frame,
+        )
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class NullAudioOutput(io.AudioOutput):
+    """Discards agent audio but reports playout in real time, like a room track"""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE) -> None:
+        kwargs = _compatible_kwargs(
+            io.AudioOutput,
+            label="null",
+            next_in_chain=None,
+            sample_rate=sample_rate,
+        )
+        if "capabilities" in inspect.signature(io.AudioOutput.__init__).parameters:
+            kwargs["capabilities"] = io.AudioOutputCapabilities(pause=False)
+        super().__init__(**kwargs)
+        self._pushed = 0.0
+        self._started_at: Optional[float] = None
+        self._playout: Optional[asyncio.Task] = None
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+            # newer livekit-agents only mark the agent as speaking on this event
+            if hasattr(self, "on_playback_started"):
+                self.on_playback_started(created_at=time.time())
+        self._pushed += frame.samples_per_channel / frame.sample_rate
+
+    def flush(self) -> None:
+        super().flush()
+        if self._started_at is None or self._playout is not None:
+            return
+        self._playout = asyncio.create_task(self._finish())
+
+    async def _finish(self) -> None:
+        # "play" the segment in real time, then report it like a room track does
+        await asyncio.sleep(max(0.0, self._started_at + self._pushed - time.perf_counter()))
+        position = self._pushed
+        self._reset()
+        self.on_playback_finished(playback_position=position, interrupted=False)
+
+    def clear_buffer(self) -> None:
+        if self._started_at is None:
+            return
+        position = min(time.perf_counter() - self._started_at, self._pushed)
+        self._reset()
+        self.on_playback_finished(playback_position=position, interrupted=True)
+
+    def _reset(self) -> None:
+        if self._playout is not None and self._playout is not asyncio.current_task():
+            self._playout.cancel()
+        self._playout = None
+        self._pushed = 0.0
+        self._started_at = None
@@ -0,0 +1,145 @@
+"""
+Per-job lifecycle so one worker process can host many calls.
+
+`SessionLifecycle` owns the end of a call:
+
+    lifecycle = SessionLifecycle(metrics_agent, session, ctx)
+    ...
+    await lifecycle.wait()      # returns once the call is over and torn down
+
+When the last caller leaves (or the session closes) it shuts the job down,
+and the job's shutdown callback runs `aclose()` exactly once: tracked tasks
+are cancelled, the AgentSession is closed, metrics are flushed and exported
+once, and the MetricsAgent releases its writer thread, segment files and
+in-memory store. A short memory report is printed per job.
+
+RSS is process-wide, so with concurrent calls the per-job delta also
+includes whatever the other calls did meanwhile. Create the lifecycle (and
+register the room's disconnect handler) before connecting to the room, so a
+caller who hangs up during startup still ends the job.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Coroutine, Dict, Optional, Set
+
+from rich.console import Console
+
+console = Console()
+logger = logging.getLogger("session-lifecycle")
+
+# Jobs hosted by this process, for the per-job report
+PROCESS_JOBS = {"started": 0, "finished": 0}
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc, falls back to peak RSS)"""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SessionLifecycle:
+    def __init__(self, metrics_agent, session, ctx=None) -> None:
+        self.metrics_agent = metrics_agent
+        self.session = session
+        self.ctx = ctx
+        self.report: Dict[str, Any] = {}
+
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+        self._started_at = time.perf_counter()
+        self._rss_start = rss_bytes()
+        PROCESS_JOBS["started"] += 1
+
+        session.on("close", metrics_agent.timed("session.close")(self._on_session_close))
+        if ctx is not None:
+            ctx.add_shutdown_callback(self.aclose)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """Run `coro` as a task that is cancelled when the job ends"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def participant_left(self, identity: str) -> None:
+        """End the job once no remote participant is left in the room"""
+        if self.ctx is not None and self.ctx.room.remote_participants:
+            return
+        self.end(f"participant {identity} left")
+
+    def end(self, reason: str) -> None:
+        """Shut the job down; teardown runs from the shutdown callback"""
+        if self.ctx is not None:
+            self.ctx.shutdown(reason=reason)
+        elif self._closing is None:
+            self._closing = asyncio.create_task(self._aclose(reason))
+
+    def _on_session_close(self, ev) -> None:
+        error = getattr(ev, "error", None)
+        self.end(f"session closed ({error})" if error else "session closed")
+
+    async def wait(self) -> None:
+        await self._closed.wait()
+
+    async def aclose(self, reason: str = "") -> None:
+        """Tear the job down; safe to call many times and from any task"""
+        if self._closing is None:
+            self._closing = asyncio.create_task(self._aclose(reason))
+        await asyncio.shield(self._closing)
+
+    async def _aclose(self, reason: str) -> None:
+        console.print(f"[bold yellow]🧹 Ending job for room {self.metrics_agent.room}: {reason or 'shutdown'}[/bold yellow]")
+        try:
+            tasks = list(self._tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            try:
+                await self.session.aclose()
+            except Exception:
+                logger.exception("error while closing the agent session")
+
+            store_bytes = self.metrics_agent.store.nbytes
+            await self.metrics_agent.aclose()
+        finally:
+            PROCESS_JOBS["finished"] += 1
+            self._closed.set()
+            if self.ctx is not None:
+                # no-op when the job is already shutting down
+                self.ctx.shutdown(reason=reason)
+
+        # no gc.collect() here: a full collection blocks every session on this loop
+        rss_end = rss_bytes()
+        self.report = {
+            "reason": reason,
+            "duration_seconds": round(time.perf_counter() - self._started_at, 2),
+            "rss_start_mb": round(self._rss_start / 2**20, 1),
+            "rss_end_mb": round(rss_end / 2**20, 1),
+            "rss_delta_mb": round((rss_end - self._rss_start) / 2**20, 1),
+            "store_kib_released": round(store_bytes / 1024, 1),
+            "threads": threading.active_count(),
+            "tasks": len(asyncio.all_tasks()),
+            "jobs_finished": PROCESS_JOBS["finished"],
+            "jobs_active": PROCESS_JOBS["started"] - PROCESS_JOBS["finished"],
+        }
+        console.print(
+            f"[cyan]📦 Job #{self.report['jobs_finished']} done in {self.report['duration_seconds']}s | "
+            f"RSS {self.report['rss_start_mb']}→{self.report['rss_end_mb']} MB | "
+            f"store {self.report['store_kib_released']} KiB released | "
+            f"{self.report['threads']} threads, {self.report['tasks']} tasks, "
+            f"{self.report['jobs_active']} jobs still active[/cyan]"
+        )
@@ -0,0 +1,440 @@
+"""
+Response cache for repeated LLM turns.
+
+`CachingLLM` wraps any livekit LLM. Completions are keyed on the normalized
+instructions, the last few turns of context and the user's utterance, so the
+same question in the same conversational spot is answered from memory:
+
+    llm = CachingLLM(openai.LLM(model="gpt-4o-mini"))
+
+A hit streams the cached text as chunks right away, so TTS starts at once.
+Only plain-text answers are cached; responses that call tools and turns that
+follow a tool call always go to the provider. Entries expire after `ttl`
+seconds and the least recently used ones are evicted above `max_entries` or
+`max_bytes` of cached JSON.
+
+With the default process job executor every call runs in its own process,
+so an in-memory cache would only ever answer repeats within one call. The
+entries are files in LLM_CACHE_DIR instead, written through a temp file and
+an atomic rename like the phrase cache, so every job process on the host
+reads and fills the same cache. Lookups and writes run in a worker thread,
+off the event loop.
+
+An answer may be personal (the caller's name, their booking), so keys are
+scoped: `CachingLLM(..., scope=room)` only replays answers given in the same
+room. An empty scope shares answers between every caller on the host, which
+is only safe when the prompts carry nothing personal (LLM_CACHE_SCOPE=shared).
+
+Every request also produces an `LLMCacheMetrics` record (hit or miss, the
+TTFT of this request, the TTFT of the request that filled the entry, and the
+tokens not spent), emitted as "cache_metrics" next to the regular LLMMetrics.
+A lookup made for a speculative request (agent/speculative.py) is only
+counted, and its record only emitted, if the session ends up using that
+speculation; discarded speculations leave the hit/miss numbers alone.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions, llm, utils
+
+from agent import settings
+
+_PUNCTUATION = re.compile(r"[^\w\s']")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", (text or "").lower())).strip()
+
+
+def cache_key(chat_ctx: llm.ChatContext, context_turns: int, scope: str = "") -> Optional[str]:
+    """Key for the next completion within `scope`, or None when the turn should not be cached"""
+    items = list(chat_ctx.items)
+    if not items or getattr(items[-1], "type", None) != "message" or items[-1].role != "user":
+        return None
+    window = items[-(2 * context_turns + 1):]
+    if any(getattr(item, "type", None) != "message" for item in window):
+        return None
+
+    messages = [item for item in items if getattr(item, "type", None) == "message"]
+    instructions = " ".join(m.text_content or "" for m in messages if m.role in ("system", "developer"))
+    history = [m for m in messages[:-1] if m.role in ("user", "assistant")]
+    history = history[-2 * context_turns:] if context_turns else []
+
+    parts = [f"scope: {scope}", normalize(instructions)]
+    parts += [f"{m.role}: {normalize(m.text_content)}" for m in history]
+    parts.append(normalize(messages[-1].text_content))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    chunks: List[str]
+    ttft: float
+    prompt_tokens: int
+    completion_tokens: int
+    expires_at: float
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks)
+
+
+@dataclass
+class LLMCacheMetrics:
+    """LLMMetrics-style record for one lookup"""
+
+    label: str
+    request_id: str
+    hit: bool
+    ttft: float
+    original_ttft: float
+    ttft_saved: float
+    completion_tokens_saved: int = 0
+    prompt_tokens_saved: int = 0
+    timestamp: float = field(default_factory=time.time)
+    type: str = "llm_cache_metrics"
+
+
+class DeferredLookups:
+    """Cache lookups of one speculative request, counted only once it is used"""
+
+    def __init__(self) -> None:
+        self._reports: List[Callable[[], None]] = []
+        self.released = False
+        self.dropped = False
+
+    def report(self, callback: Callable[[], None]) -> None:
+        if self.released:
+            callback()
+        elif not self.dropped:
+            self._reports.append(callback)
+
+    def release(self) -> None:
+        """The speculation answers a real request: count its lookups"""
+        self.released = True
+        reports, self._reports = self._reports, []
+        for callback in reports:
+            callback()
+
+    def drop(self) -> None:
+        """The speculation was discarded: its lookups never happened"""
+        self.dropped = True
+        self._reports = []
+
+
+# Set by SpeculativeLLM inside its speculation task; lookups made there are deferred
+SPECULATIVE_LOOKUPS: "contextvars.ContextVar[Optional[DeferredLookups]]" = contextvars.ContextVar(
+    "speculative_lookups", default=None
+)
+
+
+class ResponseCache:
+    """Completions on disk, one JSON file per key, shared by every job process.
+
+    The index of sizes is rebuilt from file mtimes (hits touch their file),
+    and rescanned before evicting so entries written by other processes
+    count against the caps. Hit/miss counters are this process's lookups.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        ttl: float = 3600.0,
+        max_entries: int = 1000,
+        max_bytes: int = 4 * 2**20,
+    ) -> None:
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> size in bytes, least recently used first
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        # jobs may run on several threads (AGENT_JOB_EXECUTOR=thread)
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _load(self, rescan: bool = False) -> None:
+        if self._loaded and not rescan:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        self._index.clear()
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+        self._loaded = True
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load(rescan=True)
+            return len(self._index)
+
+    def get(self, key: str, count: bool = True) -> Optional[CacheEntry]:
+        """The live entry for `key`; `count=False` leaves the hit/miss counters to `count`"""
+        path = self._path(key)
+        raw = b""
+        try:
+            raw = path.read_bytes()
+            entry = CacheEntry(**json.loads(raw))
+        except FileNotFoundError:
+            entry = None
+        except (OSError, ValueError, TypeError):
+            # unreadable or foreign file: drop it
+            path.unlink(missing_ok=True)
+            entry = None
+
+        with self._lock:
+            self._load()
+            if entry is not None and entry.expires_at <= time.time():
+                path.unlink(missing_ok=True)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self._index.pop(key, None)
+            else:
+                self._index[key] = len(raw)
+                self._index.move_to_end(key)
+            if count:
+                self._count(entry is not None)
+        if entry is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return entry
+
+    def count(self, hit: bool) -> None:
+        with self._lock:
+            self._count(hit)
+
+    def _count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        """Store one completion and evict the least recently used ones above the caps"""
+        data = json.dumps(asdict(entry)).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._load()
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._load(rescan=True)
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+            while len(self._index) > self.max_entries or sum(self._index.values()) > self.max_bytes:
+                oldest, _ = self._index.popitem(last=False)
+                self._path(oldest).unlink(missing_ok=True)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load(rescan=True)
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": sum(self._index.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+
+class CachingLLM(llm.LLM):
+    def __init__(
+        self,
+        inner: llm.LLM,
+        *,
+        cache: Optional[ResponseCache] = None,
+        context_turns: int = 1,
+        scope: str = "",
+    ) -> None:
+        super().__init__()
+        self.inner = inner
+        # not `cache or ...`: an empty ResponseCache is falsy (__len__)
+        self.cache = cache if cache is not None else RESPONSE_CACHE
+        self.context_turns = context_turns
+        self.scope = scope
+
+    @property
+    def label(self) -> str:
+        return self.inner.label
+
+    @property
+    def model(self) -> str:
+        return getattr(self.inner, "model", "unknown")
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools=None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        **kwargs,
+    ) -> "CachingLLMStream":
+        return CachingLLMStream(
+            self,
+            chat_ctx=chat_ctx,
+            tools=tools or [],
+            # the provider stream does its own retries
+            conn_options=APIConnectOptions(max_retry=0, timeout=conn_options.timeout),
+            inner_conn_options=conn_options,
+            chat_kwargs=kwargs,
+        )
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class CachingLLMStream(llm.LLMStream):
+    def __init__(self, caching_llm: CachingLLM, *, inner_conn_options, chat_kwargs, **kwargs) -> None:
+        super().__init__(caching_llm, **kwargs)
+        self._inner_conn_options = inner_conn_options
+        self._chat_kwargs = chat_kwargs
+
+    async def _run(self) -> None:
+        owner: CachingLLM = self._llm
+        start = time.perf_counter()
+        key = cache_key(self._chat_ctx, owner.context_turns, owner.scope)
+        deferred = SPECULATIVE_LOOKUPS.get()
+        # a file read (and, the first time, a directory scan): off the event loop
+        entry = await asyncio.to_thread(owner.cache.get, key, deferred is None) if key else None
+
+        if entry is not None:
+            request_id = utils.shortuuid()
+            ttft = None
+            for chunk in entry.chunks:
+                self._event_ch.send_nowait(
+                    llm.ChatChunk(id=request_id, delta=llm.ChoiceDelta(role="assistant", content=chunk))
+                )
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                # let TTS pick up text as it arrives, like a live stream
+                await asyncio.sleep(0)
+            # nothing was billed for this answer
+            self._event_ch.send_nowait(
+                llm.ChatChunk(id=request_id, usage=llm.CompletionUsage(completion_tokens=0, prompt_tokens=0, total_tokens=0))
+            )
+            self._report(deferred, LLMCacheMetrics(
+                label=owner.label,
+                request_id=request_id,
+                hit=True,
+                ttft=ttft,
+                original_ttft=entry.ttft,
+                ttft_saved=max(0.0, entry.ttft - ttft),
+                completion_tokens_saved=entry.completion_tokens,
+                prompt_tokens_saved=entry.prompt_tokens,
+            ))
+            return
+
+        chunks: List[str] = []
+        usage = None
+        ttft = None
+        request_id = ""
+        cacheable = key is not None
+        async with owner.inner.chat(
+            chat_ctx=self._chat_ctx,
+            tools=self._tools,
+            conn_options=self._inner_conn_options,
+            **self._chat_kwargs,
+        ) as stream:
+            async for chunk in stream:
+                self._event_ch.send_nowait(chunk)
+                request_id = chunk.id
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if chunk.delta is None:
+                    continue
+                if chunk.delta.tool_calls:
+                    cacheable = False
+                if chunk.delta.content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    chunks.append(chunk.delta.content)
+
+        ttft = ttft if ttft is not None else time.perf_counter() - start
+        if key is not None:
+            self._report(deferred, LLMCacheMetrics(
+                label=owner.label,
+                request_id=request_id,
+                hit=False,
+                ttft=ttft,
+                original_ttft=ttft,
+                ttft_saved=0.0,
+            ))
+        if cacheable and chunks:
+            # a directory rescan and a file write: off the event loop
+            await asyncio.to_thread(owner.cache.put, key, CacheEntry(
+                chunks=chunks,
+                ttft=ttft,
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+                expires_at=time.time() + owner.cache.ttl,
+            ))
+
+
+    def _report(self, deferred: Optional[DeferredLookups], metrics: LLMCacheMetrics) -> None:
+        owner: CachingLLM = self._llm
+        if deferred is None:
+            owner.emit("cache_metrics", metrics)
+            return
+
+        def report() -> None:
+            owner.cache.count(metrics.hit)
+            owner.emit("cache_metrics", metrics)
+
+        deferred.report(report)
+
+
+def cache_summary(store) -> List[str]:
+    """Final-summary line for the lookups of one session (agent/store.py)"""
+    hits = sum(1 for record in store.rows("llm_cache") if record["hit"])
+    saved = sum(sum(view) for view in store.column_views("llm_cache", "ttft_saved"))
+    return [
+        f"  • LLM cache: {hits}/{store.count('llm_cache')} hits this session, "
+        f"{saved:.2f}s TTFT saved ({len(RESPONSE_CACHE)} cached answers)"
+    ]
+
+
+# Shared by every session on the host, whichever job process runs it
+RESPONSE_CACHE = ResponseCache(
+    settings.LLM_CACHE_DIR,
+    ttl=settings.LLM_CACHE_TTL_SECONDS,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_bytes=int(settings.LLM_CACHE_MAX_KB * 1024),
+)
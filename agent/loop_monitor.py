@@ -0,0 +1,311 @@
+"""
+Event-loop lag and callback-duration instrumentation.
+
+Everything that blocks the asyncio loop (a slow event handler, a sync call
+in a callback, a large export) delays audio frames and inflates TTFB.
+`LoopMonitor` makes that visible:
+
+  * a sampler task sleeps `interval` seconds over and over and records how
+    late it wakes up (loop lag), continuously, into a rolling sketch
+  * a watchdog thread notices when the loop has not come back for
+    `stall_threshold` seconds and samples the loop thread's stack while it
+    is still blocked, so the log shows what was running
+  * `timed(name, callback)` wraps session and room event handlers and keeps
+    per-callback duration stats; a callback slower than
+    `callback_threshold` is reported
+
+Stalls and slow callbacks are emitted as `LoopMetrics` records to every
+subscribed MetricsAgent, tagged with the speech_id of that session's current
+reply, so they can be lined up with turns. There is one monitor per event
+loop (several sessions share one with AGENT_JOB_EXECUTOR=thread):
+
+    monitor = LoopMonitor.for_running_loop()
+    monitor.subscribe(metrics_agent)
+
+    @session.on("metrics_collected")
+    @monitor.timed("session.metrics_collected")
+    def handler(ev): ...
+
+Callback stats are per loop, so with several sessions on one loop every
+session's report shows the shared numbers. Loop lag is also kept per
+subscriber, from the moment it subscribes, so a session's report covers
+its own call rather than the monitor's lifetime.
+"""
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from agent import settings
+from agent.exporter import EXPORTER
+from agent.sketch import LatencySketch, RollingSketch
+
+logger = logging.getLogger("loop-monitor")
+
+# Longest stack sample kept per record
+MAX_STACK_CHARS = 4000
+
+
+async def sample_loop_lag(
+    record: Callable[[float], Any], interval: float = 0.02, stop: Optional[asyncio.Event] = None
+) -> None:
+    """Measure how late the loop wakes us up compared to the requested sleep.
+
+    Calls `record(lag)` after every wake-up, until `stop` is set (or forever).
+    """
+    while stop is None or not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        record(max(0.0, time.perf_counter() - start - interval))
+
+
+@dataclass
+class LoopMetrics:
+    """A loop stall or a slow callback"""
+
+    # "loop" (the sampler woke up late) or "callback" (a timed callback ran long)
+    source: str
+    # the callback that was running, when known
+    name: str
+    duration: float
+    stack: str = ""
+    speech_id: str = ""
+    timestamp: float = field(default_factory=time.time)
+    type: str = "loop_metrics"
+
+
+class CallbackStats:
+    def __init__(self) -> None:
+        self.sketch = LatencySketch()
+        self.slow = 0
+
+    def row(self, name: str) -> Dict[str, Any]:
+        sketch = self.sketch
+        return {
+            "callback": name,
+            "calls": sketch.count,
+            "slow": self.slow,
+            "p50_ms": round(sketch.quantile(0.5) * 1000, 3) if sketch.count else None,
+            "p99_ms": round(sketch.quantile(0.99) * 1000, 3) if sketch.count else None,
+            "max_ms": round(sketch.max * 1000, 3) if sketch.count else None,
+        }
+
+
+class SessionLag:
+    """Loop lag seen while one subscriber was subscribed"""
+
+    def __init__(self) -> None:
+        self.sketch = LatencySketch()
+        self.stalls = 0
+
+
+class LoopMonitor:
+    _monitors: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LoopMonitor]" = weakref.WeakKeyDictionary()
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        *,
+        interval: float = 0.05,
+        stall_threshold: float = 0.1,
+        callback_threshold: float = 0.02,
+        stack_depth: int = 20,
+    ) -> None:
+        self.loop = loop
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.callback_threshold = callback_threshold
+        self.stack_depth = stack_depth
+
+        self.lag = RollingSketch(slot_seconds=settings.LATENCY_SLOT_SECONDS)
+        self.callbacks: Dict[str, CallbackStats] = {}
+        self.stalls = 0
+
+        self._subscribers: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        # kept after unsubscribe, so the final report can still read it
+        self._session_lag: "weakref.WeakKeyDictionary[Any, SessionLag]" = weakref.WeakKeyDictionary()
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[threading.Event] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.perf_counter()
+        # set by the watchdog while the loop is blocked
+        self._stack = ""
+        self._stalled_in = ""
+        self._sampled_beat = 0.0
+        self._current: Optional[str] = None
+
+    @classmethod
+    def for_running_loop(cls) -> "LoopMonitor":
+        loop = asyncio.get_running_loop()
+        monitor = cls._monitors.get(loop)
+        if monitor is None:
+            monitor = cls._monitors[loop] = cls(
+                loop,
+                interval=settings.LOOP_SAMPLE_INTERVAL_MS / 1000,
+                stall_threshold=settings.LOOP_STALL_MS / 1000,
+                callback_threshold=settings.CALLBACK_SLOW_MS / 1000,
+                stack_depth=settings.LOOP_STACK_DEPTH,
+            )
+        return monitor
+
+    # -- subscribers --------------------------------------------------------
+
+    def subscribe(self, metrics_agent) -> None:
+        """Send stalls to `metrics_agent.submit_metrics`; starts the monitor on first use"""
+        self._subscribers.add(metrics_agent)
+        self._session_lag.setdefault(metrics_agent, SessionLag())
+        if self._task is None:
+            self._start()
+
+    def unsubscribe(self, metrics_agent) -> None:
+        self._subscribers.discard(metrics_agent)
+        if not self._subscribers:
+            self._stop_monitor()
+
+    def _emit(self, source: str, name: str, duration: float, stack: str) -> None:
+        for metrics_agent in list(self._subscribers):
+            metrics_agent.submit_metrics(LoopMetrics(
+                source=source,
+                name=name,
+                duration=duration,
+                stack=stack,
+                speech_id=_current_speech_id(metrics_agent),
+            ))
+
+    # -- sampling -----------------------------------------------------------
+
+    def _start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        # a fresh event per start, so a watchdog that is still winding down stays stopped
+        self._stop = threading.Event()
+        self._task = self.loop.create_task(sample_loop_lag(self._record_lag, self.interval))
+        threading.Thread(target=self._watch, args=(self._stop,), name="loop-watchdog", daemon=True).start()
+
+    def _stop_monitor(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _record_lag(self, lag: float) -> None:
+        # the sampler sleeps again right after this, so this is also its next start
+        self._heartbeat = time.perf_counter()
+        self.lag.add(lag)
+        if EXPORTER.running:
+            EXPORTER.loop_lag.observe((), lag)
+        stalled = lag > self.stall_threshold
+        for metrics_agent in list(self._subscribers):
+            session = self._session_lag.get(metrics_agent)
+            if session is not None:
+                session.sketch.add(lag)
+                session.stalls += stalled
+        if stalled:
+            self.stalls += 1
+            stack, name = self._take_stack()
+            self._emit("loop", name, lag, stack)
+
+    def _watch(self, stop: threading.Event) -> None:
+        """Watchdog thread: sample the loop thread's stack while it is blocked"""
+        frames = sys._current_frames
+        while not stop.wait(self.interval):
+            beat = self._heartbeat
+            blocked = time.perf_counter() - beat - self.interval
+            if blocked <= self.stall_threshold or self._sampled_beat == beat:
+                continue
+            frame = frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._sampled_beat = beat
+            self._stalled_in = self._current or ""
+            self._stack = "".join(traceback.format_stack(frame, limit=self.stack_depth))[-MAX_STACK_CHARS:]
+            logger.warning(
+                f"event loop blocked for {blocked * 1000:.0f} ms"
+                f"{f' in {self._stalled_in}' if self._stalled_in else ''}:\n{self._stack}"
+            )
+
+    def _take_stack(self):
+        stack, name = self._stack, self._stalled_in
+        self._stack, self._stalled_in = "", ""
+        return stack, name
+
+    # -- callbacks ----------------------------------------------------------
+
+    def timed(self, name: str, callback: Optional[Callable] = None) -> Callable:
+        """Wrap an event handler so its duration is tracked (and reported when slow).
+
+        Without `callback`, returns a decorator.
+        """
+        if callback is None:
+            return functools.partial(self.timed, name)
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            outer, self._current = self._current, name
+            start = time.perf_counter()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                self._current = outer
+                stats = self.callbacks.get(name)
+                if stats is None:
+                    stats = self.callbacks[name] = CallbackStats()
+                stats.sketch.add(duration)
+                if duration > self.callback_threshold:
+                    stats.slow += 1
+                    # the watchdog only has a stack if it caught the callback blocking
+                    stack = self._stack if self._stalled_in == name else ""
+                    self._emit("callback", name, duration, stack)
+
+        return wrapper
+
+    # -- reports ------------------------------------------------------------
+
+    def session_lag(self, metrics_agent) -> SessionLag:
+        """Loop lag since `metrics_agent` subscribed"""
+        return self._session_lag.get(metrics_agent) or SessionLag()
+
+    def summary_lines(self, metrics_agent, store) -> List[str]:
+        """Final-summary line for one subscriber's session (agent/store.py)"""
+        records = list(store.rows("loop"))
+        stalls = sum(1 for record in records if record["source"] == "loop")
+        lag = self.session_lag(metrics_agent).sketch
+        p99 = f"{lag.quantile(0.99) * 1000:.1f} ms" if lag.count else "n/a"
+        return [f"  • Event loop: lag p99 {p99}, {stalls} stalls, {len(records) - stalls} slow callbacks this session"]
+
+    def rows(self, metrics_agent=None) -> List[Dict[str, Any]]:
+        """Loop lag percentiles (for `metrics_agent`'s session, if given) and per-callback stats, for reports"""
+        rows = []
+        if metrics_agent is not None:
+            session = self.session_lag(metrics_agent)
+            lag, stalls = session.sketch, session.stalls
+        else:
+            lag, stalls = self.lag.window(None), self.stalls
+        if lag.count:
+            rows.append({
+                "callback": "(loop lag)",
+                "calls": lag.count,
+                "slow": stalls,
+                "p50_ms": round(lag.quantile(0.5) * 1000, 3),
+                "p99_ms": round(lag.quantile(0.99) * 1000, 3),
+                "max_ms": round(lag.max * 1000, 3),
+            })
+        rows.extend(stats.row(name) for name, stats in sorted(self.callbacks.items()))
+        return rows
+
+
+def _current_speech_id(metrics_agent) -> str:
+    try:
+        speech = metrics_agent.session.current_speech
+    except (AttributeError, RuntimeError):
+        return ""
+    return speech.id if speech is not None else ""
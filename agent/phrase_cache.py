@@ -0,0 +1,264 @@
+"""
+Disk cache of synthesized phrase audio for fixed prompts such as the greeting.
+
+Phrases are keyed on (text, voice id, TTS model, sample rate) and stored as
+raw 16-bit PCM, one file per phrase. A hit memory-maps the file and plays
+it through `session.say(text, audio=...)`: no LLM round trip and no TTS
+request. The file is not read up front; each 20 ms frame copies its slice
+of the mapping into the frame's own buffer as it is played. A miss
+synthesizes once while playing and writes the audio for the next caller.
+
+Keys come from the TTS the session speaks with (`tts_identity`), a routed
+pool included, so `--warm` builds that same TTS (`build_tts()`).
+Files are evicted least recently used once the cache exceeds its size cap.
+
+The directory can be shared by every worker process on the host; writes go
+through a temp file and an atomic rename. Lookups (the first one scans the
+directory, then open + mmap + utime) and writes run in a worker thread, off
+the event loop. Warm it before taking calls:
+
+    python -m agent.phrase_cache --warm
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from livekit import rtc
+
+from agent import settings
+
+logger = logging.getLogger("phrase-cache")
+
+FRAME_MS = 20
+
+# Phrases the agent speaks through `say_phrase`, warmed before the first call
+CANNED_PHRASES = (
+    settings.AGENT_GREETING,
+)
+
+
+def tts_identity(tts) -> Tuple[str, str, int]:
+    """(voice id, model, sample rate) of a TTS instance, for cache keys"""
+    opts = getattr(tts, "_opts", None)
+    voice = getattr(opts, "voice", None) or getattr(opts, "voice_id", None) or ""
+    model = getattr(opts, "model", None) or getattr(tts, "model", None) or "unknown"
+    return str(voice), f"{tts.label}:{model}", tts.sample_rate
+
+
+def phrase_key(text: str, voice: str, model: str, sample_rate: int) -> str:
+    raw = "\0".join((text.strip(), voice, model, str(sample_rate)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class PhraseCache:
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        # key -> size in bytes, least recently used first
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pcm"
+
+    def _load(self) -> None:
+        # Rebuild the LRU order from mtimes (hits touch their file)
+        if self._loaded:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.glob("*.pcm"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+        self._loaded = True
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._index.values())
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._load()
+        return self._path(key).exists()
+
+    def open(self, key: str) -> Optional[mmap.mmap]:
+        """Map a cached phrase read-only, or None (a miss)"""
+        path = self._path(key)
+        with self._lock:
+            self._load()
+        try:
+            with open(path, "rb") as fp:
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # missing, or evicted/emptied by another process
+            with self._lock:
+                self._index.pop(key, None)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._index[key] = len(mapped)
+            self._index.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return mapped
+
+    def put(self, key: str, pcm: bytes) -> None:
+        """Store one phrase and evict the least recently used ones above the cap"""
+        if not pcm or len(pcm) > self.max_bytes:
+            return
+        with self._lock:
+            self._load()
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as fp:
+            fp.write(pcm)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._index[key] = len(pcm)
+            self._index.move_to_end(key)
+            self.writes += 1
+            while self.nbytes > self.max_bytes and len(self._index) > 1:
+                oldest, _ = self._index.popitem(last=False)
+                # open mappings stay valid after the unlink
+                self._path(oldest).unlink(missing_ok=True)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+
+
+async def cached_frames(mapped: mmap.mmap, sample_rate: int, num_channels: int = 1) -> AsyncIterator[rtc.AudioFrame]:
+    """20 ms frames read from a mapped phrase (each frame copies its slice)"""
+    view = memoryview(mapped)
+    samples_per_frame = sample_rate * FRAME_MS // 1000
+    step = samples_per_frame * num_channels * 2
+    try:
+        for offset in range(0, len(view), step):
+            samples = min(step, len(view) - offset) // (num_channels * 2)
+            if samples == 0:
+                break
+            yield rtc.AudioFrame(
+                data=view[offset:offset + samples * num_channels * 2],
+                sample_rate=sample_rate,
+                num_channels=num_channels,
+                samples_per_channel=samples,
+            )
+    finally:
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # a slice of the view is still alive (the generator was closed
+            # mid-frame); the mapping is closed when it is collected
+            pass
+
+
+async def synthesized_frames(tts, text: str, cache: PhraseCache, key: str) -> AsyncIterator[rtc.AudioFrame]:
+    """Frames from the TTS, written to the cache once the phrase completes"""
+    pcm = bytearray()
+    async with tts.synthesize(text) as stream:
+        async for audio in stream:
+            pcm += audio.frame.data.cast("B")
+            yield audio.frame
+    # only complete phrases are cached (an interrupted playout never gets here)
+    await asyncio.to_thread(cache.put, key, bytes(pcm))
+
+
+async def phrase_audio(tts, text: str, cache: Optional[PhraseCache] = None) -> Tuple[AsyncIterator[rtc.AudioFrame], bool]:
+    """Audio for `text` in the voice of `tts`, and whether it came from cache"""
+    cache = cache or PHRASE_CACHE
+    key = phrase_key(text, *tts_identity(tts))
+    mapped = await asyncio.to_thread(cache.open, key)
+    if mapped is None:
+        return synthesized_frames(tts, text, cache, key), False
+    return cached_frames(mapped, tts.sample_rate, tts.num_channels), True
+
+
+async def warm(tts, phrases=CANNED_PHRASES, cache: Optional[PhraseCache] = None) -> int:
+    """Synthesize the phrases missing from the cache; returns how many were added"""
+    cache = cache or PHRASE_CACHE
+    added = 0
+    for text in phrases:
+        key = phrase_key(text, *tts_identity(tts))
+        if await asyncio.to_thread(cache.__contains__, key):
+            continue
+        try:
+            async for _ in synthesized_frames(tts, text, cache, key):
+                pass
+            added += 1
+        except Exception:
+            logger.exception(f"could not synthesize phrase {text!r}")
+    return added
+
+
+def phrase_summary(session_stats: Dict[str, int], cache: Optional[PhraseCache] = None) -> List[str]:
+    """Final-summary line: phrases played this session, and the shared cache"""
+    stats = (cache or PHRASE_CACHE).stats()
+    return [
+        f"  • Phrase cache: {session_stats['hits']} hits, {session_stats['misses']} misses this session "
+        f"({stats['entries']} phrases, {stats['bytes'] / 2**20:.1f} MiB on disk)"
+    ]
+
+
+# One cache per worker process, backed by a directory shared across processes
+PHRASE_CACHE = PhraseCache(settings.PHRASE_CACHE_DIR, int(settings.PHRASE_CACHE_MAX_MB * 2**20))
+
+
+async def _warm_session_voice() -> None:
+    import aiohttp
+
+    from agent.providers import build_tts
+
+    async with aiohttp.ClientSession() as http_session:
+        tts = build_tts(http_session=http_session)
+        try:
+            added = await warm(tts)
+        finally:
+            await tts.aclose()
+    print(f"Added {added} phrases; cache: {PHRASE_CACHE.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or warm the phrase audio cache")
+    parser.add_argument("--warm", action="store_true", help="synthesize CANNED_PHRASES (the greeting) with the session TTS (TTS_POOL)")
+    args = parser.parse_args()
+
+    if args.warm:
+        asyncio.run(_warm_session_voice())
+    else:
+        print(f"{PHRASE_CACHE.directory}: {PHRASE_CACHE.stats()}")
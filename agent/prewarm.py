@@ -0,0 +1,179 @@
+"""
+Process-level model prewarming for the VAD.
+
+`prewarm` is registered as `WorkerOptions.prewarm_fnc`, so the LiveKit
+worker runs it when it starts a job executor, before any call is assigned
+to it. The loaded VAD is kept in a module-level dict guarded by a lock,
+so there is one copy per process: consecutive jobs of a job process share
+it, and with the thread executor (where every executor gets its own
+`JobProcess` and runs prewarm itself) so do all the concurrent jobs.
+
+The turn detector is not loaded here. Its ONNX model already runs in the
+worker's shared inference process, and `MultilingualModel` is only a client
+that needs the job context's inference executor, which does not exist yet
+when prewarm runs. `shared_models` builds one per job instead.
+
+Run this module directly for a startup benchmark that compares the cold
+path (models loaded inside the job) with the warm path (models already in
+the process). Each run times a session from job start to the moment the
+agent starts speaking its greeting, with the fake STT/LLM/TTS providers and
+a temporary METRICS_DIR and PHRASE_CACHE_DIR, so no API keys are needed and
+nothing lands in the report archive. The turn detector needs a job's
+inference executor, so offline runs load the VAD only and end turns on STT:
+
+    python -m agent.prewarm --runs 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from livekit import agents
+from livekit.plugins import silero
+from livekit.plugins.turn_detector.multilingual import MultilingualModel
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+console = Console()
+
+# "vad", "model_load_seconds" once loaded; one copy per process
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+# Jobs that asked for the models in this process
+_jobs_started = 0
+
+
+def load_models() -> Dict[str, Any]:
+    """Load the VAD model; returns it with the load time. Safe outside a job."""
+    start = time.perf_counter()
+    vad = silero.VAD.load()
+    return {
+        "vad": vad,
+        "model_load_seconds": time.perf_counter() - start,
+    }
+
+
+def _ensure_models() -> bool:
+    """Load the process-wide models unless they are loaded; True if this call loaded them"""
+    with _models_lock:
+        if _models:
+            return False
+        _models.update(load_models())
+        return True
+
+
+def prewarm(proc: agents.JobProcess) -> None:
+    """Load the VAD once per worker process so sessions start without paying for it"""
+    from agent.admission import SYSTEM_CPU
+
+    # machine CPU window for the first call's processing level (agent/admission.py)
+    SYSTEM_CPU.start()
+    if _ensure_models():
+        console.print(f"[dim]🔥 Prewarmed VAD in {_models['model_load_seconds']:.2f}s[/dim]")
+    proc.userdata["prewarmed"] = True
+
+
+def shared_models() -> Dict[str, Any]:
+    """Return the process-wide VAD, loading it on first use if prewarm did not run,
+    and a turn detector for this job. Must be called from inside a job.
+
+    Also returns how this job started: `prewarmed` is False only for the job
+    that had to load the VAD itself.
+    """
+    global _jobs_started
+    loaded_here = _ensure_models()
+    with _models_lock:
+        _jobs_started += 1
+        return {
+            "vad": _models["vad"],
+            "turn_detection": MultilingualModel(),
+            "prewarmed": not loaded_here,
+            "model_load_seconds": _models["model_load_seconds"] if loaded_here else 0.0,
+            "process_job_index": _jobs_started,
+        }
+
+
+async def _time_to_first_greeting(vad) -> float:
+    """One offline session from job start until the agent starts speaking the greeting"""
+    from agent import settings
+    from agent.agent import MetricsAgent
+    from agent.fakes import FakeLLM, FakeSTT, FakeTTS, NullAudioOutput, SyntheticAudioInput
+    from agent.lifecycle import SessionLifecycle
+    from agent.session import create_session
+
+    start = time.perf_counter()
+    if vad is None:
+        vad = load_models()["vad"]
+    metrics_agent = MetricsAgent(
+        vad=vad, room="prewarm-benchmark", stt=FakeSTT(), llm=FakeLLM(), tts=FakeTTS(), summary_llm=FakeLLM()
+    )
+    session = create_session(metrics_agent, turn_detection="stt", job_start=start)
+    lifecycle = SessionLifecycle(metrics_agent, session)
+    session.input.audio = SyntheticAudioInput()
+    session.output.audio = NullAudioOutput()
+    try:
+        await session.start(agent=metrics_agent)
+        await metrics_agent.say_phrase(settings.AGENT_GREETING)
+        return metrics_agent.startup["time_to_first_greeting"]
+    finally:
+        await lifecycle.aclose("benchmark run done")
+
+
+async def benchmark_startup(runs: int = 3) -> Dict[str, Dict[str, float]]:
+    """Time to first greeting with cold (per-job) vs warm (process-wide) models"""
+    from agent.fakes import FakeTTS
+    from agent.phrase_cache import warm
+
+    # the greeting plays from the phrase cache on both paths
+    await warm(FakeTTS())
+    shared = load_models()
+
+    cold: List[float] = []
+    warm_runs: List[float] = []
+    for _ in range(runs):
+        cold.append(await _time_to_first_greeting(None))
+        warm_runs.append(await _time_to_first_greeting(shared["vad"]))
+
+    results = {}
+    for name, samples in (("cold", cold), ("warm", warm_runs)):
+        results[name] = {
+            "mean": statistics.mean(samples),
+            "min": min(samples),
+            "max": max(samples),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold vs warm time-to-first-greeting benchmark (fake providers)")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # Keep the benchmark's reports and phrase audio out of the real directories.
+    # Must be set before agent.settings is imported.
+    os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="prewarm_metrics_"))
+    os.environ.setdefault("PHRASE_CACHE_DIR", tempfile.mkdtemp(prefix="prewarm_phrases_"))
+    os.environ.setdefault("METRICS_DISPLAY", "off")
+
+    results = asyncio.run(benchmark_startup(args.runs))
+
+    table = Table(
+        title="[bold cyan]Time to First Greeting[/bold cyan]",
+        box=box.ROUNDED,
+        show_header=True,
+        header_style="bold cyan"
+    )
+    table.add_column("Path", style="bold green")
+    table.add_column("Mean", style="yellow")
+    table.add_column("Min", style="yellow")
+    table.add_column("Max", style="yellow")
+    for name, row in results.items():
+        table.add_row(name, f"{row['mean']:.3f}s", f"{row['min']:.3f}s", f"{row['max']:.3f}s")
+    console.print(table)
+    speedup = results["cold"]["mean"] - results["warm"]["mean"]
+    console.print(f"[bold green]Prewarming saves ~{speedup:.3f}s per call[/bold green]")
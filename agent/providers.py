@@ -0,0 +1,178 @@
+"""
+STT/LLM/TTS factories, single providers or routed pools.
+
+A provider spec is `provider:model`; a pool is a comma-separated list of
+specs (LLM_POOL, TTS_POOL, STT_POOL):
+
+    LLM_POOL=openai:gpt-4o-mini,openai:gpt-4.1-mini
+    TTS_POOL=cartesia:sonic-2,cartesia:sonic-turbo
+    STT_POOL=deepgram:nova-2,deepgram:nova-3
+
+`fake:<latency>[:<error_rate>]` builds the in-process fakes from
+agent/fakes.py, so routing can be tried offline:
+
+    LLM_POOL=fake:0.3,fake:1.5:0.2 python loadtest.py --steps 5
+
+One spec gives that provider directly. LLM and TTS pools go through a
+`RoutingLLM`/`RoutingTTS` whose router is shared by every session in the
+process. Routers of the same pool in other job processes exchange their
+latency windows and cooldowns through ROUTER_STATE_DIR, so all calls on the
+host learn from each other's latencies, whichever process runs them. STT
+pools fail over in order (livekit's `stt.FallbackAdapter`).
+
+Plugin modules are only imported for providers that are configured.
+livekit requires plugins to be registered on the main thread, so the
+worker calls `import_plugins()` when entry.py is loaded; the factories
+then find the modules already imported.
+"""
+import hashlib
+import importlib
+from types import ModuleType
+from typing import Dict, List, Set, Tuple
+
+from livekit.agents import llm, stt, tts
+
+from agent import settings
+from agent.routing import LatencyRouter, RoutingLLM, RoutingTTS, SharedRouterState
+
+DEFAULT_STT = "deepgram:nova-2"
+DEFAULT_LLM = "openai:gpt-4o-mini"
+DEFAULT_TTS = "cartesia:sonic-2"
+DEFAULT_VOICE = "f786b574-daa5-4673-aa0c-cbe3e8534c02"
+
+# provider -> plugin module ("fake" needs none)
+PLUGINS = {
+    "deepgram": "livekit.plugins.deepgram",
+    "openai": "livekit.plugins.openai",
+    "cartesia": "livekit.plugins.cartesia",
+}
+
+# (kind, pool spec) -> router, shared by every session in the process (and
+# through ROUTER_STATE_DIR with the other job processes)
+ROUTERS: Dict[Tuple[str, str], LatencyRouter] = {}
+
+
+def parse_pool(spec: str) -> List[Tuple[str, str, List[str]]]:
+    """(backend name, provider, arguments) for each entry of a pool spec"""
+    entries = []
+    seen: Dict[str, int] = {}
+    for raw in spec.split(","):
+        raw = raw.strip()
+        if not raw:
+            continue
+        provider, *args = raw.split(":")
+        # the same spec twice gets two backends
+        seen[raw] = seen.get(raw, 0) + 1
+        name = raw if seen[raw] == 1 else f"{raw}#{seen[raw]}"
+        entries.append((name, provider.lower(), args))
+    if not entries:
+        raise ValueError(f"empty provider pool: {spec!r}")
+    return entries
+
+
+def plugin(provider: str) -> ModuleType:
+    if provider not in PLUGINS:
+        raise ValueError(f"unknown provider: {provider}")
+    return importlib.import_module(PLUGINS[provider])
+
+
+def configured_providers() -> Set[str]:
+    """Providers named by the configured (or default) pools"""
+    specs = (settings.STT_POOL or DEFAULT_STT, settings.LLM_POOL or DEFAULT_LLM, settings.TTS_POOL or DEFAULT_TTS)
+    return {provider for spec in specs for _, provider, _ in parse_pool(spec)}
+
+
+def import_plugins() -> List[str]:
+    """Import (and so register) the plugins of the configured providers; call on the main thread"""
+    modules = sorted(PLUGINS[provider] for provider in configured_providers() if provider in PLUGINS)
+    for module in modules:
+        importlib.import_module(module)
+    return modules
+
+
+def _fake_args(args: List[str]) -> Tuple[List[float], float]:
+    values = [float(arg) for arg in args]
+    return values[:1], values[1] if len(values) > 1 else 0.0
+
+
+def _stt_backend(provider: str, args: List[str]) -> stt.STT:
+    if provider == "deepgram":
+        return plugin(provider).STT(model=args[0] if args else "nova-2", language="en")
+    if provider == "fake":
+        from agent.fakes import FakeSTT
+
+        delay, _ = _fake_args(args)
+        return FakeSTT(final_delay=delay[0]) if delay else FakeSTT()
+    raise ValueError(f"unknown STT provider: {provider}")
+
+
+def _llm_backend(name: str, provider: str, args: List[str]) -> llm.LLM:
+    if provider == "openai":
+        return plugin(provider).LLM(model=args[0] if args else "gpt-4o-mini")
+    if provider == "fake":
+        from agent.fakes import FakeLLM
+
+        ttft, error_rate = _fake_args(args)
+        return FakeLLM(ttft=ttft[0] if ttft else 0.35, error_rate=error_rate, label=f"fake.LLM[{name}]")
+    raise ValueError(f"unknown LLM provider: {provider}")
+
+
+def _tts_backend(name: str, provider: str, args: List[str], **kwargs) -> tts.TTS:
+    if provider == "cartesia":
+        model = args[0] if args else "sonic-2"
+        voice = args[1] if len(args) > 1 else DEFAULT_VOICE
+        return plugin(provider).TTS(model=model, voice=voice, **kwargs)
+    if provider == "fake":
+        from agent.fakes import FakeTTS
+
+        ttfb, error_rate = _fake_args(args)
+        return FakeTTS(ttfb=ttfb[0] if ttfb else 0.2, error_rate=error_rate, label=f"fake.TTS[{name}]")
+    raise ValueError(f"unknown TTS provider: {provider}")
+
+
+def router_for(kind: str, spec: str, names: List[str]) -> LatencyRouter:
+    key = (kind, spec)
+    if key not in ROUTERS:
+        shared = None
+        if settings.ROUTER_SYNC_SECONDS > 0:
+            pool = f"{kind}-{hashlib.sha256(spec.encode('utf-8')).hexdigest()[:16]}"
+            shared = SharedRouterState(settings.ROUTER_STATE_DIR, pool, interval=settings.ROUTER_SYNC_SECONDS)
+        ROUTERS[key] = LatencyRouter(
+            names,
+            window=settings.ROUTER_WINDOW_SECONDS,
+            cooldown=settings.ROUTER_COOLDOWN_SECONDS,
+            hedge_after=settings.HEDGE_AFTER_MS / 1000,
+            hedge_min=settings.HEDGE_MIN_MS / 1000,
+            hedge_max=settings.HEDGE_MAX_MS / 1000,
+            shared=shared,
+        )
+    return ROUTERS[key]
+
+
+def build_stt(spec: str = "") -> stt.STT:
+    entries = parse_pool(spec or settings.STT_POOL or DEFAULT_STT)
+    backends = [_stt_backend(provider, args) for _, provider, args in entries]
+    if len(backends) == 1:
+        return backends[0]
+    return stt.FallbackAdapter(backends)
+
+
+def build_llm(spec: str = "", kind: str = "llm") -> llm.LLM:
+    """`kind` names the pool's router; another kind (e.g. "summary") gets its own latency windows"""
+    spec = spec or settings.LLM_POOL or DEFAULT_LLM
+    entries = parse_pool(spec)
+    backends = {name: _llm_backend(name, provider, args) for name, provider, args in entries}
+    if len(backends) == 1:
+        return next(iter(backends.values()))
+    return RoutingLLM(backends, router_for(kind, spec, list(backends)), max_hedges=settings.HEDGE_MAX)
+
+
+def build_tts(spec: str = "", **kwargs) -> tts.TTS:
+    """kwargs go to every real provider (e.g. http_session)"""
+    spec = spec or settings.TTS_POOL or DEFAULT_TTS
+    entries = parse_pool(spec)
+    backends = {name: _tts_backend(name, provider, args, **kwargs) for name, provider, args in entries}
+    if len(backends) == 1:
+        return next(iter(backends.values()))
+    return RoutingTTS(backends, router_for("tts", spec, list(backends)), max_hedges=settings.HEDGE_MAX)
+
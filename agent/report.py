@@ -0,0 +1,83 @@
+"""
+Excel export built from the streaming metric segments.
+
+The workbook is produced once (on finalize or on demand) instead of being
+rewritten while the call is running.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from rich.console import Console
+
+from agent.sink import MetricsSink
+from agent.store import export_row
+
+console = Console()
+
+# metric type -> (sheet name, console colour)
+SHEETS = {
+    "llm": ("LLM_Metrics", "green"),
+    "tts": ("TTS_Metrics", "blue"),
+    "stt": ("STT_Metrics", "cyan"),
+    "eou": ("EOU_Metrics", "yellow"),
+    "llm_cache": ("LLM_Cache", "green"),
+    "speculation": ("Speculation", "green"),
+    "context": ("Context", "cyan"),
+    "routing": ("Routing_Requests", "blue"),
+    "loop": ("Event_Loop_Stalls", "red"),
+    "load": ("Load", "yellow"),
+    "turn": ("Turns", "magenta"),
+}
+
+CONFIGURATION_NOTES = {
+    "llm": "LLM metrics from GPT-4o-mini",
+    "tts": "TTS metrics from Cartesia Sonic-2",
+    "stt": "STT metrics from Deepgram Nova-2 (may be 0 with some configs)",
+    "eou": "EOU metrics require VAD/turn detection (may be 0)",
+    "llm_cache": "LLM response cache lookups (LLM_CACHE_ENABLED=1)",
+    "speculation": "Speculative LLM requests before end-of-utterance (SPECULATIVE_LLM_ENABLED=1)",
+    "context": "Estimated chat context tokens per user turn (CONTEXT_TOKEN_BUDGET > 0)",
+    "routing": "Pool backend per LLM/TTS request (LLM_POOL / TTS_POOL with two or more entries)",
+    "loop": "Event-loop stalls and slow event handlers, with stack samples (LOOP_MONITOR_ENABLED=1)",
+    "load": "Process CPU and per-session real-time factor every LOAD_SAMPLE_SECONDS, with the processing level",
+    "turn": "Voice-to-voice latency per response (EOU + LLM TTFT + TTS TTFB)",
+}
+
+
+def export_excel(
+    sink: MetricsSink,
+    filename: Path,
+    sections: Optional[Dict[str, List[dict]]] = None,
+) -> None:
+    """Build the multi-sheet Excel report from the sink's segment files.
+
+    `sections` maps extra sheet names to their rows, for data that is not a
+    metric series (pipeline counters, summaries, ...).
+    """
+    # pandas/openpyxl are only needed here, at the end of a call; keep them
+    # off the worker's startup path
+    import pandas as pd
+
+    counts = {}
+    with pd.ExcelWriter(filename, engine="openpyxl") as writer:
+        for kind, (sheet_name, colour) in SHEETS.items():
+            records = [export_row(kind, record) for record in sink.read(kind)]
+            counts[kind] = len(records)
+            if not records:
+                continue
+            pd.DataFrame(records).to_excel(writer, sheet_name=sheet_name, index=False)
+            console.print(f"[{colour}]✅ Saved {len(records)} {kind.upper()} metrics records[/{colour}]")
+
+        # Create summary sheet
+        summary_data = {
+            "Metric Type": [kind.upper() for kind in SHEETS],
+            "Total Records": [counts[kind] for kind in SHEETS],
+            "Report Generated": [datetime.now().strftime("%Y-%m-%d %H:%M:%S")] * len(SHEETS),
+            "Configuration Notes": [CONFIGURATION_NOTES[kind] for kind in SHEETS],
+        }
+        pd.DataFrame(summary_data).to_excel(writer, sheet_name="Summary", index=False)
+
+        for sheet_name, rows in (sections or {}).items():
+            if rows:
+                pd.DataFrame(rows).to_excel(writer, sheet_name=sheet_name, index=False)
@@ -0,0 +1,495 @@
+"""
+Latency-aware routing, failover and hedging across provider pools.
+
+A pool is a set of interchangeable backends (for example two LLM models, or
+Cartesia plus a second TTS voice at the same sample rate):
+
+    router = LatencyRouter(["openai:gpt-4o-mini", "openai:gpt-4.1-mini"])
+    llm = RoutingLLM({"openai:gpt-4o-mini": ..., "openai:gpt-4.1-mini": ...}, router)
+
+Every request is sent to the backend with the lowest recent TTFT/TTFB (p50
+over the last `window` seconds). A backend without recent samples ranks
+first, so it is probed again once per window. Errors before the first
+chunk fail over to the next backend. Consecutive errors take a backend out
+of rotation for a growing cooldown. If the chosen backend has not produced
+its first chunk by the hedge deadline (its recent p95, clamped, or a fixed
+delay), the request is also sent to the next backend and the first one to
+answer wins. The loser is cancelled.
+
+The router ranks backends on the TTFT/TTFB of the attempts that answered.
+A cancelled loser is only counted as a lower bound (it was at least as slow
+as the winner), kept apart from the latency samples, and does not change
+its health. A backend that only lost lately is ranked by that bound. Each request also
+emits a `RoutingMetrics` record (backend, TTFT, hedged, failovers) into the
+metrics pipeline.
+
+With the process job executor every call runs in its own process, and a
+router that only knew its own call would probe every unmeasured backend and
+hedge at the maximum delay until it had samples of its own. A
+`SharedRouterState` lets the routers of one pool in different processes learn
+from each other. At most once per `interval`, each process writes its recent
+latency window, lost-attempt bound and cooldown per backend to a file of its
+own (off the event loop). It reads the other processes' files back and merges
+their windows into ranking and hedge deadlines. Cooldowns are honoured
+everywhere. Files older than the window are ignored and eventually removed.
+
+STT is a continuous stream and cannot be hedged. STT pools use livekit's
+`stt.FallbackAdapter` for failover (see agent/providers.py).
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions, llm, tts
+
+from agent.sketch import LatencySketch, RollingSketch
+
+logger = logging.getLogger("provider-router")
+
+
+@dataclass
+class RoutingMetrics:
+    """Which backend served one LLM/TTS request and how"""
+
+    kind: str
+    backend: str
+    ttft: float
+    hedged: bool
+    failovers: int
+    label: str = ""
+    timestamp: float = field(default_factory=time.time)
+    type: str = "routing_metrics"
+
+
+def routing_summary(store) -> List[str]:
+    """Final-summary line: which backends served this session (agent/store.py)"""
+    records = list(store.rows("routing"))
+    served: Dict[str, int] = {}
+    for record in records:
+        served[record["backend"]] = served.get(record["backend"], 0) + 1
+    hedged = sum(1 for record in records if record["hedged"])
+    failovers = sum(record["failovers"] for record in records)
+    return [
+        f"  • Routing: {', '.join(f'{name} {count}' for name, count in served.items()) or 'no requests'}; "
+        f"{hedged} hedged, {failovers} failovers"
+    ]
+
+
+class BackendHealth:
+    def __init__(self, name: str, window: float) -> None:
+        self.name = name
+        self.window = window
+        self.latency = RollingSketch(slot_seconds=max(1.0, window / 6), horizon_seconds=window)
+        self.requests = 0
+        # attempts cancelled because another backend answered first
+        self.lost = 0
+        # latest censored sample of a lost attempt: (lower bound, when)
+        self.lost_bound = (0.0, 0.0)
+        self.wins = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.down_until = 0.0
+        # what the other processes sharing this pool reported (SharedRouterState)
+        self.shared = LatencySketch()
+        self.shared_lost_bound = (0.0, 0.0)
+        self.shared_down_until = 0.0
+
+    def recent(self, now: Optional[float] = None):
+        """This process's latency window merged with the other processes' ones"""
+        recent = self.latency.window(self.window, now)
+        recent.merge(self.shared)
+        return recent
+
+    def latest_lost_bound(self) -> Tuple[float, float]:
+        return max(self.lost_bound, self.shared_lost_bound, key=lambda bound: bound[1])
+
+    def unavailable_until(self) -> float:
+        return max(self.down_until, self.shared_down_until)
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unavailable_until()
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        """This process's own state, for SharedRouterState"""
+        return {
+            "latency": self.latency.window(self.window, now).to_dict(),
+            "lost_bound": list(self.lost_bound),
+            "down_until": self.down_until,
+        }
+
+
+class SharedRouterState:
+    """Latency windows and cooldowns of one pool, exchanged with other processes through files"""
+
+    def __init__(self, directory: Path, pool: str, *, interval: float = 1.0, member: str = "") -> None:
+        self.directory = Path(directory) / pool
+        self.interval = interval
+        self.path = self.directory / f"{member or os.getpid()}.json"
+        self.synced_at = 0.0
+
+    def due(self, now: float) -> bool:
+        return now - self.synced_at >= self.interval
+
+    async def sync(self, router: "LatencyRouter") -> None:
+        """Publish this process's state and merge the others' (file I/O on a thread)"""
+        now = time.time()
+        self.synced_at = now
+        snapshot = {
+            "written_at": now,
+            "backends": {name: health.snapshot(now) for name, health in router.health.items()},
+        }
+        try:
+            peers = await asyncio.to_thread(self.exchange, snapshot, router.window)
+        except OSError as e:
+            logger.warning(f"could not share router state in {self.directory}: {e}")
+            return
+        router.merge_shared(peers)
+
+    def exchange(self, snapshot: Dict[str, Any], window: float) -> List[Dict[str, Any]]:
+        """Write our snapshot, return the fresh snapshots of the other processes"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(snapshot), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+        now = snapshot["written_at"]
+        peers = []
+        for path in self.directory.glob("*.json"):
+            if path == self.path:
+                continue
+            try:
+                peer = json.loads(path.read_bytes())
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                # being replaced right now, or torn: skip it this round
+                continue
+            cooling = any(backend.get("down_until", 0.0) > now for backend in peer.get("backends", {}).values())
+            if now - peer.get("written_at", 0.0) > window and not cooling:
+                # that process is gone (or idle): its window has aged out
+                path.unlink(missing_ok=True)
+                continue
+            peers.append(peer)
+        return peers
+
+
+class LatencyRouter:
+    def __init__(
+        self,
+        backends: Sequence[str],
+        *,
+        window: float = 60.0,
+        cooldown: float = 30.0,
+        hedge_after: float = 0.0,
+        hedge_min: float = 0.3,
+        hedge_max: float = 2.0,
+        shared: Optional[SharedRouterState] = None,
+    ) -> None:
+        if not backends:
+            raise ValueError("a provider pool needs at least one backend")
+        self.health: Dict[str, BackendHealth] = {name: BackendHealth(name, window) for name in backends}
+        self.window = window
+        self.shared = shared
+        self.cooldown = cooldown
+        self.hedge_after = hedge_after
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+
+    def ranked(self, now: Optional[float] = None) -> List[str]:
+        """Healthy backends fastest first (unmeasured ones first), then the rest"""
+        now = time.time() if now is None else now
+
+        def score(health: BackendHealth) -> Tuple[int, float, float]:
+            recent = health.recent(now)
+            if recent.count:
+                p50 = recent.quantile(0.5)
+            else:
+                # never answered lately: rank by what its lost attempts showed, else probe it first
+                bound, at = health.latest_lost_bound()
+                p50 = bound if now - at <= health.window else 0.0
+            return (0 if health.healthy(now) else 1, p50, health.unavailable_until())
+
+        return [health.name for health in sorted(self.health.values(), key=score)]
+
+    def hedge_delay(self, name: str) -> float:
+        if self.hedge_after > 0:
+            return self.hedge_after
+        recent = self.health[name].recent()
+        if recent.count < 5:
+            return self.hedge_max
+        return min(self.hedge_max, max(self.hedge_min, recent.quantile(0.95)))
+
+    def observe(self, name: str, seconds: float) -> None:
+        health = self.health[name]
+        health.latency.add(seconds)
+        health.consecutive_errors = 0
+        health.down_until = 0.0
+
+    def observe_lost(self, name: str, elapsed: float, winner: float) -> None:
+        """A cancelled loser: at least max(elapsed, winner) slow; not a ranking sample, health unchanged"""
+        health = self.health[name]
+        health.lost += 1
+        health.lost_bound = (max(elapsed, winner), time.time())
+
+    def failure(self, name: str) -> None:
+        health = self.health[name]
+        health.errors += 1
+        health.consecutive_errors += 1
+        if health.consecutive_errors >= 2:
+            # 30s, 60s, 120s, ... while it keeps failing
+            health.down_until = time.time() + self.cooldown * 2 ** (health.consecutive_errors - 2)
+            logger.warning(f"backend {name} taken out of rotation after {health.consecutive_errors} errors")
+
+    async def sync(self) -> None:
+        """Exchange state with the other processes sharing this pool, if due"""
+        if self.shared is not None and self.shared.due(time.time()):
+            await self.shared.sync(self)
+
+    def merge_shared(self, peers: List[Dict[str, Any]]) -> None:
+        """Replace what other processes reported with these snapshots"""
+        for name, health in self.health.items():
+            merged = LatencySketch()
+            lost_bound = (0.0, 0.0)
+            down_until = 0.0
+            for peer in peers:
+                backend = peer.get("backends", {}).get(name)
+                if backend is None:
+                    continue
+                merged.merge(LatencySketch.from_dict(backend["latency"]))
+                lost_bound = max(lost_bound, tuple(backend["lost_bound"]), key=lambda bound: bound[1])
+                down_until = max(down_until, backend["down_until"])
+            health.shared = merged
+            health.shared_lost_bound = lost_bound
+            health.shared_down_until = down_until
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Per-backend state, for reports"""
+        now = time.time()
+        rows = []
+        for health in self.health.values():
+            recent = health.recent(now)
+            rows.append({
+                "backend": health.name,
+                "healthy": health.healthy(now),
+                "requests": health.requests,
+                "wins": health.wins,
+                "errors": health.errors,
+                "lost": health.lost,
+                "p50": round(recent.quantile(0.5), 4) if recent.count else None,
+                "p95": round(recent.quantile(0.95), 4) if recent.count else None,
+                "samples": recent.count,
+            })
+        return rows
+
+
+async def race(
+    router: LatencyRouter,
+    attempt: Callable[[str], AsyncIterator[Any]],
+    *,
+    max_hedges: int = 1,
+) -> Tuple[str, Any, AsyncIterator[Any], float, bool, int]:
+    """Run `attempt(backend)` on the best backend, failing over and hedging as needed.
+
+    Returns (backend, first item, iterator for the rest, time to first item,
+    hedged, failovers). The first item is None for an empty stream.
+    """
+    await router.sync()
+    candidates = router.ranked()
+    running: Dict[asyncio.Task, Tuple[str, AsyncIterator[Any], float]] = {}
+    start = time.perf_counter()
+    hedges = 0
+    failovers = 0
+    last_error: Optional[BaseException] = None
+
+    def launch() -> Tuple[str, float]:
+        name = candidates.pop(0)
+        iterator = attempt(name)
+        router.health[name].requests += 1
+        started = time.perf_counter()
+        running[asyncio.ensure_future(iterator.__anext__())] = (name, iterator, started)
+        return name, started
+
+    primary, primary_started = launch()
+    winner_time = 0.0
+    try:
+        while running:
+            timeout = None
+            if candidates and hedges < max_hedges:
+                timeout = max(0.0, primary_started + router.hedge_delay(primary) - time.perf_counter())
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # the primary is late: send the request to the next backend as well
+                hedges += 1
+                launch()
+                continue
+
+            for task in done:
+                name, iterator, started = running.pop(task)
+                error = task.exception()
+                if error is None or isinstance(error, StopAsyncIteration):
+                    winner_time = time.perf_counter() - started
+                    router.observe(name, winner_time)
+                    router.health[name].wins += 1
+                    first = None if error is not None else task.result()
+                    return name, first, iterator, time.perf_counter() - start, hedges > 0, failovers
+                logger.warning(f"backend {name} failed before its first chunk: {error}")
+                router.failure(name)
+                last_error = error
+                failovers += 1
+            if not running and candidates:
+                primary, primary_started = launch()
+        raise last_error
+    finally:
+        # losers only tell us they were slower than the winner
+        for task, (name, iterator, started) in running.items():
+            task.cancel()
+            router.observe_lost(name, time.perf_counter() - started, winner_time)
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+
+# -- LLM ----------------------------------------------------------------------
+
+
+class RoutingLLM(llm.LLM):
+    def __init__(self, backends: Dict[str, llm.LLM], router: LatencyRouter, *, max_hedges: int = 1) -> None:
+        super().__init__()
+        self.backends = backends
+        self.router = router
+        self.max_hedges = max_hedges
+
+    @property
+    def label(self) -> str:
+        return "routing.LLM"
+
+    @property
+    def model(self) -> str:
+        return "+".join(self.backends)
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools=None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        **kwargs,
+    ) -> "RoutingLLMStream":
+        return RoutingLLMStream(
+            self,
+            chat_ctx=chat_ctx,
+            tools=tools or [],
+            # failover replaces retries of the whole request
+            conn_options=APIConnectOptions(max_retry=0, timeout=conn_options.timeout),
+            inner_conn_options=conn_options,
+            chat_kwargs=kwargs,
+        )
+
+    async def aclose(self) -> None:
+        for backend in self.backends.values():
+            await backend.aclose()
+
+
+class RoutingLLMStream(llm.LLMStream):
+    def __init__(self, routing_llm: RoutingLLM, *, inner_conn_options, chat_kwargs, **kwargs) -> None:
+        super().__init__(routing_llm, **kwargs)
+        self._inner_conn_options = inner_conn_options
+        self._chat_kwargs = chat_kwargs
+
+    async def _attempt(self, name: str):
+        backend = self._llm.backends[name]
+        # no retries per backend: a failure moves on to the next one
+        async with backend.chat(
+            chat_ctx=self._chat_ctx,
+            tools=self._tools,
+            conn_options=APIConnectOptions(max_retry=0, timeout=self._inner_conn_options.timeout),
+            **self._chat_kwargs,
+        ) as stream:
+            async for chunk in stream:
+                yield chunk
+
+    async def _run(self) -> None:
+        owner: RoutingLLM = self._llm
+        name, first, rest, ttft, hedged, failovers = await race(owner.router, self._attempt, max_hedges=owner.max_hedges)
+        owner.emit("routing_metrics", RoutingMetrics(
+            kind="llm", backend=name, ttft=ttft, hedged=hedged, failovers=failovers, label=owner.label,
+        ))
+        if first is None:
+            return
+        self._event_ch.send_nowait(first)
+        async for chunk in rest:
+            self._event_ch.send_nowait(chunk)
+
+
+# -- TTS ----------------------------------------------------------------------
+
+
+class RoutingTTS(tts.TTS):
+    """Per-sentence routing; the session wraps it in a StreamAdapter"""
+
+    def __init__(self, backends: Dict[str, tts.TTS], router: LatencyRouter, *, max_hedges: int = 1) -> None:
+        rates = {backend.sample_rate for backend in backends.values()}
+        channels = {backend.num_channels for backend in backends.values()}
+        if len(rates) != 1 or len(channels) != 1:
+            raise ValueError("all TTS backends in a pool must share sample rate and channel count")
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=False),
+            sample_rate=rates.pop(),
+            num_channels=channels.pop(),
+        )
+        self.backends = backends
+        self.router = router
+        self.max_hedges = max_hedges
+
+    @property
+    def label(self) -> str:
+        return "routing.TTS"
+
+    @property
+    def model(self) -> str:
+        return "+".join(self.backends)
+
+    def synthesize(self, text: str, *, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS):
+        return RoutingChunkedStream(
+            tts=self,
+            input_text=text,
+            conn_options=APIConnectOptions(max_retry=0, timeout=conn_options.timeout),
+        )
+
+    async def aclose(self) -> None:
+        for backend in self.backends.values():
+            await backend.aclose()
+
+
+class RoutingChunkedStream(tts.ChunkedStream):
+    async def _attempt(self, name: str):
+        backend = self._tts.backends[name]
+        async with backend.synthesize(
+            self._input_text,
+            conn_options=APIConnectOptions(max_retry=0, timeout=self._conn_options.timeout),
+        ) as stream:
+            async for audio in stream:
+                yield audio
+
+    async def _run(self, output_emitter) -> None:
+        owner: RoutingTTS = self._tts
+        name, first, rest, ttfb, hedged, failovers = await race(owner.router, self._attempt, max_hedges=owner.max_hedges)
+        owner.emit("routing_metrics", RoutingMetrics(
+            kind="tts", backend=name, ttft=ttfb, hedged=hedged, failovers=failovers, label=owner.label,
+        ))
+        output_emitter.initialize(
+            request_id=first.request_id if first is not None else name,
+            sample_rate=owner.sample_rate,
+            num_channels=owner.num_channels,
+            mime_type="audio/pcm",
+        )
+        if first is not None:
+            output_emitter.push(first.frame.data.tobytes())
+            async for audio in rest:
+                output_emitter.push(audio.frame.data.tobytes())
+        output_emitter.flush()
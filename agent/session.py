@@ -0,0 +1,88 @@
+"""
+AgentSession wiring shared by the worker entrypoint and the offline load test.
+"""
+import time
+from typing import Optional
+
+from livekit.agents import AgentSession, MetricsCollectedEvent
+from rich.console import Console
+
+from agent import settings
+from agent.agent import MetricsAgent
+from agent.loop_monitor import LoopMonitor
+
+console = Console()
+
+
+def create_session(
+    metrics_agent: MetricsAgent,
+    *,
+    turn_detection,
+    job_start: Optional[float] = None,
+    **session_options,
+) -> AgentSession:
+    """Build the AgentSession for `metrics_agent` and hook up metrics collection.
+
+    `job_start` (a `time.perf_counter()` value) enables the time-to-first-
+    greeting measurement, recorded in `metrics_agent.startup`.
+    """
+    # Create session with turn detection configured for EOU metrics
+    session = AgentSession(
+        stt=metrics_agent.stt,
+        llm=metrics_agent.llm,
+        tts=metrics_agent.tts,
+        vad=metrics_agent.vad,
+        turn_detection=turn_detection,
+        **session_options,
+    )
+
+    if settings.LOOP_MONITOR_ENABLED:
+        # Loop lag and handler durations; the handlers below are timed
+        metrics_agent.loop_monitor = LoopMonitor.for_running_loop()
+        metrics_agent.loop_monitor.subscribe(metrics_agent)
+    timed = metrics_agent.timed
+
+    # Set up metrics collection from the session (this is the key fix!)
+    # Only enqueue here: rendering and persistence happen on the writer thread
+    @session.on("metrics_collected")
+    @timed("session.metrics_collected")
+    def _on_metrics_collected(ev: MetricsCollectedEvent):
+        metrics_agent.submit_metrics(ev.metrics)
+
+    if metrics_agent.trace is not None:
+        # VAD, agent state and reply tracks of the session timeline
+        session.on("user_state_changed", timed("session.user_state_changed")(metrics_agent.trace.on_user_state))
+        session.on("agent_state_changed", timed("session.agent_state_changed.trace")(metrics_agent.trace.on_agent_state))
+        session.on("speech_created", timed("session.speech_created")(metrics_agent.trace.on_speech_created))
+
+    if metrics_agent.speculative_llm is not None:
+        # Start the LLM on transcripts while the turn detector is still deciding
+        @session.on("user_input_transcribed")
+        @timed("session.user_input_transcribed")
+        def _on_user_input_transcribed(ev):
+            metrics_agent.speculative_llm.on_transcript(
+                ev.transcript, ev.is_final, metrics_agent.chat_ctx, list(metrics_agent.tools)
+            )
+
+    if metrics_agent.context is not None:
+        # Summarize old turns between turns, off the LLM request path
+        @session.on("agent_state_changed")
+        @timed("session.agent_state_changed.context")
+        def _on_agent_listening(ev):
+            if ev.new_state == "listening":
+                metrics_agent.context.schedule()
+
+    if job_start is not None:
+        # Time to first greeting: job start until the agent first starts speaking
+        @session.on("agent_state_changed")
+        @timed("session.agent_state_changed.greeting")
+        def _on_agent_state_changed(ev):
+            if ev.new_state == "speaking" and "time_to_first_greeting" not in metrics_agent.startup:
+                metrics_agent.startup["time_to_first_greeting"] = round(time.perf_counter() - job_start, 4)
+                path = "warm" if metrics_agent.startup.get("prewarmed") else "cold"
+                console.print(
+                    f"[bold magenta]⏱️  Time to first greeting ({path}): "
+                    f"{metrics_agent.startup['time_to_first_greeting']:.2f}s[/bold magenta]"
+                )
+
+    return session
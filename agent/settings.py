@@ -0,0 +1,158 @@
+"""
+Runtime settings for the agent, read from the environment (and .env)
+"""
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def env_str(name: str, default: str) -> str:
+    value = os.getenv(name)
+    return value if value not in (None, "") else default
+
+
+# Where per-session metric segments and Excel exports are written
+METRICS_DIR = Path(env_str("METRICS_DIR", "metrics_reports"))
+
+# Free-form tag stored with each session (e.g. "baseline", "gpt-4.1-trial"),
+# so the analytics CLI can compare configurations
+METRICS_CONFIG_LABEL = env_str("METRICS_CONFIG_LABEL", "")
+
+# Records per JSONL segment file before the sink rolls to a new one
+METRICS_SEGMENT_RECORDS = env_int("METRICS_SEGMENT_RECORDS", 5000)
+
+# Bounded queue between the session callback and the background metrics writer
+METRICS_QUEUE_SIZE = env_int("METRICS_QUEUE_SIZE", 1000)
+# What to do when the queue is full: drop | sample | block
+METRICS_OVERFLOW_POLICY = env_str("METRICS_OVERFLOW_POLICY", "drop")
+# With the "sample" policy, keep one record in N once the queue is half full
+METRICS_SAMPLE_EVERY = env_int("METRICS_SAMPLE_EVERY", 10)
+# With the "block" policy, the longest the callback may wait for queue space
+METRICS_BLOCK_TIMEOUT = env_float("METRICS_BLOCK_TIMEOUT", 0.05)
+
+# Rows per preallocated chunk in the in-memory columnar metrics store
+METRICS_STORE_CHUNK = env_int("METRICS_STORE_CHUNK", 1024)
+
+# How the worker runs jobs: "process" (one job per process) or "thread"
+# (concurrent jobs share one process, and with it the prewarmed models)
+AGENT_JOB_EXECUTOR = env_str("AGENT_JOB_EXECUTOR", "process")
+# Prewarmed job processes kept ready for incoming calls (unset: LiveKit default)
+AGENT_IDLE_PROCESSES = env_int("AGENT_IDLE_PROCESSES", 0) or None
+
+# Partial turns (EOU/LLM/TTS not yet joined on speech_id) kept before eviction
+TURN_MAX_PENDING = env_int("TURN_MAX_PENDING", 64)
+TURN_TTL_SECONDS = env_float("TURN_TTL_SECONDS", 30.0)
+
+# Slot width of the rolling percentile sketches (1m and 15m windows are
+# built from these slots)
+LATENCY_SLOT_SECONDS = env_float("LATENCY_SLOT_SECONDS", 15.0)
+
+# Per-session Chrome/Perfetto timeline (trace.json in the session directory):
+# fraction of sessions traced (0 turns it off) and spans kept per session
+TRACE_SAMPLE_RATE = env_float("TRACE_SAMPLE_RATE", 1.0)
+TRACE_MAX_EVENTS = env_int("TRACE_MAX_EVENTS", 20000)
+
+# Admission control (agent/admission.py): the worker reports the load it
+# would have with one more session and takes no jobs at or above this
+WORKER_LOAD_THRESHOLD = env_float("WORKER_LOAD_THRESHOLD", 0.75)
+# Hard cap on concurrent jobs per worker (0: CPU-based only)
+WORKER_MAX_JOBS = env_int("WORKER_MAX_JOBS", 0)
+# Machine CPU (0..1) at session start above which the session gets lighter
+# noise cancellation ("reduced"), or none and VAD-only endpointing ("minimal")
+DEGRADE_REDUCED_CPU = env_float("DEGRADE_REDUCED_CPU", 0.6)
+DEGRADE_MINIMAL_CPU = env_float("DEGRADE_MINIMAL_CPU", 0.8)
+# Force a processing level (full | reduced | minimal) instead of "auto"
+AGENT_PROCESSING_LEVEL = env_str("AGENT_PROCESSING_LEVEL", "auto")
+# How often each session records its CPU / real-time factor
+LOAD_SAMPLE_SECONDS = env_float("LOAD_SAMPLE_SECONDS", 10.0)
+
+# Event-loop monitor: lag sampling, a watchdog that logs the stack of a
+# blocked loop, and per-callback timing for session/room event handlers
+LOOP_MONITOR_ENABLED = env_int("LOOP_MONITOR_ENABLED", 1) == 1
+LOOP_SAMPLE_INTERVAL_MS = env_float("LOOP_SAMPLE_INTERVAL_MS", 50.0)
+# Lag above this is a stall (recorded with a stack sample)
+LOOP_STALL_MS = env_float("LOOP_STALL_MS", 100.0)
+# Event handlers running longer than this are recorded
+CALLBACK_SLOW_MS = env_float("CALLBACK_SLOW_MS", 20.0)
+LOOP_STACK_DEPTH = env_int("LOOP_STACK_DEPTH", 20)
+
+# Console output for metric events: live | log | table | off
+METRICS_DISPLAY = env_str("METRICS_DISPLAY", "table")
+# Refresh rate of the live panel (METRICS_DISPLAY=live)
+METRICS_LIVE_REFRESH = env_float("METRICS_LIVE_REFRESH", 2.0)
+
+# Prometheus/OpenMetrics endpoint inside the worker (0 disables it)
+METRICS_EXPORTER_PORT = env_int("METRICS_EXPORTER_PORT", 0)
+METRICS_EXPORTER_HOST = env_str("METRICS_EXPORTER_HOST", "0.0.0.0")
+# Rooms whose series are kept; older rooms are dropped from the exporter
+METRICS_EXPORTER_MAX_ROOMS = env_int("METRICS_EXPORTER_MAX_ROOMS", 500)
+
+# Fixed greeting, played from the phrase cache instead of an LLM round trip
+AGENT_GREETING = env_str(
+    "AGENT_GREETING",
+    "Hello! I'm your AI assistant with real-time performance monitoring and Excel reporting. "
+    "How can I help you today?",
+)
+# Synthesized phrase audio (raw PCM) shared by all calls, LRU-evicted above the cap
+PHRASE_CACHE_DIR = Path(env_str("PHRASE_CACHE_DIR", "phrase_cache"))
+PHRASE_CACHE_MAX_MB = env_float("PHRASE_CACHE_MAX_MB", 64.0)
+
+# Optional response cache in front of the LLM for repeated questions
+LLM_CACHE_ENABLED = env_int("LLM_CACHE_ENABLED", 0) == 1
+# One JSON file per cached completion, shared by all job processes
+LLM_CACHE_DIR = Path(env_str("LLM_CACHE_DIR", "llm_cache"))
+LLM_CACHE_TTL_SECONDS = env_float("LLM_CACHE_TTL_SECONDS", 3600.0)
+LLM_CACHE_MAX_ENTRIES = env_int("LLM_CACHE_MAX_ENTRIES", 1000)
+LLM_CACHE_MAX_KB = env_float("LLM_CACHE_MAX_KB", 4096.0)
+# Previous exchanges (user + assistant) that are part of the cache key
+LLM_CACHE_CONTEXT_TURNS = env_int("LLM_CACHE_CONTEXT_TURNS", 1)
+# "room": answers are only replayed in the room they were given in; "shared":
+# to every caller on the host (only for prompts with nothing personal in them)
+LLM_CACHE_SCOPE = env_str("LLM_CACHE_SCOPE", "room")
+
+# Start the LLM on transcripts before end-of-utterance (costs tokens on misses)
+SPECULATIVE_LLM_ENABLED = env_int("SPECULATIVE_LLM_ENABLED", 0) == 1
+# How long an interim transcript must stay unchanged before speculating
+SPECULATIVE_STABLE_MS = env_float("SPECULATIVE_STABLE_MS", 300.0)
+SPECULATIVE_MIN_WORDS = env_int("SPECULATIVE_MIN_WORDS", 2)
+
+# Estimated prompt tokens kept in the chat context before older turns are
+# folded into a rolling summary (0 keeps the full history)
+CONTEXT_TOKEN_BUDGET = env_int("CONTEXT_TOKEN_BUDGET", 0)
+# Most recent exchanges (user + assistant) always kept verbatim
+CONTEXT_KEEP_TURNS = env_int("CONTEXT_KEEP_TURNS", 4)
+
+# Provider pools, comma-separated `provider:model` specs (empty: the default
+# Deepgram / OpenAI / Cartesia setup). See agent/providers.py
+STT_POOL = env_str("STT_POOL", "")
+LLM_POOL = env_str("LLM_POOL", "")
+TTS_POOL = env_str("TTS_POOL", "")
+# Backends are ranked by their TTFT/TTFB over this window
+ROUTER_WINDOW_SECONDS = env_float("ROUTER_WINDOW_SECONDS", 60.0)
+# First time out of rotation after repeated errors (doubles while it keeps failing)
+ROUTER_COOLDOWN_SECONDS = env_float("ROUTER_COOLDOWN_SECONDS", 30.0)
+# Routers of the same pool in different job processes share latency windows
+# and cooldowns through files here, exchanged at most every ROUTER_SYNC_SECONDS
+# (0 keeps each process to its own observations)
+ROUTER_STATE_DIR = Path(env_str("ROUTER_STATE_DIR", "router_state"))
+ROUTER_SYNC_SECONDS = env_float("ROUTER_SYNC_SECONDS", 1.0)
+# Send a slow request to the next backend as well after this delay
+# (0: the backend's recent p95, clamped to HEDGE_MIN_MS..HEDGE_MAX_MS)
+HEDGE_AFTER_MS = env_float("HEDGE_AFTER_MS", 0.0)
+HEDGE_MIN_MS = env_float("HEDGE_MIN_MS", 300.0)
+HEDGE_MAX_MS = env_float("HEDGE_MAX_MS", 2000.0)
+# Extra backends a single request may be hedged to (0 disables hedging)
+HEDGE_MAX = env_int("HEDGE_MAX", 1)
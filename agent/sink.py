@@ -0,0 +1,89 @@
+"""
+Append-only streaming sink for metric records.
+
+Each metric type ("llm", "tts", "stt", "eou", ...) gets its own series of
+rolling JSONL segment files inside the session directory:
+
+    metrics_reports/agent_metrics_20250610_112109/
+        llm_00000.jsonl
+        llm_00001.jsonl
+        tts_00000.jsonl
+        ...
+        session.json        (models and configuration, for agent/analytics.py)
+        latency.json        (latency sketch buckets, written when the session ends)
+
+Appending a record is a single buffered line write, so the cost per record
+stays constant no matter how long the call runs. Reports are built from the
+segments afterwards (see agent/report.py).
+"""
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, TextIO
+
+
+class MetricsSink:
+    def __init__(self, directory: Path, max_records_per_segment: int = 5000) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_records_per_segment = max_records_per_segment
+
+        self._files: Dict[str, TextIO] = {}
+        self._segment_index: Dict[str, int] = {}
+        self._segment_records: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+
+    def _segment_path(self, kind: str, index: int) -> Path:
+        return self.directory / f"{kind}_{index:05d}.jsonl"
+
+    def _roll(self, kind: str) -> TextIO:
+        """Close the current segment for `kind` (if any) and open the next one"""
+        current = self._files.pop(kind, None)
+        if current is not None:
+            current.close()
+            self._segment_index[kind] += 1
+        self._segment_index.setdefault(kind, 0)
+
+        fp = open(self._segment_path(kind, self._segment_index[kind]), "a", encoding="utf-8")
+        self._files[kind] = fp
+        self._segment_records[kind] = 0
+        return fp
+
+    def append(self, kind: str, record: dict) -> None:
+        """Append one record to the current segment of its metric type"""
+        fp = self._files.get(kind)
+        if fp is None or self._segment_records[kind] >= self.max_records_per_segment:
+            fp = self._roll(kind)
+
+        fp.write(json.dumps(record, default=str, separators=(",", ":")))
+        fp.write("\n")
+        fp.flush()
+        self._segment_records[kind] += 1
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def write_manifest(self, manifest: dict) -> None:
+        """Describe the session (models, configuration) next to its segments"""
+        path = self.directory / "session.json"
+        path.write_text(json.dumps(manifest, default=str, indent=2), encoding="utf-8")
+
+    def write_latency(self, sketches: dict) -> None:
+        """Store the session's latency sketch buckets (merged across sessions by agent/analytics.py)"""
+        path = self.directory / "latency.json"
+        path.write_text(json.dumps(sketches, separators=(",", ":")), encoding="utf-8")
+
+    def segments(self, kind: str) -> List[Path]:
+        return sorted(self.directory.glob(f"{kind}_*.jsonl"))
+
+    def read(self, kind: str) -> Iterator[dict]:
+        """Yield every record written for `kind`, oldest first"""
+        for path in self.segments(kind):
+            with open(path, encoding="utf-8") as fp:
+                for line in fp:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def close(self) -> None:
+        """Close open segment files; a later append starts a fresh segment"""
+        for kind, fp in self._files.items():
+            fp.close()
+            self._segment_index[kind] += 1
+        self._files.clear()
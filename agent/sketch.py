@@ -0,0 +1,208 @@
+"""
+Streaming, mergeable latency percentiles.
+
+`LatencySketch` is a log-bucketed histogram in the spirit of HDR histograms
+and DDSketch: every value is counted in the bucket `ceil(log_gamma(v))`, so
+any quantile it reports is within `relative_accuracy` of the true value.
+Memory is bounded by the value range (about 1000 buckets for 1 ms .. 1 h at
+1% accuracy, far fewer in practice) and two sketches merge by adding their
+bucket counts.
+
+`RollingSketch` keeps a ring of per-slot sketches so p50/p95/p99 can be read
+over the last minute, the last 15 minutes and the whole session without
+storing raw values. `LatencyStats` holds one rolling sketch per latency
+field.
+
+Job processes come and go (one call each with the default executor), so
+sketches are not aggregated in memory. Each session writes the buckets of
+its whole-session sketches to `latency.json` in its metrics directory
+(`LatencyStats.to_dict`), and `python -m agent.analytics percentiles`
+merges them across any number of calls.
+"""
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Latency fields tracked per metric type (raw store field names)
+LATENCY_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "llm": ("ttft", "duration", "tokens_per_second"),
+    "tts": ("ttfb", "duration"),
+    "stt": ("duration",),
+    "eou": ("end_of_utterance_delay", "transcription_delay"),
+    "llm_cache": ("ttft_saved",),
+    "speculation": ("head_start",),
+    "turn": ("voice_to_voice",),
+}
+
+# Window name -> length in seconds (None means the whole session)
+WINDOWS = (("1m", 60.0), ("15m", 900.0), ("session", None))
+
+
+class LatencySketch:
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-4) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value <= self.min_value:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: "LatencySketch") -> None:
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+                return min(2 * self.gamma ** index / (self.gamma + 1), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Bucket counts and totals, JSON-serializable (see `from_dict`)"""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "min_value": self.min_value,
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencySketch":
+        sketch = cls(data["relative_accuracy"], data["min_value"])
+        sketch.buckets = {int(index): count for index, count in data["buckets"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.total = data["total"]
+        sketch.max = data["max"]
+        return sketch
+
+
+class RollingSketch:
+    """Per-slot sketches in a ring, plus a whole-session sketch"""
+
+    def __init__(self, slot_seconds: float = 15.0, horizon_seconds: float = 900.0) -> None:
+        self.slot_seconds = slot_seconds
+        self.num_slots = int(math.ceil(horizon_seconds / slot_seconds))
+        self._slots: List[Optional[Tuple[int, LatencySketch]]] = [None] * self.num_slots
+        self.session = LatencySketch()
+
+    def add(self, value: float, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        slot = int(now // self.slot_seconds)
+        entry = self._slots[slot % self.num_slots]
+        if entry is None or entry[0] != slot:
+            entry = (slot, LatencySketch())
+            self._slots[slot % self.num_slots] = entry
+        entry[1].add(value)
+        self.session.add(value)
+
+    def window(self, seconds: Optional[float], now: Optional[float] = None) -> LatencySketch:
+        if seconds is None:
+            return self.session
+        now = time.time() if now is None else now
+        current = int(now // self.slot_seconds)
+        oldest = current - max(1, int(math.ceil(seconds / self.slot_seconds))) + 1
+        merged = LatencySketch()
+        for entry in self._slots:
+            if entry is not None and oldest <= entry[0] <= current:
+                merged.merge(entry[1])
+        return merged
+
+
+class LatencyStats:
+    """One rolling sketch per (metric type, latency field).
+
+    Written on the metrics writer thread and read by reports and the live
+    panel's refresh thread, so every access goes through `lock`.
+    """
+
+    def __init__(self, slot_seconds: float = 15.0) -> None:
+        self.lock = threading.Lock()
+        self.sketches: Dict[Tuple[str, str], RollingSketch] = {
+            (kind, field): RollingSketch(slot_seconds)
+            for kind, fields in LATENCY_FIELDS.items()
+            for field in fields
+        }
+
+    def add(self, kind: str, record: Dict[str, float], now: Optional[float] = None) -> None:
+        with self.lock:
+            for field in LATENCY_FIELDS.get(kind, ()):
+                value = record.get(field)
+                if isinstance(value, (int, float)) and value >= 0:
+                    self.sketches[(kind, field)].add(float(value), now)
+
+    def window(self, seconds: Optional[float], now: Optional[float] = None) -> Dict[str, LatencySketch]:
+        """Merged sketch per field (`llm.ttft`, ...) over the last `seconds`, non-empty ones only"""
+        with self.lock:
+            merged = {f"{kind}.{field}": rolling.window(seconds, now) for (kind, field), rolling in self.sketches.items()}
+        return {metric: sketch for metric, sketch in merged.items() if sketch.count}
+
+    def rows(self, now: Optional[float] = None) -> List[Dict[str, object]]:
+        """p50/p95/p99 per field and window, for reports and dashboards"""
+        rows = []
+        with self.lock:
+            for (kind, field), rolling in self.sketches.items():
+                for window, seconds in WINDOWS:
+                    sketch = rolling.window(seconds, now)
+                    if not sketch.count:
+                        continue
+                    rows.append(_summary_row(f"{kind}.{field}", window, sketch))
+        return rows
+
+    def summary_lines(self) -> List[str]:
+        """Final-summary lines: session percentiles per latency field"""
+        return [
+            f"    - {row['metric']}: p50 {row['p50']}, p95 {row['p95']}, p99 {row['p99']} ({row['count']} samples)"
+            for row in self.rows()
+            if row["window"] == "session"
+        ]
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Whole-session sketch per field (`llm.ttft`, ...), for `latency.json`"""
+        return {metric: sketch.to_dict() for metric, sketch in self.window(None).items()}
+
+
+def _summary_row(metric: str, window: str, sketch: LatencySketch) -> Dict[str, object]:
+    row = {"metric": metric, "window": window, "count": sketch.count}
+    for q in QUANTILES:
+        row[f"p{int(q * 100)}"] = round(sketch.quantile(q), 4)
+    row["mean"] = round(sketch.mean, 4)
+    row["max"] = round(sketch.max, 4)
+    return row
@@ -0,0 +1,304 @@
+"""
+Speculative LLM generation on transcripts, before end-of-utterance.
+
+The LLM normally starts only after the turn detector commits the user's
+turn, so `end_of_utterance_delay` sits in front of every response.
+`SpeculativeLLM` wraps the session LLM and starts the request early:
+
+  * on every final transcript segment (the turn detector is still deciding)
+  * on an interim transcript that has not changed for `stable_seconds`
+
+The request runs in the background and its chunks are buffered. When the
+session asks for the real completion, the context is compared with the one
+the speculation used (normalized, like the response cache): if they match,
+the buffered chunks are replayed and the rest streams straight through; if
+not, the speculation is cancelled and a normal request is made. A final
+transcript that no longer matches cancels the speculation right away.
+
+A speculation answered from the response cache is only counted as a cache
+hit or miss once it is used (see `DeferredLookups` in agent/llm_cache.py).
+
+Each speculation produces a `SpeculationMetrics` record: hits with the head
+start they had, misses with the tokens they cost. Prompt and completion
+tokens of a request cancelled before its usage chunk are estimated.
+"""
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions, llm
+
+from agent.context import estimate_tokens
+from agent.llm_cache import SPECULATIVE_LOOKUPS, DeferredLookups, normalize
+
+
+def context_key(chat_ctx: llm.ChatContext) -> str:
+    """Normalized fingerprint of a whole chat context"""
+    parts = []
+    for item in chat_ctx.items:
+        if getattr(item, "type", None) == "message":
+            parts.append(f"{item.role}: {normalize(item.text_content)}")
+        else:
+            parts.append(f"{item.type}: {getattr(item, 'id', '')}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SpeculationMetrics:
+    """LLMMetrics-style record for one speculative request"""
+
+    label: str
+    request_id: str
+    hit: bool
+    # how long before the real request the speculation started
+    head_start: float
+    # real request until its first chunk was delivered (hits only)
+    ttft: float
+    wasted_prompt_tokens: int = 0
+    wasted_completion_tokens: int = 0
+    trigger: str = ""
+    timestamp: float = field(default_factory=time.time)
+    type: str = "speculation_metrics"
+
+
+def speculation_summary(store) -> List[str]:
+    """Final-summary line for the speculations of one session (agent/store.py)"""
+    records = list(store.rows("speculation"))
+    hits = [record for record in records if record["hit"]]
+    wasted = sum(r["wasted_prompt_tokens"] + r["wasted_completion_tokens"] for r in records)
+    head_start = sum(r["head_start"] for r in hits) / len(hits) if hits else 0.0
+    return [f"  • Speculation: {len(hits)}/{len(records)} hits, mean head start {head_start:.2f}s, {wasted} tokens wasted"]
+
+
+class _Speculation:
+    def __init__(self, key: str, text: str, trigger: str, prompt_estimate: int) -> None:
+        self.key = key
+        self.text = text
+        self.trigger = trigger
+        self.prompt_estimate = prompt_estimate
+        self.started_at = time.perf_counter()
+        self.chunks: List[llm.ChatChunk] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        # response cache lookups made by this request
+        self.lookups = DeferredLookups()
+
+    @property
+    def request_id(self) -> str:
+        return self.chunks[0].id if self.chunks else ""
+
+    def tokens(self):
+        """(prompt, completion) tokens spent so far"""
+        for chunk in reversed(self.chunks):
+            if chunk.usage is not None:
+                return chunk.usage.prompt_tokens, chunk.usage.completion_tokens
+        completion = sum(1 for chunk in self.chunks if chunk.delta is not None and chunk.delta.content)
+        return (self.prompt_estimate if self.chunks or not self.done else 0), completion
+
+
+class SpeculativeLLM(llm.LLM):
+    def __init__(self, inner: llm.LLM, *, stable_seconds: float = 0.3, min_words: int = 2) -> None:
+        super().__init__()
+        self.inner = inner
+        self.stable_seconds = stable_seconds
+        self.min_words = min_words
+
+        self._pending: Optional[_Speculation] = None
+        self._committed: List[str] = []
+        self._interim = ""
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def label(self) -> str:
+        return self.inner.label
+
+    @property
+    def model(self) -> str:
+        return getattr(self.inner, "model", "unknown")
+
+    # -- transcripts --------------------------------------------------------
+
+    def on_transcript(self, text: str, is_final: bool, chat_ctx: llm.ChatContext, tools=None) -> None:
+        """Feed `user_input_transcribed` events; `chat_ctx` is the agent's context so far"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if is_final:
+            if text.strip():
+                self._committed.append(text.strip())
+            self._interim = ""
+            self._speculate(" ".join(self._committed), chat_ctx, tools, "final")
+            return
+
+        candidate = " ".join(self._committed + [text.strip()])
+        if len(normalize(candidate).split()) < self.min_words or normalize(candidate) == self._interim:
+            return
+        self._interim = normalize(candidate)
+        self._timer = asyncio.get_running_loop().call_later(
+            self.stable_seconds, self._speculate, candidate, chat_ctx, tools, "stable_interim"
+        )
+
+    def _speculate(self, text: str, chat_ctx: llm.ChatContext, tools, trigger: str) -> None:
+        self._timer = None
+        if len(normalize(text).split()) < self.min_words:
+            return
+        if self._pending is not None:
+            if self._pending.text == normalize(text):
+                return
+            # the user kept talking or the transcript was revised
+            self._discard()
+
+        ctx = chat_ctx.copy()
+        ctx.add_message(role="user", content=text)
+        prompt_estimate = estimate_tokens(
+            " ".join(item.text_content or "" for item in ctx.items if getattr(item, "type", None) == "message")
+        )
+        spec = _Speculation(context_key(ctx), normalize(text), trigger, prompt_estimate)
+        spec.task = asyncio.create_task(self._run_speculation(spec, ctx, tools))
+        self._pending = spec
+
+    async def _run_speculation(self, spec: _Speculation, chat_ctx: llm.ChatContext, tools) -> None:
+        # this task's own context, so only the speculative request sees it
+        SPECULATIVE_LOOKUPS.set(spec.lookups)
+        try:
+            async with self.inner.chat(chat_ctx=chat_ctx, tools=tools or []) as stream:
+                async for chunk in stream:
+                    spec.chunks.append(chunk)
+                    spec.changed.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            spec.error = e
+        finally:
+            spec.done = True
+            spec.changed.set()
+
+    def _discard(self) -> None:
+        spec, self._pending = self._pending, None
+        if spec is None:
+            return
+        if spec.task is not None and not spec.done:
+            spec.task.cancel()
+        spec.lookups.drop()
+        prompt, completion = spec.tokens()
+        self.emit("speculation_metrics", SpeculationMetrics(
+            label=self.label,
+            request_id=spec.request_id,
+            hit=False,
+            head_start=0.0,
+            ttft=0.0,
+            wasted_prompt_tokens=prompt,
+            wasted_completion_tokens=completion,
+            trigger=spec.trigger,
+        ))
+
+    def _take(self, chat_ctx: llm.ChatContext) -> Optional[_Speculation]:
+        """The pending speculation if it was made for this context, else discard it"""
+        self._committed = []
+        self._interim = ""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        spec = self._pending
+        if spec is None:
+            return None
+        if spec.key != context_key(chat_ctx) or (spec.error is not None and not spec.chunks):
+            self._discard()
+            return None
+        self._pending = None
+        spec.lookups.release()
+        return spec
+
+    # -- completions --------------------------------------------------------
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools=None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        **kwargs,
+    ) -> "SpeculativeLLMStream":
+        return SpeculativeLLMStream(
+            self,
+            chat_ctx=chat_ctx,
+            tools=tools or [],
+            # the provider stream does its own retries
+            conn_options=APIConnectOptions(max_retry=0, timeout=conn_options.timeout),
+            speculation=self._take(chat_ctx),
+            inner_conn_options=conn_options,
+            chat_kwargs=kwargs,
+        )
+
+    async def cancel(self) -> None:
+        """Drop the stability timer and any pending speculation (recorded as wasted) when the call ends"""
+        self._committed = []
+        self._interim = ""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        spec = self._pending
+        self._discard()
+        if spec is not None and spec.task is not None:
+            await asyncio.gather(spec.task, return_exceptions=True)
+
+    async def aclose(self) -> None:
+        await self.cancel()
+        await self.inner.aclose()
+
+
+class SpeculativeLLMStream(llm.LLMStream):
+    def __init__(self, speculative_llm: SpeculativeLLM, *, speculation, inner_conn_options, chat_kwargs, **kwargs) -> None:
+        super().__init__(speculative_llm, **kwargs)
+        self._speculation: Optional[_Speculation] = speculation
+        self._inner_conn_options = inner_conn_options
+        self._chat_kwargs = chat_kwargs
+
+    async def _run(self) -> None:
+        owner: SpeculativeLLM = self._llm
+        spec = self._speculation
+        if spec is None:
+            async with owner.inner.chat(
+                chat_ctx=self._chat_ctx,
+                tools=self._tools,
+                conn_options=self._inner_conn_options,
+                **self._chat_kwargs,
+            ) as stream:
+                async for chunk in stream:
+                    self._event_ch.send_nowait(chunk)
+            return
+
+        start = time.perf_counter()
+        ttft = None
+        sent = 0
+        try:
+            while True:
+                while sent < len(spec.chunks):
+                    self._event_ch.send_nowait(spec.chunks[sent])
+                    sent += 1
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        owner.emit("speculation_metrics", SpeculationMetrics(
+                            label=owner.label,
+                            request_id=spec.request_id,
+                            hit=True,
+                            head_start=start - spec.started_at,
+                            ttft=ttft,
+                            trigger=spec.trigger,
+                        ))
+                if spec.done:
+                    break
+                spec.changed.clear()
+                await spec.changed.wait()
+        finally:
+            # an interrupted reply stops the speculative request too
+            if not spec.done and spec.task is not None:
+                spec.task.cancel()
+        if spec.error is not None:
+            raise spec.error
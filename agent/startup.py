@@ -0,0 +1,246 @@
+"""
+Worker startup profile: where a freshly spawned worker process spends its
+time before it can take a call.
+
+Each run starts a new interpreter (with `-X importtime`), loads the worker
+the way the LiveKit CLI does and times every phase:
+
+  * livekit-agents itself
+  * the agent modules
+  * the provider plugins of the configured pools (agent/providers.py)
+  * the rest of entry.py (noise cancellation, prewarm)
+  * `prewarm`, as the worker runs it in each new job process (VAD load,
+    agent/prewarm.py)
+  * MetricsAgent construction
+
+The turn detector is not timed: its model is loaded once per worker by the
+shared inference process, and a job only builds a client for it, which
+needs a running job's inference executor.
+
+The import log is folded into self time per top-level package. pandas and
+openpyxl are timed separately: the report imports them lazily, after the
+call, so they are not part of startup.
+
+    python -m agent.startup --runs 5
+    python -m agent.startup --fake --json startup.json --max-startup-seconds 3   # regression gate
+
+Exits with status 1 when the gate is exceeded. Module-level imports here are
+standard library only, so the profile is not skewed by this module.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Phases that are not on the path to the first call
+LAZY_PHASES = ("report deps (lazy)",)
+
+FAKE_POOLS = {"STT_POOL": "fake", "LLM_POOL": "fake", "TTS_POOL": "fake"}
+
+
+def _child() -> None:
+    """Runs in the profiled interpreter; prints one JSON line with the phase timings"""
+    phases: List[Dict[str, Any]] = []
+    state: Dict[str, Any] = {}
+
+    def phase(name: str, fn: Callable[[], Any]) -> None:
+        start = time.perf_counter()
+        error = None
+        try:
+            fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        phases.append({"phase": name, "seconds": time.perf_counter() - start, "error": error})
+
+    def load_plugins() -> None:
+        from agent.providers import import_plugins
+
+        state["plugins"] = import_plugins()
+
+    def run_prewarm() -> None:
+        from types import SimpleNamespace
+
+        from agent.prewarm import _models, prewarm
+
+        # the worker passes a JobProcess; prewarm only touches its userdata
+        prewarm(SimpleNamespace(userdata={}))
+        state["vad"] = _models.get("vad")
+
+    def build_agent() -> None:
+        from agent.agent import MetricsAgent
+
+        MetricsAgent(vad=state.get("vad")).writer.close()
+
+    def report_deps() -> None:
+        import openpyxl  # noqa: F401
+        import pandas  # noqa: F401
+
+    started_at = time.time()
+    phase("livekit-agents", lambda: __import__("livekit.agents"))
+    phase("agent modules", lambda: __import__("agent.agent"))
+    phase("provider plugins", load_plugins)
+    phase("entry.py", lambda: __import__("entry"))
+    phase("prewarm (VAD)", run_prewarm)
+    phase("MetricsAgent init", build_agent)
+    phase("report deps (lazy)", report_deps)
+    print(json.dumps({"started_at": started_at, "phases": phases, "plugins": state.get("plugins", [])}))
+
+
+def parse_importtime(log: str) -> Dict[str, float]:
+    """Self time in seconds per top-level package from a `-X importtime` log"""
+    packages: Dict[str, float] = defaultdict(float)
+    for line in log.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        packages[name.split(".")[0]] += int(parts[0]) / 1e6
+    return dict(packages)
+
+
+def profile_once(fake: bool = False) -> Dict[str, Any]:
+    env = dict(os.environ)
+    if fake:
+        env.update(FAKE_POOLS)
+    # keep the profiled agent's report files out of ./metrics_reports
+    env.setdefault("METRICS_DIR", str(Path(os.environ.get("TMPDIR", "/tmp")) / "startup_profile_metrics"))
+    env.setdefault("METRICS_DISPLAY", "off")
+
+    spawned_at = time.time()
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "agent.startup", "--child"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"profiled worker failed:\n{proc.stderr[-2000:]}")
+
+    result = json.loads(lines[-1])
+    phases = [{"phase": "interpreter", "seconds": max(0.0, result["started_at"] - spawned_at), "error": None}]
+    phases += result["phases"]
+    return {
+        "wall_seconds": wall,
+        "startup_seconds": sum(p["seconds"] for p in phases if p["phase"] not in LAZY_PHASES),
+        "phases": phases,
+        "packages": parse_importtime(proc.stderr),
+        "plugins": result["plugins"],
+    }
+
+
+def profile(runs: int = 3, fake: bool = False) -> Dict[str, Any]:
+    """Mean phase and package times over `runs` fresh processes"""
+    results = [profile_once(fake) for _ in range(runs)]
+    phase_times: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, Optional[str]] = {}
+    for result in results:
+        for row in result["phases"]:
+            phase_times[row["phase"]].append(row["seconds"])
+            errors[row["phase"]] = errors.get(row["phase"]) or row["error"]
+    package_times: Dict[str, List[float]] = defaultdict(list)
+    for result in results:
+        for name, seconds in result["packages"].items():
+            package_times[name].append(seconds)
+
+    startup = [result["startup_seconds"] for result in results]
+    return {
+        "runs": runs,
+        "providers": "fake" if fake else "configured",
+        "plugins": results[0]["plugins"],
+        "startup_seconds": {"mean": statistics.mean(startup), "min": min(startup), "max": max(startup)},
+        "phases": [
+            {"phase": name, "mean_seconds": round(statistics.mean(times), 4), "lazy": name in LAZY_PHASES,
+             "error": errors[name]}
+            for name, times in phase_times.items()
+        ],
+        "packages": sorted(
+            ({"package": name, "mean_seconds": round(sum(times) / runs, 4)} for name, times in package_times.items()),
+            key=lambda row: row["mean_seconds"],
+            reverse=True,
+        ),
+    }
+
+
+def print_profile(results: Dict[str, Any], top: int = 15) -> None:
+    from rich import box
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console()
+    table = Table(
+        title=f"[bold cyan]Worker Startup ({results['runs']} runs, {results['providers']} providers)[/bold cyan]",
+        box=box.ROUNDED,
+        show_header=True,
+        header_style="bold cyan",
+    )
+    table.add_column("Phase", style="bold green")
+    table.add_column("Mean", style="yellow")
+    table.add_column("Note", style="dim")
+    for row in results["phases"]:
+        note = "not on the startup path" if row["lazy"] else ""
+        if row["error"]:
+            note = f"[red]{row['error'][:80]}[/red]"
+        table.add_row(row["phase"], f"{row['mean_seconds']:.3f}s", note)
+    console.print(table)
+
+    table = Table(title="[bold cyan]Import self time by package[/bold cyan]", box=box.ROUNDED, header_style="bold cyan")
+    table.add_column("Package", style="bold green")
+    table.add_column("Mean", style="yellow")
+    for row in results["packages"][:top]:
+        table.add_row(row["package"], f"{row['mean_seconds']:.3f}s")
+    console.print(table)
+
+    startup = results["startup_seconds"]
+    console.print(
+        f"[bold green]Worker startup: {startup['mean']:.3f}s mean "
+        f"({startup['min']:.3f}s..{startup['max']:.3f}s); plugins: {', '.join(results['plugins']) or 'none'}[/bold green]"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Profile worker process startup (imports and initialization)")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes to average over")
+    parser.add_argument("--fake", action="store_true", help="use the fake providers (no API keys needed)")
+    parser.add_argument("--top", type=int, default=15, help="packages to list")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--max-startup-seconds", type=float, help="exit 1 if mean startup exceeds this")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child()
+        return 0
+
+    results = profile(args.runs, args.fake)
+    print_profile(results, args.top)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.max_startup_seconds is None:
+        return 0
+    # a phase that failed would make the number look better than it is
+    failed = [row["phase"] for row in results["phases"] if row["error"] and not row["lazy"]]
+    if failed:
+        print(f"FAIL: startup phases failed: {', '.join(failed)}")
+        return 1
+    if results["startup_seconds"]["mean"] > args.max_startup_seconds:
+        print(f"FAIL: startup {results['startup_seconds']['mean']:.3f}s > {args.max_startup_seconds}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+"""
+Compact columnar in-memory store for metric records.
+
+Each metric type is kept as a set of typed `array` columns that grow in
+fixed-size chunks. Values are stored raw (epoch float timestamps, unrounded
+seconds). Low-cardinality strings (labels, types, sources, levels) are
+interned into a shared string table, so a record costs a few dozen bytes
+instead of a dict of formatted strings. Strings that are unique or nearly
+unique per record (request and speech IDs, sampled stacks) would only grow
+that table; they are kept as plain per-row values instead.
+Formatting into the human-readable report columns happens only at export
+time (see `export_row`).
+
+Chunks are preallocated and never resized, which makes it safe to hand out
+zero-copy `memoryview`s of the filled part of each chunk for analysis:
+
+    views = store.column_views("llm", "ttft")    # list of memoryview('d')
+    total = sum(sum(v) for v in views)
+"""
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Storage type codes: "s" is an interned string (stored as a uint32 code),
+# "t" a per-row string (IDs, stacks), everything else is an `array` typecode
+STRING = "s"
+TEXT = "t"
+
+SCHEMAS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "llm": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("label", STRING),
+        ("request_id", TEXT),
+        ("duration", "d"),
+        ("ttft", "d"),
+        ("cancelled", "b"),
+        ("completion_tokens", "q"),
+        ("prompt_tokens", "q"),
+        ("total_tokens", "q"),
+        ("tokens_per_second", "d"),
+        ("speech_id", TEXT),
+    ),
+    "tts": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("label", STRING),
+        ("request_id", TEXT),
+        ("ttfb", "d"),
+        ("duration", "d"),
+        ("audio_duration", "d"),
+        ("cancelled", "b"),
+        ("characters_count", "q"),
+        ("streamed", "b"),
+        ("speech_id", TEXT),
+    ),
+    "stt": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("label", STRING),
+        ("request_id", TEXT),
+        ("duration", "d"),
+        ("audio_duration", "d"),
+        ("streamed", "b"),
+        ("speech_id", TEXT),
+        ("error", STRING),
+    ),
+    "eou": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("end_of_utterance_delay", "d"),
+        ("transcription_delay", "d"),
+        ("on_user_turn_completed_delay", "d"),
+        ("speech_id", TEXT),
+    ),
+    # response cache lookups (see agent/llm_cache.py)
+    "llm_cache": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("label", STRING),
+        ("request_id", TEXT),
+        ("hit", "b"),
+        ("ttft", "d"),
+        ("original_ttft", "d"),
+        ("ttft_saved", "d"),
+        ("completion_tokens_saved", "q"),
+        ("prompt_tokens_saved", "q"),
+    ),
+    # speculative LLM requests (see agent/speculative.py)
+    "speculation": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("label", STRING),
+        ("request_id", TEXT),
+        ("hit", "b"),
+        ("trigger", STRING),
+        ("head_start", "d"),
+        ("ttft", "d"),
+        ("wasted_prompt_tokens", "q"),
+        ("wasted_completion_tokens", "q"),
+    ),
+    # chat context size per user turn (see agent/context.py)
+    "context": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("context_tokens", "q"),
+        ("full_tokens", "q"),
+        ("tokens_saved", "q"),
+        ("messages", "q"),
+        ("summarized_messages", "q"),
+        ("compactions", "q"),
+        ("summary_seconds", "d"),
+        ("summary_prompt_tokens", "q"),
+        ("summary_completion_tokens", "q"),
+    ),
+    # which pool backend served each LLM/TTS request (see agent/routing.py)
+    "routing": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("label", STRING),
+        ("kind", STRING),
+        ("backend", STRING),
+        ("ttft", "d"),
+        ("hedged", "b"),
+        ("failovers", "q"),
+    ),
+    # event-loop stalls and slow event handlers (see agent/loop_monitor.py)
+    "loop": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("source", STRING),
+        ("name", STRING),
+        ("duration", "d"),
+        ("speech_id", TEXT),
+        ("stack", TEXT),
+    ),
+    # per-session CPU / real-time factor samples (see agent/admission.py)
+    "load": (
+        ("timestamp", "d"),
+        ("type", STRING),
+        ("level", STRING),
+        ("sessions", "q"),
+        ("process_cpu", "d"),
+        ("session_cpu", "d"),
+        ("system_cpu", "d"),
+        ("loop_lag_p99", "d"),
+    ),
+    # correlated per-response latency (see agent/turns.py)
+    "turn": (
+        ("timestamp", "d"),
+        ("speech_id", TEXT),
+        ("has_eou", "b"),
+        ("transcription_delay", "d"),
+        ("end_of_utterance", "d"),
+        ("turn_completed_callback", "d"),
+        ("llm_ttft", "d"),
+        ("tts_ttfb", "d"),
+        ("voice_to_voice", "d"),
+        ("critical_stage", STRING),
+    ),
+}
+
+# Report column name and rounding for each raw field, per metric type.
+# Fields without an entry are exported under their own name, unchanged.
+EXPORT_COLUMNS: Dict[str, Dict[str, Tuple[str, Optional[int]]]] = {
+    "llm": {
+        "duration": ("duration_seconds", 4),
+        "ttft": ("time_to_first_token_seconds", 4),
+        "tokens_per_second": ("tokens_per_second", 2),
+    },
+    "tts": {
+        "ttfb": ("ttfb_seconds", 4),
+        "duration": ("duration_seconds", 4),
+        "audio_duration": ("audio_duration_seconds", 4),
+    },
+    "stt": {
+        "duration": ("duration_seconds", 4),
+        "audio_duration": ("audio_duration_seconds", 4),
+    },
+    "eou": {
+        "end_of_utterance_delay": ("end_of_utterance_delay_seconds", 4),
+        "transcription_delay": ("transcription_delay_seconds", 4),
+        "on_user_turn_completed_delay": ("on_user_turn_completed_delay_seconds", 4),
+    },
+    "llm_cache": {
+        "ttft": ("time_to_first_token_seconds", 4),
+        "original_ttft": ("original_ttft_seconds", 4),
+        "ttft_saved": ("ttft_saved_seconds", 4),
+    },
+    "speculation": {
+        "head_start": ("head_start_seconds", 4),
+        "ttft": ("time_to_first_token_seconds", 4),
+    },
+    "context": {
+        "summary_seconds": ("last_summary_seconds", 4),
+    },
+    "routing": {
+        "ttft": ("time_to_first_chunk_seconds", 4),
+    },
+    "loop": {
+        "duration": ("duration_seconds", 4),
+    },
+    "turn": {
+        "transcription_delay": ("transcription_delay_seconds", 4),
+        "end_of_utterance": ("end_of_utterance_seconds", 4),
+        "turn_completed_callback": ("turn_completed_callback_seconds", 4),
+        "llm_ttft": ("llm_ttft_seconds", 4),
+        "tts_ttfb": ("tts_ttfb_seconds", 4),
+        "voice_to_voice": ("voice_to_voice_seconds", 4),
+    },
+}
+
+
+def extract_row(kind: str, metrics: Any) -> tuple:
+    """Pull the raw field values for `kind` off a livekit metrics object"""
+    row = []
+    for name, code in SCHEMAS[kind]:
+        value = getattr(metrics, name, None)
+        if code in (STRING, TEXT):
+            value = "" if value is None else str(value)
+        elif value is None:
+            value = 0
+        row.append(value)
+    return tuple(row)
+
+
+def export_row(kind: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a raw record into the human-readable report columns"""
+    columns = EXPORT_COLUMNS.get(kind, {})
+    out = {}
+    for name, value in record.items():
+        if name == "timestamp" and isinstance(value, (int, float)):
+            out[name] = datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S")
+            continue
+        if name in ("speech_id", "error") and value == "":
+            value = "N/A" if name == "speech_id" else "None"
+        column, digits = columns.get(name, (name, None))
+        if digits is not None and isinstance(value, float):
+            value = round(value, digits)
+        out[column] = value
+    return out
+
+
+class StringTable:
+    """Interns repeated label/ID strings and hands out compact integer codes"""
+
+    def __init__(self) -> None:
+        self._codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def intern(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, code: int) -> str:
+        return self.values[code]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class MetricTable:
+    """Typed, chunked columns for a single metric type"""
+
+    def __init__(
+        self,
+        schema: Sequence[Tuple[str, str]],
+        strings: StringTable,
+        chunk_size: int = 1024,
+    ) -> None:
+        self.names = [name for name, _ in schema]
+        self._typecodes = ["I" if code == STRING else code for _, code in schema]
+        self._is_string = [code == STRING for _, code in schema]
+        self._is_text = [code == TEXT for _, code in schema]
+        self._is_bool = [code == "b" for _, code in schema]
+        self._strings = strings
+        self.chunk_size = chunk_size
+
+        self._chunks: List[List[array]] = []
+        self._fill = chunk_size  # forces a chunk allocation on first append
+        self._length = 0
+
+    def _new_chunk(self) -> None:
+        chunk = []
+        for code, is_text in zip(self._typecodes, self._is_text):
+            if is_text:
+                chunk.append([""] * self.chunk_size)
+                continue
+            zero = array(code)
+            chunk.append(array(code, bytes(zero.itemsize * self.chunk_size)))
+        self._chunks.append(chunk)
+        self._fill = 0
+
+    def append(self, row: Sequence[Any]) -> None:
+        if self._fill == self.chunk_size:
+            self._new_chunk()
+        chunk = self._chunks[-1]
+        index = self._fill
+        for column, value, is_string in zip(chunk, row, self._is_string):
+            column[index] = self._strings.intern(value) if is_string else value
+        self._fill += 1
+        self._length += 1
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _filled(self, chunk_index: int) -> int:
+        return self._fill if chunk_index == len(self._chunks) - 1 else self.chunk_size
+
+    def column_views(self, name: str) -> List[memoryview]:
+        """Zero-copy views of one column, one memoryview per chunk.
+
+        String columns yield their uint32 codes; decode them with the
+        store's string table. Per-row text columns have no views.
+        """
+        position = self.names.index(name)
+        if self._is_text[position]:
+            raise TypeError(f"{name} is a per-row text column; read it with rows()")
+        return [
+            memoryview(chunk[position])[: self._filled(i)]
+            for i, chunk in enumerate(self._chunks)
+        ]
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """Yield decoded raw records, oldest first"""
+        for i, chunk in enumerate(self._chunks):
+            for index in range(self._filled(i)):
+                record = {}
+                for name, column, is_string, is_bool in zip(
+                    self.names, chunk, self._is_string, self._is_bool
+                ):
+                    value = column[index]
+                    if is_string:
+                        value = self._strings.lookup(value)
+                    elif is_bool:
+                        value = bool(value)
+                    record[name] = value
+                yield record
+
+    @property
+    def nbytes(self) -> int:
+        total = 0
+        for chunk in self._chunks:
+            for column in chunk:
+                if isinstance(column, array):
+                    total += column.itemsize * len(column)
+                else:
+                    # one pointer per slot plus the characters held
+                    total += 8 * len(column) + sum(len(value) for value in column)
+        return total
+
+
+class MetricsStore:
+    """One `MetricTable` per metric type, sharing a string table"""
+
+    def __init__(self, chunk_size: int = 1024) -> None:
+        self.chunk_size = chunk_size
+        self.clear()
+
+    def append(self, kind: str, row: Sequence[Any]) -> None:
+        self.tables[kind].append(row)
+
+    def clear(self) -> None:
+        """Drop all rows and interned strings, releasing their chunks"""
+        self.strings = StringTable()
+        self.tables = {
+            kind: MetricTable(schema, self.strings, self.chunk_size)
+            for kind, schema in SCHEMAS.items()
+        }
+
+    def count(self, kind: str) -> int:
+        return len(self.tables[kind])
+
+    def column_views(self, kind: str, name: str) -> List[memoryview]:
+        return self.tables[kind].column_views(name)
+
+    def rows(self, kind: str) -> Iterator[Dict[str, Any]]:
+        return self.tables[kind].rows()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(table.nbytes for table in self.tables.values())
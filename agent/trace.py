@@ -0,0 +1,260 @@
+"""
+Per-session timeline in Chrome trace event format (open in ui.perfetto.dev
+or chrome://tracing).
+
+The metric rows only say how long each stage took. The timeline puts them
+side by side, one track per stage, so overlap (TTS starting while the LLM
+is still streaming) and cancelled work (an interruption) are visible:
+
+    VAD         user speech, from session user_state_changed events
+    STT         STT requests, and the final transcript delay after speech ends
+    EOU         end-of-utterance decision and the on_user_turn_completed callback
+    LLM         requests with their TTFT; cancelled requests are marked
+    TTS         requests with their TTFB; cancelled requests are marked
+    Agent       agent state (thinking, speaking)
+    Speech      each reply from creation until done or interrupted
+    Event loop  stalls and slow handlers (agent/loop_monitor.py)
+
+livekit emits a metric when the work ends, so spans are reconstructed
+backwards from the record timestamp and its durations. That is exact for
+LLM/TTS/STT requests; the EOU spans are approximate. Spans of one reply are
+linked by a flow arrow on their speech_id.
+
+Spans are kept in a ring buffer of `max_events` (the oldest are dropped),
+and only a `TRACE_SAMPLE_RATE` fraction of sessions is traced. A trace can
+also be rebuilt from an archived session's segments, without the pipeline
+event tracks:
+
+    python -m agent.trace metrics_reports/agent_metrics_20250610_112109
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+TRACKS = ("VAD", "STT", "EOU", "LLM", "TTS", "Agent", "Speech", "Event loop")
+
+# States that close the open span of a state track instead of opening one
+IDLE_STATES = {"VAD": ("listening", "away"), "Agent": ("listening",)}
+
+# (track, name, start, duration, args), times in epoch seconds
+Span = Tuple[str, str, float, float, Dict[str, Any]]
+
+
+def _cancelled(name: str, record: Dict[str, Any]) -> str:
+    return f"{name} (cancelled)" if record.get("cancelled") else name
+
+
+def spans(kind: str, record: Dict[str, Any]) -> List[Span]:
+    """Reconstruct the spans of one raw metric record (see agent/store.py)"""
+    end = record["timestamp"]
+    speech = {"speech_id": record["speech_id"]} if record.get("speech_id") else {}
+    if kind == "llm":
+        start = end - record["duration"]
+        args = {
+            "request_id": record["request_id"], "ttft": record["ttft"],
+            "prompt_tokens": record["prompt_tokens"], "completion_tokens": record["completion_tokens"],
+            "tokens_per_second": record["tokens_per_second"], **speech,
+        }
+        return [
+            ("LLM", _cancelled("LLM", record), start, record["duration"], args),
+            ("LLM", "ttft", start, min(max(record["ttft"], 0.0), record["duration"]), {}),
+        ]
+    if kind == "tts":
+        start = end - record["duration"]
+        args = {
+            "request_id": record["request_id"], "ttfb": record["ttfb"],
+            "audio_duration": record["audio_duration"], "characters": record["characters_count"], **speech,
+        }
+        return [
+            ("TTS", _cancelled("TTS", record), start, record["duration"], args),
+            ("TTS", "ttfb", start, min(max(record["ttfb"], 0.0), record["duration"]), {}),
+        ]
+    if kind == "stt":
+        # streaming STT reports no request duration, only the audio it covered
+        duration = record["duration"] or record["audio_duration"]
+        args = {"request_id": record["request_id"], "audio_duration": record["audio_duration"], **speech}
+        if record.get("error"):
+            args["error"] = record["error"]
+        return [("STT", "STT", end - duration, duration, args)]
+    if kind == "eou":
+        # the record is emitted after the callback; delays count from the end of user speech
+        callback = record["on_user_turn_completed_delay"]
+        speech_end = end - callback - record["end_of_utterance_delay"]
+        result = [
+            ("EOU", "end of utterance", speech_end, record["end_of_utterance_delay"], dict(speech)),
+            ("STT", "final transcript", speech_end, record["transcription_delay"], dict(speech)),
+        ]
+        if callback > 0:
+            result.append(("EOU", "on_user_turn_completed", end - callback, callback, {}))
+        return result
+    if kind == "loop":
+        name = record["name"] or "stall"
+        return [("Event loop", f"{record['source']}: {name}", end - record["duration"], record["duration"], dict(speech))]
+    return []
+
+
+def _event_time(ev) -> float:
+    return getattr(ev, "created_at", None) or time.time()
+
+
+class TraceRecorder:
+    """Bounded span buffer for one session; safe to feed from the loop and the writer thread"""
+
+    def __init__(self, session_id: str, room: Optional[str] = None, max_events: int = 20000) -> None:
+        self.session_id = session_id
+        self.room = room
+        self.started_at = time.time()
+        self.dropped = 0
+
+        self._spans: "deque[Span]" = deque(maxlen=max_events)
+        # track -> (state, start) of the span still open on a state track
+        self._open: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def _append(self, span: Span) -> None:
+        with self._lock:
+            self._append_locked(span)
+
+    def _append_locked(self, span: Span) -> None:
+        if len(self._spans) == self._spans.maxlen:
+            self.dropped += 1
+        self._spans.append(span)
+
+    def add(self, kind: str, record: Dict[str, Any]) -> None:
+        """Add the spans of a raw metric record (runs on the writer thread)"""
+        for span in spans(kind, record):
+            self._append(span)
+
+    # -- pipeline events (event loop) ---------------------------------------
+
+    def _state(self, track: str, state: str, at: float) -> None:
+        # under the lock: `events()` may be snapshotting from the export thread
+        with self._lock:
+            current = self._open.pop(track, None)
+            if current is not None:
+                self._append_locked((track, current[0], current[1], max(0.0, at - current[1]), {}))
+            if state not in IDLE_STATES[track]:
+                self._open[track] = (state, at)
+
+    def on_user_state(self, ev) -> None:
+        self._state("VAD", "speech" if ev.new_state == "speaking" else ev.new_state, _event_time(ev))
+
+    def on_agent_state(self, ev) -> None:
+        self._state("Agent", ev.new_state, _event_time(ev))
+
+    def on_speech_created(self, ev) -> None:
+        handle = ev.speech_handle
+        created = _event_time(ev)
+        args = {"speech_id": handle.id, "source": ev.source, "user_initiated": ev.user_initiated}
+
+        def done(_) -> None:
+            interrupted = handle.interrupted
+            name = "reply (interrupted)" if interrupted else "reply"
+            self._append(("Speech", name, created, time.time() - created, {**args, "interrupted": interrupted}))
+
+        handle.add_done_callback(done)
+
+    # -- export --------------------------------------------------------------
+
+    def events(self) -> List[Dict[str, Any]]:
+        """Chrome trace events, with times relative to the session start"""
+        now = time.time()
+        with self._lock:
+            recorded = list(self._spans)
+            # state spans still open (e.g. the agent was speaking at shutdown)
+            recorded += [(track, state, start, now - start, {"open": True}) for track, (state, start) in self._open.items()]
+        return trace_events(recorded, self.started_at, self._process_name())
+
+    def _process_name(self) -> str:
+        return f"{self.room} {self.session_id}" if self.room else self.session_id
+
+    def summary_lines(self, path: Path) -> List[str]:
+        return [f"  • Trace: {path} ({len(self)} spans, {self.dropped} dropped; open in https://ui.perfetto.dev)"]
+
+    def write(self, path: Path) -> Path:
+        other = {"session_id": self.session_id, "room": self.room, "started_at": self.started_at,
+                 "spans": len(self._spans), "dropped": self.dropped}
+        write_trace(path, self.events(), other)
+        return path
+
+
+def trace_events(recorded: List[Span], origin: float, process_name: str) -> List[Dict[str, Any]]:
+    tid = {track: index + 1 for index, track in enumerate(TRACKS)}
+    events: List[Dict[str, Any]] = [{"ph": "M", "pid": 1, "name": "process_name", "args": {"name": process_name}}]
+    for track, index in tid.items():
+        events.append({"ph": "M", "pid": 1, "tid": index, "name": "thread_name", "args": {"name": track}})
+        events.append({"ph": "M", "pid": 1, "tid": index, "name": "thread_sort_index", "args": {"sort_index": index}})
+
+    chains: Dict[str, List[Tuple[float, int]]] = {}
+    for track, name, start, duration, args in sorted(recorded, key=lambda span: (span[2], -span[3])):
+        ts = (start - origin) * 1e6
+        events.append({"ph": "X", "pid": 1, "tid": tid[track], "name": name, "cat": track,
+                       "ts": round(ts, 1), "dur": round(max(duration, 0.0) * 1e6, 1), "args": args})
+        if args.get("speech_id"):
+            chains.setdefault(args["speech_id"], []).append((ts, tid[track]))
+
+    # flow arrows through the spans of each reply, in time order
+    for speech_id, chain in chains.items():
+        if len(chain) < 2:
+            continue
+        flow_id = zlib.crc32(speech_id.encode())
+        for position, (ts, track_id) in enumerate(chain):
+            phase = "s" if position == 0 else "f" if position == len(chain) - 1 else "t"
+            events.append({"ph": phase, "pid": 1, "tid": track_id, "name": speech_id, "cat": "reply",
+                           "id": flow_id, "ts": round(ts + 1, 1), "bp": "e"})
+    return events
+
+
+def write_trace(path: Path, events: List[Dict[str, Any]], other: Optional[Dict[str, Any]] = None) -> None:
+    trace = {"traceEvents": events, "displayTimeUnit": "ms", "otherData": other or {}}
+    Path(path).write_text(json.dumps(trace, default=str, separators=(",", ":")), encoding="utf-8")
+
+
+def make_trace(session_id: str, room: Optional[str], sample_rate: float, max_events: int) -> Optional[TraceRecorder]:
+    """A recorder for this session, or None when it is sampled out"""
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        return None
+    return TraceRecorder(session_id, room, max_events=max_events)
+
+
+def trace_from_segments(directory: Path) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Trace events for an archived session directory (metric spans only)"""
+    from agent.sink import MetricsSink
+
+    sink = MetricsSink(directory)
+    recorded = [span for kind in ("stt", "eou", "llm", "tts", "loop")
+                for record in sink.read(kind) for span in spans(kind, record)]
+    manifest_path = Path(directory) / "session.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest_path.exists() else {}
+    origin = min((span[2] for span in recorded), default=0.0)
+    name = " ".join(str(part) for part in (manifest.get("room"), Path(directory).name) if part)
+    return trace_events(recorded, origin, name), {"spans": len(recorded), **manifest}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build a Chrome/Perfetto trace from an archived metrics session")
+    parser.add_argument("session", type=Path, help="session directory (metrics_reports/agent_metrics_...)")
+    parser.add_argument("-o", "--output", type=Path, help="trace file (default: <session>/trace.json)")
+    args = parser.parse_args()
+
+    if not args.session.is_dir():
+        print(f"not a session directory: {args.session}")
+        return 1
+    events, other = trace_from_segments(args.session)
+    output = args.output or args.session / "trace.json"
+    write_trace(output, events, other)
+    print(f"{other['spans']} spans written to {output} (open in https://ui.perfetto.dev)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,142 @@
+"""
+Per-turn voice-to-voice latency correlation.
+
+EOU, LLM and TTS metrics for the same response share a `speech_id`. The
+correlator joins them as they arrive and emits one turn record per response
+with the latency breakdown the caller actually feels:
+
+    user stops speaking -> end_of_utterance_delay -> on_user_turn_completed
+                        -> LLM ttft -> TTS ttfb -> first audio
+
+The EOU metrics arrive when the turn is committed, before the response
+exists. LLM and TTS metrics are reported when each stream finishes, and TTS
+usually streams the LLM output, so either one can come last. A turn is
+emitted as soon as it has both, whichever arrives second. Replies that were not
+triggered by user speech (the greeting, `generate_reply`) have no EOU and
+are emitted with `has_eou=False`.
+
+Partial turns are kept in a bounded, insertion-ordered map and evicted when
+they get older than `ttl` seconds or when more than `max_pending` are open.
+"""
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+# Stage name -> (source metric type, field)
+STAGES = (
+    ("end_of_utterance", "eou", "end_of_utterance_delay"),
+    ("turn_completed_callback", "eou", "on_user_turn_completed_delay"),
+    ("llm_ttft", "llm", "ttft"),
+    ("tts_ttfb", "tts", "ttfb"),
+)
+
+
+class TurnCorrelator:
+    def __init__(self, max_pending: int = 64, ttl: float = 30.0) -> None:
+        self.max_pending = max_pending
+        self.ttl = ttl
+
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._completed_ids: deque = deque(maxlen=max_pending)
+        self.evicted = 0
+        self.turns = 0
+
+        # running critical-path aggregates, no raw rows kept
+        self._stage_sum = {name: 0.0 for name, _, _ in STAGES}
+        self._stage_max = {name: 0.0 for name, _, _ in STAGES}
+        self._dominant = {name: 0 for name, _, _ in STAGES}
+        self._total_sum = 0.0
+        self._total_max = 0.0
+
+    def add(self, kind: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Feed one raw metric record; returns a turn record when a turn completes"""
+        speech_id = record.get("speech_id")
+        if kind not in ("eou", "llm", "tts") or not speech_id:
+            return None
+        if speech_id in self._completed_ids:
+            return None
+
+        self._evict(record.get("timestamp", 0.0))
+
+        parts = self._pending.get(speech_id)
+        if parts is None:
+            parts = self._pending[speech_id] = {}
+        # keep the first record of each type (later LLM calls are tool follow-ups)
+        parts.setdefault(kind, record)
+
+        if kind in ("llm", "tts") and "llm" in parts and "tts" in parts:
+            del self._pending[speech_id]
+            self._completed_ids.append(speech_id)
+            return self._emit(speech_id, parts)
+        return None
+
+    def _evict(self, now: float) -> None:
+        while self._pending:
+            speech_id, parts = next(iter(self._pending.items()))
+            first_seen = min(r.get("timestamp", now) for r in parts.values())
+            if len(self._pending) < self.max_pending and now - first_seen <= self.ttl:
+                break
+            del self._pending[speech_id]
+            self.evicted += 1
+
+    def _emit(self, speech_id: str, parts: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        turn = {
+            "timestamp": max(parts["llm"].get("timestamp", 0.0), parts["tts"].get("timestamp", 0.0)),
+            "speech_id": speech_id,
+            "has_eou": "eou" in parts,
+            "transcription_delay": parts.get("eou", {}).get("transcription_delay", 0.0),
+        }
+        total = 0.0
+        dominant, dominant_value = None, -1.0
+        for name, kind, field in STAGES:
+            value = float(parts.get(kind, {}).get(field, 0.0) or 0.0)
+            turn[name] = value
+            total += value
+            self._stage_sum[name] += value
+            self._stage_max[name] = max(self._stage_max[name], value)
+            if value > dominant_value:
+                dominant, dominant_value = name, value
+        turn["voice_to_voice"] = total
+        turn["critical_stage"] = dominant
+
+        self.turns += 1
+        self._dominant[dominant] += 1
+        self._total_sum += total
+        self._total_max = max(self._total_max, total)
+        return turn
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def summary_lines(self) -> List[str]:
+        """Final-summary lines: turn counts and the critical path per stage"""
+        lines = [f"  • Turns: {self.turns} correlated, {self.pending} partial, {self.evicted} evicted"]
+        for row in self.summary():
+            lines.append(
+                f"    - {row['stage']}: mean {row['mean_seconds']}s, max {row['max_seconds']}s, "
+                f"{row['share_of_total'] * 100:.0f}% of total, critical in {row['critical_in_turns']} turns"
+            )
+        return lines
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-call critical-path summary: one row per stage plus the total"""
+        if not self.turns:
+            return []
+        rows = []
+        for name, _, _ in STAGES:
+            mean = self._stage_sum[name] / self.turns
+            rows.append({
+                "stage": name,
+                "mean_seconds": round(mean, 4),
+                "max_seconds": round(self._stage_max[name], 4),
+                "share_of_total": round(self._stage_sum[name] / self._total_sum, 3) if self._total_sum else 0.0,
+                "critical_in_turns": self._dominant[name],
+            })
+        rows.append({
+            "stage": "voice_to_voice",
+            "mean_seconds": round(self._total_sum / self.turns, 4),
+            "max_seconds": round(self._total_max, 4),
+            "share_of_total": 1.0,
+            "critical_in_turns": self.turns,
+        })
+        return rows
@@ -0,0 +1,154 @@
+"""
+Background writer that keeps metrics handling off the asyncio event loop.
+
+Metric events are pushed into a bounded in-memory queue from the session
+callback and drained by a daemon thread, which does the console rendering and
+disk writes. When the queue is full the overflow policy decides what happens:
+
+    drop    the new record is discarded (the callback never waits)
+    sample  once the queue is half full only every Nth record is kept,
+            and records are dropped when it is completely full
+    block   the caller waits up to `block_timeout` seconds for room, then
+            drops; every wait is counted as a delayed record
+
+All outcomes are counted so dropped or delayed records show up in the final
+report.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("metrics-writer")
+
+OVERFLOW_POLICIES = ("drop", "sample", "block")
+
+
+class _Flush:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class MetricsWriter:
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        *,
+        maxsize: int = 1000,
+        policy: str = "drop",
+        sample_every: int = 10,
+        block_timeout: float = 0.05,
+        name: str = "metrics-writer",
+    ) -> None:
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r}, expected one of {OVERFLOW_POLICIES}")
+
+        self._handler = handler
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.sample_every = max(1, sample_every)
+        self.block_timeout = block_timeout
+
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.delayed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.handler_seconds = 0.0
+        self._sample_counter = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, item: Any) -> bool:
+        """Queue an item for the writer thread; returns False if it was not accepted"""
+        self.submitted += 1
+
+        if self.policy == "sample" and self._queue.qsize() >= self.maxsize // 2:
+            self._sample_counter += 1
+            if self._sample_counter % self.sample_every:
+                self.sampled_out += 1
+                return False
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.policy != "block":
+                self.dropped += 1
+                return False
+            self.delayed += 1
+            try:
+                self._queue.put(item, timeout=self.block_timeout)
+            except queue.Full:
+                self.dropped += 1
+                return False
+
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            if isinstance(item, _Flush):
+                item.done.set()
+                continue
+
+            start = time.perf_counter()
+            try:
+                self._handler(item)
+            except Exception:
+                self.errors += 1
+                logger.exception("error while handling metrics")
+            finally:
+                self.handler_seconds += time.perf_counter() - start
+                self.processed += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued so far has been handled"""
+        if not self._thread.is_alive():
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Drain the queue and stop the writer thread"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "overflow_policy": self.policy,
+            "queue_size": self.maxsize,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "delayed": self.delayed,
+            "errors": self.errors,
+            "max_queue_depth": self.max_depth,
+            "handler_seconds": round(self.handler_seconds, 4),
+        }
+
+    def summary_lines(self) -> List[str]:
+        return [
+            f"  • Writer: {self.processed} handled, {self.dropped} dropped, {self.sampled_out} sampled out, "
+            f"{self.delayed} delayed (policy: {self.policy}, max queue depth: {self.max_depth})"
+        ]
@@ -1,42 +1,60 @@
+import argparse
 import asyncio
+import csv
+import json
+import random
 import time
+import uuid
+import aiohttp
 from dotenv import load_dotenv
 from livekit import api
 from livekit.protocol.sip import CreateSIPParticipantRequest
 
 load_dotenv()
 
+# Configuration
+SIP_TRUNK_ID = "ST_xrzim78pNWRG"  # It is provided from the outbound_call.json
+PHONE_NUMBER = "+919911062767"  # Add the no. which is verified in our twilio account
+ROOM_NAME = "my-assistant-room"  # Use a consistent room name
+
+# Twirp error codes worth another attempt; anything else (invalid_argument,
+# not_found, permission_denied, ...) will fail the same way again
+TRANSIENT_CODES = {"unavailable", "deadline_exceeded", "resource_exhausted", "internal", "unknown", "aborted"}
+# SIP responses worth another attempt: timeout, unavailable, busy, server errors
+TRANSIENT_SIP_STATUS = {408, 480, 486, 500, 502, 503, 504, 600}
+
+
+def build_request(phone_number: str, room_name: str, wait_until_answered: bool = True) -> CreateSIPParticipantRequest:
+    return CreateSIPParticipantRequest(
+        sip_trunk_id=SIP_TRUNK_ID,
+        sip_call_to=phone_number,
+        room_name=room_name,
+        participant_identity="sip-caller",
+        participant_name="Phone Caller",
+        krisp_enabled=True,
+        wait_until_answered=wait_until_answered
+    )
+
+
 async def make_outbound_call():
     """
     Make an outbound call - run this after your agent is running
     """
     print("📞Initiating outbound call...")
     print("⏳Connecting to LiveKit API...")
-    
+
     livekit_api = api.LiveKitAPI()
-    
-    # Configuration
-    PHONE_NUMBER = "+919911062767"  # Add the no. which is verified in our twilio account
-    ROOM_NAME = "my-assistant-room"  # Use a consistent room name
-    
-    request = CreateSIPParticipantRequest(
-        sip_trunk_id="ST_xrzim78pNWRG",  # It is provided from the outbound_call.json
-        sip_call_to=PHONE_NUMBER,
-        room_name=ROOM_NAME,
-        participant_identity="sip-caller",
-        participant_name="Phone Caller",
-        krisp_enabled=True,
-        wait_until_answered=True
-    )
-    
+
+    request = build_request(PHONE_NUMBER, ROOM_NAME)
+
     try:
         print(f"📱 Calling {PHONE_NUMBER}...")
         print(f"🏠 Room: {ROOM_NAME}")
-        
+
         start_time = time.time()
         participant = await livekit_api.sip.create_sip_participant(request)
         connection_time = time.time() - start_time
-        
+
         print(f"* Connection established in {connection_time:.2f} seconds")
         print(f"* Participant ID: {participant.participant_id}")
         print(f"* SIP Call ID: {participant.sip_call_id}")
@@ -44,7 +62,7 @@ async def make_outbound_call():
         print("-" * 50)
         print("* The AI assistant should now be speaking to the caller")
         print("* Metrics are being logged in real-time")
-        
+
     except Exception as e:
         print(f" Error creating SIP participant: {e}")
         print(" Make sure:")
@@ -55,7 +73,178 @@ async def make_outbound_call():
     finally:
         await livekit_api.aclose()
 
+
+class RateLimiter:
+    """Token bucket: at most `rate` call starts per second, with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed dial may succeed on retry (timeouts, 5xx, busy)"""
+    if isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, OSError)):
+        return True
+    sip_status = (getattr(error, "metadata", None) or {}).get("sip_status_code")
+    if sip_status:
+        return int(sip_status) in TRANSIENT_SIP_STATUS
+    code = getattr(error, "code", None)
+    if isinstance(code, str):
+        return code in TRANSIENT_CODES
+    status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return False
+
+
+def read_numbers(csv_path: str, column: str = "phone_number") -> list:
+    """Read phone numbers from a CSV with a header row (or one number per line)"""
+    with open(csv_path, newline="", encoding="utf-8") as fp:
+        sample = fp.read(1024)
+        fp.seek(0)
+        if column in sample:
+            return [row[column].strip() for row in csv.DictReader(fp) if row.get(column, "").strip()]
+        return [row[0].strip() for row in csv.reader(fp) if row and row[0].strip()]
+
+
+async def dial(livekit_api, phone_number: str, room_name: str, limiter: RateLimiter,
+               retries: int, backoff: float, wait_until_answered: bool) -> dict:
+    """Dial one number into its own room, retrying transient errors with exponential backoff and jitter"""
+    result = {
+        "phone_number": phone_number,
+        "room": room_name,
+        "outcome": "failed",
+        "attempts": 0,
+        "connection_seconds": None,
+        "participant_id": None,
+        "sip_call_id": None,
+        "error": None,
+        "permanent": False,
+        "started_at": time.time(),
+    }
+    for attempt in range(1, retries + 2):
+        await limiter.acquire()
+        result["attempts"] = attempt
+        start_time = time.perf_counter()
+        try:
+            participant = await livekit_api.sip.create_sip_participant(
+                build_request(phone_number, room_name, wait_until_answered)
+            )
+        except Exception as e:
+            result["error"] = str(e)
+            if not is_transient(e):
+                # an invalid number or a rejected request fails the same way every time
+                result["permanent"] = True
+                break
+            if attempt <= retries:
+                delay = backoff * 2 ** (attempt - 1)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            continue
+
+        result.update(
+            outcome="connected",
+            connection_seconds=round(time.perf_counter() - start_time, 4),
+            participant_id=participant.participant_id,
+            sip_call_id=participant.sip_call_id,
+            error=None,
+        )
+        break
+    result["finished_at"] = time.time()
+    return result
+
+
+async def run_campaign(numbers: list, *, results_path: str, concurrency: int = 5,
+                       calls_per_second: float = 1.0, burst: int = 1, retries: int = 2, backoff: float = 1.0,
+                       room_prefix: str = "campaign", wait_until_answered: bool = True,
+                       livekit_api=None) -> dict:
+    """
+    Dial every number with bounded concurrency and a calls-per-second limit.
+    `burst` lets that many calls start back to back (default 1: evenly spaced).
+
+    One API client is shared by all calls. Pass `livekit_api` to use your own
+    client (anything with `.sip.create_sip_participant` and `.aclose`), e.g. a
+    local fake. Each call's outcome and connection latency is appended to
+    `results_path` (JSONL) as soon as it finishes.
+    """
+    owns_client = livekit_api is None
+    if owns_client:
+        livekit_api = api.LiveKitAPI()
+
+    limiter = RateLimiter(calls_per_second, burst=burst)
+    semaphore = asyncio.Semaphore(concurrency)
+    campaign_id = uuid.uuid4().hex[:8]
+    summary = {"total": len(numbers), "connected": 0, "failed": 0}
+
+    with open(results_path, "a", encoding="utf-8") as results:
+        async def worker(index: int, phone_number: str) -> None:
+            async with semaphore:
+                room_name = f"{room_prefix}-{campaign_id}-{index:05d}"
+                result = await dial(livekit_api, phone_number, room_name, limiter,
+                                    retries, backoff, wait_until_answered)
+            summary[result["outcome"]] += 1
+            results.write(json.dumps(result) + "\n")
+            results.flush()
+            status = "✅" if result["outcome"] == "connected" else "❌"
+            note = f", permanent: {result['error']}" if result["permanent"] else ""
+            print(f"{status} {phone_number} -> {room_name} ({result['attempts']} attempts, "
+                  f"{result['connection_seconds'] or '-'}s{note})")
+
+        try:
+            await asyncio.gather(*(worker(i, number) for i, number in enumerate(numbers)))
+        finally:
+            if owns_client:
+                await livekit_api.aclose()
+
+    return summary
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ProPAL AI - Outbound Call Initiator")
+    parser.add_argument("--campaign", metavar="CSV", help="dial every number in this CSV instead of a single call")
+    parser.add_argument("--column", default="phone_number", help="CSV column holding the numbers")
+    parser.add_argument("--concurrency", type=int, default=5, help="calls in flight at once")
+    parser.add_argument("--rate", type=float, default=1.0, help="new calls per second")
+    parser.add_argument("--burst", type=int, default=1, help="calls that may start back to back (rate limiter burst)")
+    parser.add_argument("--retries", type=int, default=2, help="retries per number on transient failures")
+    parser.add_argument("--backoff", type=float, default=1.0, help="base retry backoff in seconds")
+    parser.add_argument("--results", default="campaign_results.jsonl", help="per-call results file (JSONL)")
+    parser.add_argument("--room-prefix", default="campaign", help="prefix for the per-call room names")
+    parser.add_argument("--no-wait", action="store_true", help="do not wait for each call to be answered")
+    args = parser.parse_args()
+
     print(" ProPAL AI - Outbound Call Initiator")
     print("=" * 50)
-    asyncio.run(make_outbound_call())
\ No newline at end of file
+    if args.campaign:
+        numbers = read_numbers(args.campaign, args.column)
+        print(f"📋 Campaign: {len(numbers)} numbers, concurrency {args.concurrency}, {args.rate} calls/s")
+        summary = asyncio.run(run_campaign(
+            numbers,
+            results_path=args.results,
+            concurrency=args.concurrency,
+            calls_per_second=args.rate,
+            burst=args.burst,
+            retries=args.retries,
+            backoff=args.backoff,
+            room_prefix=args.room_prefix,
+            wait_until_answered=not args.no_wait,
+        ))
+        print("-" * 50)
+        print(f"* Connected: {summary['connected']} / {summary['total']}, failed: {summary['failed']}")
+        print(f"* Results written to {args.results}")
+    else:
+        asyncio.run(make_outbound_call())
@@ -1,109 +1,133 @@
-from dotenv import load_dotenv
-from livekit import agents
-from livekit.agents import AgentSession, Agent, RoomInputOptions, MetricsCollectedEvent
-from livekit.plugins import (
-    openai,
-    cartesia,
-    deepgram,
-    noise_cancellation,
-    silero,
-)
-from livekit.plugins.turn_detector.multilingual import MultilingualModel
-from livekit.agents.metrics import STTMetrics, TTSMetrics, EOUMetrics, LLMMetrics
 import asyncio
+import importlib.util
+import time
+
+from livekit import agents
+from livekit.agents import RoomInputOptions
+# Registered here, on the main thread; agent/admission.py picks the filter per session
+from livekit.plugins import noise_cancellation  # noqa: F401
 from rich.console import Console
-from rich.table import Table
-from rich import box
-from datetime import datetime
-import pandas as pd
-import os
-from pathlib import Path
-from rich.console import Console
-from rich.table import Table
-from rich import box
-from datetime import datetime
-import pandas as pd
-import os
-from pathlib import Path
 
-load_dotenv()
+from agent import settings
+from agent.admission import WORKER_LOAD, admit, audio_processing, processing_level, report_load
+from agent.agent import MetricsAgent
+from agent.display import WorkerDashboard
+from agent.exporter import EXPORTER
+from agent.lifecycle import SessionLifecycle
+from agent.phrase_cache import warm
+from agent.prewarm import prewarm, shared_models
+from agent.providers import import_plugins
+from agent.session import create_session
+
+# Register only the provider plugins the configured pools use; livekit wants
+# this on the main thread, before the worker starts
+import_plugins()
 
 console = Console()
-from agent.agent import MetricsAgent
+
+# With the process executor the worker's main process renders the live panel
+# from records the job processes forward (see agent/display.py)
+LIVE_PANEL_IN_WORKER = settings.METRICS_DISPLAY == "live" and settings.AGENT_JOB_EXECUTOR == "process"
+
 
 async def entrypoint(ctx: agents.JobContext):
     """
     Main entrypoint for the voice assistant with metrics tracking and Excel export
     """
+    job_start = time.perf_counter()
     print(f"Agent connected to room: {ctx.room.name}")
     
+    # VAD is loaded once per process, the turn detector per job (see agent/prewarm.py)
+    models = shared_models()
+    
+    # Cheaper audio processing when the machine is already busy (see agent/admission.py)
+    level = processing_level()
+    noise_filter, turn_detection = audio_processing(level, models["turn_detection"])
+    
+    # The worker's main process serves /metrics and the live panel; a job process forwards to it
+    if settings.METRICS_EXPORTER_PORT or LIVE_PANEL_IN_WORKER:
+        EXPORTER.connect_to_worker()
+    
     # Create the metrics agent
-    metrics_agent = MetricsAgent()
+    metrics_agent = MetricsAgent(vad=models["vad"], room=ctx.room.name)
+    metrics_agent.startup.update(
+        prewarmed=models["prewarmed"],
+        model_load_seconds=round(models["model_load_seconds"], 4),
+        process_job_index=models["process_job_index"],
+        processing_level=level,
+    )
+    if EXPORTER.running:
+        EXPORTER.sessions_by_level.inc((level,))
+    if level != "full":
+        console.print(f"[bold yellow]⚠️  Worker under load: starting with {level} audio processing[/bold yellow]")
     
     # Print Excel file location
     console.print(f"[bold blue]Metrics will be saved to: {metrics_agent.excel_filename}[/bold blue]")
     
     # Create session with turn detection configured for EOU metrics
-    session = AgentSession(
-        stt=metrics_agent.stt,
-        llm=metrics_agent.llm,
-        tts=metrics_agent.tts,
-        vad=metrics_agent.vad,
-        turn_detection=MultilingualModel(),  # This should enable EOU metrics
+    session = create_session(
+        metrics_agent,
+        turn_detection=turn_detection,  # This should enable EOU metrics
+        job_start=job_start,
     )
     
-    # Set up metrics collection from the session (this is the key fix!)
-    @session.on("metrics_collected")
-    def _on_metrics_collected(ev: MetricsCollectedEvent):
-        console.print(f"[dim]🔍 Collected metrics: {type(ev.metrics).__name__}[/dim]")
-        metrics_agent.handle_metrics(ev.metrics)
+    # Ends the job when the caller leaves and tears the session down once;
+    # set up before connecting so a caller who hangs up during startup is seen
+    lifecycle = SessionLifecycle(metrics_agent, session, ctx)
     
-    await session.start(
-        room=ctx.room,
-        agent=metrics_agent,
-        room_input_options=RoomInputOptions(
-            noise_cancellation=noise_cancellation.BVC(), 
-        ),
-    )
-    
-    await ctx.connect()
+    # Per-session CPU / real-time factor samples
+    lifecycle.spawn(report_load(metrics_agent, level, settings.LOAD_SAMPLE_SECONDS))
     
     # Set up room event handlers
     @ctx.room.on("participant_connected")
+    @metrics_agent.timed("room.participant_connected")
     def on_participant_connected(participant):
         print(f"Participant connected: {participant.identity}")
         console.print(f"[bold green]New participant joined:[/bold green] {participant.identity}")
         
     @ctx.room.on("participant_disconnected") 
+    @metrics_agent.timed("room.participant_disconnected")
     def on_participant_disconnected(participant):
         print(f"Participant disconnected: {participant.identity}")
         console.print(f"[bold red]Participant left:[/bold red] {participant.identity}")
-        # Save metrics when participant disconnects
-        asyncio.create_task(metrics_agent.finalize_metrics())
+        # Metrics are saved once, when the job shuts down
+        lifecycle.participant_left(participant.identity)
+    
+    await session.start(
+        room=ctx.room,
+        agent=metrics_agent,
+        room_input_options=RoomInputOptions(
+            noise_cancellation=noise_filter,
+        ),
+    )
+    
+    await ctx.connect()
+    if lifecycle.closed:
+        # the caller hung up while the session was starting; the shutdown callback tore it down
+        return
     
     # Wait for participants to join
     print("Waiting for participants to join...")
     await asyncio.sleep(2)
     
-    # Generate initial greeting
-    print("Generating initial greeting...")
-    await session.generate_reply(
-        instructions="Greet the user warmly and introduce yourself as an AI assistant with metrics tracking capabilities. Say 'Hello! I'm your AI assistant with real-time performance monitoring and Excel reporting. How can I help you today?'"
-    )
+    # Play the fixed greeting from the phrase cache (no LLM round trip)
+    print("Playing initial greeting...")
+    await metrics_agent.say_phrase(settings.AGENT_GREETING)
+    
+    # Synthesize any canned phrases still missing from the cache for later calls
+    lifecycle.spawn(warm(metrics_agent.tts))
     
     print("✅ Agent is ready and monitoring metrics!")
     console.print("[bold green]AI Assistant is live with metrics tracking and Excel export enabled![/bold green]")
     console.print("[dim]STT/EOU metrics may be 0 depending on configuration - this is normal[/dim]")
     
     try:
-        # Keep the agent running
-        await asyncio.Event().wait()
-    except KeyboardInterrupt:
-        console.print("[bold yellow]Shutting down agent...[/bold yellow]")
-        await metrics_agent.finalize_metrics()
+        # Keep the agent running until the call is over
+        await lifecycle.wait()
     except Exception as e:
         console.print(f"[red]Error: {str(e)}[/red]")
-        await metrics_agent.finalize_metrics()
+    finally:
+        await lifecycle.aclose("entrypoint exited")
 
 
 if __name__ == "__main__":
@@ -117,7 +141,7 @@ if __name__ == "__main__":
     print("  • End-of-Utterance Metrics (VAD dependent)")
     print("  • Real-time Rich Console Output")
     print("  • Excel Export with Multiple Sheets")
-    print("  • Auto-save every 3 records")
+    print("  • Streaming metric segments (append-only JSONL)")
     print("  • Summary Sheet with Statistics")
     print("=" * 70)
     print("Room name: my-assistant-room")
@@ -126,13 +150,34 @@ if __name__ == "__main__":
     print("Note: STT/EOU metrics depend on your specific configuration")
     print("=" * 70)
     
-    # Install required packages reminder
-    try:
-        import pandas as pd
-        import openpyxl
-    except ImportError:
+    # Install required packages reminder (the report imports them lazily, at the end of a call)
+    if importlib.util.find_spec("pandas") is None or importlib.util.find_spec("openpyxl") is None:
         print("Missing required packages!")
         print("Please install: pip install pandas openpyxl")
         exit(1)
     
-    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint))
\ No newline at end of file
+    # Optional Prometheus endpoint, one per worker; job processes forward their metrics to it
+    if settings.METRICS_EXPORTER_PORT:
+        EXPORTER.start(settings.METRICS_EXPORTER_PORT, settings.METRICS_EXPORTER_HOST)
+    if settings.METRICS_EXPORTER_PORT or LIVE_PANEL_IN_WORKER:
+        EXPORTER.serve_jobs()
+    if LIVE_PANEL_IN_WORKER:
+        EXPORTER.on_record = WorkerDashboard(settings.METRICS_LIVE_REFRESH, settings.LATENCY_SLOT_SECONDS).record
+        console.print("[bold blue]Live metrics panel: rendered by the worker from every job process[/bold blue]")
+    
+    worker_options = {}
+    if settings.AGENT_IDLE_PROCESSES is not None:
+        worker_options["num_idle_processes"] = settings.AGENT_IDLE_PROCESSES
+    
+    agents.cli.run_app(
+        agents.WorkerOptions(
+            entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
+            # Load with one more session; no new jobs at or above the threshold
+            load_fnc=WORKER_LOAD,
+            load_threshold=settings.WORKER_LOAD_THRESHOLD,
+            request_fnc=admit,
+            job_executor_type=agents.JobExecutorType(settings.AGENT_JOB_EXECUTOR),
+            **worker_options,
+        )
+    )
\ No newline at end of file
@@ -0,0 +1,370 @@
+"""
+Offline load test for the agent worker.
+
+Runs N simultaneous AgentSessions wired exactly like entry.py (through
+agent.session.create_session and MetricsAgent), but with the in-process fake
+STT/LLM/TTS providers from agent/fakes.py and synthetic audio, so it needs
+no network, API keys or GPU. Sessions are ramped in steps and each step
+reports the agent's own overhead:
+
+  * event-loop lag (p50/p99/max of scheduling delay)
+  * process CPU and RSS
+  * metrics-pipeline cost per turn (writer thread handler time)
+  * voice-to-voice latency above what the fake providers account for
+
+--soak runs many short calls back to back (a few at a time) through the same
+SessionLifecycle teardown the worker uses, and checks that RSS, asyncio
+tasks, threads and MetricsAgent objects return to their baseline.
+
+Usage:
+    python loadtest.py --steps 1,5,10,20 --step-seconds 30
+    python loadtest.py --steps 10 --max-loop-lag-p99-ms 50 --max-overhead-ms 150   # regression gate
+    python loadtest.py --steps 5 --llm-pool fake:0.3,fake:1.5:0.2      # provider routing
+    python loadtest.py --soak 300 --soak-concurrency 10 --call-seconds 8 \
+        --max-rss-growth-mb 50 --max-leaked-tasks 0 --max-leaked-sessions 0
+
+Exits with status 1 when a gate threshold is exceeded.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import weakref
+
+# Keep load-test reports and router state out of the working directory and
+# the console quiet.
+# Must be set before agent.settings is imported.
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="loadtest_metrics_"))
+os.environ.setdefault("ROUTER_STATE_DIR", tempfile.mkdtemp(prefix="loadtest_routers_"))
+os.environ.setdefault("METRICS_DISPLAY", "off")
+# All simulated calls share this process, like the thread job executor
+os.environ.setdefault("AGENT_JOB_EXECUTOR", "thread")
+
+from livekit.plugins import silero
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+from agent.agent import MetricsAgent
+from agent.fakes import FakeLLM, FakeSTT, FakeTTS, NullAudioOutput, SyntheticAudioInput
+from agent.lifecycle import SessionLifecycle, rss_bytes
+from agent.loop_monitor import sample_loop_lag
+from agent.providers import build_llm, build_tts
+from agent.session import create_session
+from agent.sketch import LatencySketch
+
+console = Console()
+
+
+def make_agent(index: int, args, vad) -> MetricsAgent:
+    return MetricsAgent(
+        vad=vad,
+        room=f"loadtest-{index}",
+        stt=FakeSTT(
+            utterance_seconds=args.utterance_seconds,
+            pause_seconds=args.pause_seconds,
+            final_delay=args.stt_delay,
+            jitter=args.jitter,
+        ),
+        # --llm-pool/--tts-pool route across several (fake) backends instead
+        llm=build_llm(args.llm_pool) if args.llm_pool else FakeLLM(
+            ttft=args.llm_ttft, tokens_per_second=args.tokens_per_second, jitter=args.jitter
+        ),
+        tts=build_tts(args.tts_pool) if args.tts_pool else FakeTTS(ttfb=args.tts_ttfb, jitter=args.jitter),
+        # only used with CONTEXT_TOKEN_BUDGET; its own instance, like in a real session
+        summary_llm=FakeLLM(ttft=args.llm_ttft, tokens_per_second=args.tokens_per_second, jitter=args.jitter),
+    )
+
+
+async def start_session(metrics_agent: MetricsAgent):
+    session = create_session(metrics_agent, turn_detection="stt")
+    session.input.audio = SyntheticAudioInput()
+    session.output.audio = NullAudioOutput()
+    await session.start(agent=metrics_agent)
+    session.generate_reply(instructions="Greet the user.")
+    return session
+
+
+async def run_session(index: int, args, vad, stop: asyncio.Event, agents: list) -> None:
+    metrics_agent = make_agent(index, args, vad)
+    agents.append(metrics_agent)
+    session = await start_session(metrics_agent)
+
+    await stop.wait()
+    await session.aclose()
+
+
+async def sample_rss_peak(peak: list, stop: asyncio.Event, interval: float = 0.25) -> None:
+    """Keep the highest RSS seen in `peak[0]` until `stop` is set"""
+    while not stop.is_set():
+        peak[0] = max(peak[0], rss_bytes())
+        await asyncio.sleep(interval)
+
+
+async def run_step(sessions: int, args, vad) -> dict:
+    stop = asyncio.Event()
+    lag = LatencySketch()
+    agents: list = []
+
+    rss_start = rss_bytes()
+    rss_peak = [rss_start]
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    lag_task = asyncio.create_task(sample_loop_lag(lag.add, stop=stop))
+    rss_task = asyncio.create_task(sample_rss_peak(rss_peak, stop))
+    tasks = []
+    for i in range(sessions):
+        tasks.append(asyncio.create_task(run_session(i, args, vad, stop, agents)))
+        await asyncio.sleep(args.ramp_seconds / max(1, sessions))
+
+    await asyncio.sleep(args.step_seconds)
+    cpu_seconds = time.process_time() - cpu_start
+    wall_seconds = time.perf_counter() - wall_start
+
+    stop.set()
+    await asyncio.gather(*tasks, lag_task, rss_task, return_exceptions=True)
+
+    # Let the writer threads drain before reading their counters
+    for metrics_agent in agents:
+        await asyncio.to_thread(metrics_agent.writer.flush, 10.0)
+
+    turns = sum(a.turns.turns for a in agents)
+    records = sum(a.writer.processed for a in agents)
+    handler_seconds = sum(a.writer.handler_seconds for a in agents)
+    v2v = LatencySketch()
+    for a in agents:
+        v2v.merge(a.latency.sketches[("turn", "voice_to_voice")].session)
+
+    expected = args.stt_delay + args.llm_ttft + args.tts_ttfb
+    v2v_p50 = v2v.quantile(0.5)
+    result = {
+        "sessions": sessions,
+        "turns": turns,
+        "records": records,
+        "loop_lag_p50_ms": round((lag.quantile(0.5) or 0) * 1000, 2),
+        "loop_lag_p99_ms": round((lag.quantile(0.99) or 0) * 1000, 2),
+        "loop_lag_max_ms": round(lag.max * 1000, 2),
+        "cpu_percent": round(100 * cpu_seconds / wall_seconds, 1),
+        "rss_start_mb": round(rss_start / 2**20, 1),
+        "rss_peak_mb": round(rss_peak[0] / 2**20, 1),
+        "pipeline_ms_per_turn": round(1000 * handler_seconds / turns, 3) if turns else None,
+        "pipeline_ms_per_record": round(1000 * handler_seconds / records, 3) if records else None,
+        "v2v_p50_ms": round(v2v_p50 * 1000, 1) if v2v_p50 is not None else None,
+        "v2v_p95_ms": round(v2v.quantile(0.95) * 1000, 1) if v2v.count else None,
+        "overhead_p50_ms": round((v2v_p50 - expected) * 1000, 1) if v2v_p50 is not None else None,
+        "dropped_records": sum(a.writer.dropped + a.writer.sampled_out for a in agents),
+    }
+
+    # Release writer threads, segment files and stores so the next step starts clean
+    for metrics_agent in agents:
+        await metrics_agent.aclose()
+    return result
+
+
+async def run_call(index: int, args, vad, alive: "weakref.WeakSet") -> dict:
+    """One short call, ended the way a caller hanging up ends it in the worker"""
+    metrics_agent = make_agent(index, args, vad)
+    alive.add(metrics_agent)
+    session = await start_session(metrics_agent)
+    lifecycle = SessionLifecycle(metrics_agent, session)
+
+    await asyncio.sleep(args.call_seconds)
+    lifecycle.participant_left(f"caller-{index}")
+    await lifecycle.wait()
+    return lifecycle.report
+
+
+def soak_sample(alive: "weakref.WeakSet") -> dict:
+    gc.collect()
+    return {
+        "rss_mb": round(rss_bytes() / 2**20, 1),
+        "tasks": len(asyncio.all_tasks()),
+        "threads": threading.active_count(),
+        "sessions": len(alive),
+    }
+
+
+async def run_soak(args, vad) -> dict:
+    alive: "weakref.WeakSet" = weakref.WeakSet()
+    semaphore = asyncio.Semaphore(args.soak_concurrency)
+    samples = []
+    failed = 0
+
+    async def call(index: int) -> None:
+        nonlocal failed
+        async with semaphore:
+            try:
+                await run_call(index, args, vad, alive)
+            except Exception as e:
+                failed += 1
+                console.print(f"[red]❌ call {index} failed: {e}[/red]")
+
+    # The first batch warms up lazy imports, thread pools and allocator
+    # arenas; the baseline is taken once it has fully torn down.
+    warmup = min(args.soak_concurrency, args.soak)
+    await asyncio.gather(*(call(i) for i in range(warmup)))
+    baseline = soak_sample(alive)
+
+    for batch_start in range(warmup, args.soak, args.soak_concurrency * 5):
+        batch = range(batch_start, min(args.soak, batch_start + args.soak_concurrency * 5))
+        await asyncio.gather(*(call(i) for i in batch))
+        samples.append(soak_sample(alive))
+        console.print(f"[dim]{batch.stop}/{args.soak} calls: {samples[-1]}[/dim]")
+
+    final = samples[-1] if samples else baseline
+    return {
+        "calls": args.soak,
+        "failed_calls": failed,
+        "concurrency": args.soak_concurrency,
+        "baseline": baseline,
+        "final": final,
+        "rss_peak_mb": max(sample["rss_mb"] for sample in [baseline] + samples),
+        "rss_growth_mb": round(final["rss_mb"] - baseline["rss_mb"], 1),
+        "leaked_tasks": final["tasks"] - baseline["tasks"],
+        "leaked_threads": final["threads"] - baseline["threads"],
+        "leaked_sessions": final["sessions"],
+    }
+
+
+def check_soak_gates(result: dict, args) -> list:
+    failures = []
+    gates = (
+        ("failed_calls", 0),
+        ("rss_growth_mb", args.max_rss_growth_mb),
+        ("leaked_tasks", args.max_leaked_tasks),
+        ("leaked_sessions", args.max_leaked_sessions),
+    )
+    for field, limit in gates:
+        if limit is not None and result[field] > limit:
+            failures.append(f"soak: {field}={result[field]} > {limit}")
+    return failures
+
+
+def print_soak(result: dict) -> None:
+    table = Table(
+        title=f"[bold cyan]Soak: {result['calls']} calls, {result['concurrency']} at a time[/bold cyan]",
+        box=box.ROUNDED,
+        show_header=True,
+        header_style="bold cyan"
+    )
+    table.add_column("Metric", style="cyan")
+    table.add_column("Baseline", style="yellow")
+    table.add_column("Final", style="yellow")
+    for name, key in (("RSS MB", "rss_mb"), ("Asyncio tasks", "tasks"), ("Threads", "threads"),
+                      ("Live MetricsAgents", "sessions")):
+        table.add_row(name, str(result["baseline"][key]), str(result["final"][key]))
+    table.add_row("Failed calls", "", str(result["failed_calls"]))
+    table.add_row("RSS growth / peak MB", "", f"{result['rss_growth_mb']} / {result['rss_peak_mb']}")
+    console.print(table)
+
+
+def check_gates(results: list, args) -> list:
+    failures = []
+    gates = (
+        ("loop_lag_p99_ms", args.max_loop_lag_p99_ms),
+        ("pipeline_ms_per_turn", args.max_pipeline_ms_per_turn),
+        ("overhead_p50_ms", args.max_overhead_ms),
+        ("dropped_records", args.max_dropped),
+    )
+    for result in results:
+        for field, limit in gates:
+            value = result.get(field)
+            if limit is not None and value is not None and value > limit:
+                failures.append(f"{result['sessions']} sessions: {field}={value} > {limit}")
+    return failures
+
+
+def print_results(results: list) -> None:
+    table = Table(
+        title="[bold cyan]Agent Load Test[/bold cyan]",
+        box=box.ROUNDED,
+        show_header=True,
+        header_style="bold cyan"
+    )
+    columns = (
+        ("Sessions", "sessions"), ("Turns", "turns"),
+        ("Loop lag p50/p99/max ms", None), ("CPU %", "cpu_percent"),
+        ("RSS MB (start→peak)", None), ("Pipeline ms/turn", "pipeline_ms_per_turn"),
+        ("V2V p50/p95 ms", None), ("Overhead p50 ms", "overhead_p50_ms"), ("Dropped", "dropped_records"),
+    )
+    for name, _ in columns:
+        table.add_column(name, style="yellow")
+    for r in results:
+        table.add_row(
+            str(r["sessions"]), str(r["turns"]),
+            f"{r['loop_lag_p50_ms']}/{r['loop_lag_p99_ms']}/{r['loop_lag_max_ms']}",
+            str(r["cpu_percent"]),
+            f"{r['rss_start_mb']}→{r['rss_peak_mb']}",
+            str(r["pipeline_ms_per_turn"]),
+            f"{r['v2v_p50_ms']}/{r['v2v_p95_ms']}",
+            str(r["overhead_p50_ms"]),
+            str(r["dropped_records"]),
+        )
+    console.print(table)
+
+
+async def main(args) -> int:
+    vad = silero.VAD.load()
+    if args.soak:
+        result = await run_soak(args, vad)
+        print_soak(result)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as fp:
+                json.dump(result, fp, indent=2)
+        failures = check_soak_gates(result, args)
+        for failure in failures:
+            console.print(f"[red]❌ Gate failed: {failure}[/red]")
+        return 1 if failures else 0
+
+    results = []
+    for sessions in (int(n) for n in args.steps.split(",")):
+        console.print(f"[bold blue]▶ Ramping to {sessions} concurrent sessions for {args.step_seconds}s[/bold blue]")
+        results.append(await run_step(sessions, args, vad))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=2)
+
+    failures = check_gates(results, args)
+    for failure in failures:
+        console.print(f"[red]❌ Gate failed: {failure}[/red]")
+    return 1 if failures else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Offline load test with fake STT/LLM/TTS providers")
+    parser.add_argument("--steps", default="1,5,10", help="comma-separated concurrent session counts")
+    parser.add_argument("--step-seconds", type=float, default=30.0, help="measurement time per step")
+    parser.add_argument("--ramp-seconds", type=float, default=5.0, help="time to start all sessions of a step")
+    parser.add_argument("--utterance-seconds", type=float, default=2.0)
+    parser.add_argument("--pause-seconds", type=float, default=4.0)
+    parser.add_argument("--stt-delay", type=float, default=0.15, help="fake STT final transcript delay")
+    parser.add_argument("--llm-ttft", type=float, default=0.35, help="fake LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="fake LLM token rate")
+    parser.add_argument("--tts-ttfb", type=float, default=0.2, help="fake TTS time to first byte")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform jitter added to fake latencies")
+    parser.add_argument("--llm-pool", default="", help="routed LLM pool, e.g. fake:0.3,fake:1.5:0.2")
+    parser.add_argument("--tts-pool", default="", help="routed TTS pool, e.g. fake:0.2,fake:0.8")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--max-loop-lag-p99-ms", type=float)
+    parser.add_argument("--max-pipeline-ms-per-turn", type=float)
+    parser.add_argument("--max-overhead-ms", type=float)
+    parser.add_argument("--max-dropped", type=int)
+    parser.add_argument("--soak", type=int, default=0, metavar="CALLS", help="run this many short calls instead of the ramp")
+    parser.add_argument("--soak-concurrency", type=int, default=5, help="calls in flight at once during --soak")
+    parser.add_argument("--call-seconds", type=float, default=8.0, help="length of each --soak call")
+    parser.add_argument("--max-rss-growth-mb", type=float)
+    parser.add_argument("--max-leaked-tasks", type=int)
+    parser.add_argument("--max-leaked-sessions", type=int)
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(build_parser().parse_args())))
@@ -0,0 +1,107 @@
+"""
+Worker admission: the load reported to the dispatcher includes one more
+session and the jobs accepted but not running yet, and `admit` rejects
+requests once that reaches the threshold or the job cap.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("psutil")
+
+from agent import admission
+from agent.admission import WorkerLoad, admit
+
+
+class FakeCpu:
+    """cpu_times() readings with a chosen machine CPU between consecutive reports"""
+
+    def __init__(self):
+        self.busy, self.total = 0.0, 0.0
+
+    def __call__(self):
+        return self.busy, self.total
+
+    def advance(self, cpu, seconds=10.0):
+        self.busy += cpu * seconds
+        self.total += seconds
+
+
+def _worker(*job_ids):
+    return SimpleNamespace(active_jobs=[SimpleNamespace(job=SimpleNamespace(id=job_id)) for job_id in job_ids])
+
+
+class FakeRequest:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.room = SimpleNamespace(name=f"room-{job_id}")
+        self.outcome = None
+
+    async def accept(self):
+        self.outcome = "accepted"
+
+    async def reject(self):
+        self.outcome = "rejected"
+
+
+@pytest.fixture
+def cpu(monkeypatch):
+    fake = FakeCpu()
+    monkeypatch.setattr(admission, "cpu_times", fake)
+    return fake
+
+
+def test_pending_jobs_count_until_they_run(cpu):
+    load = WorkerLoad(threshold=0.8, smoothing=1.0)
+    cpu.advance(0.4)
+    assert load(_worker("a", "b")) == pytest.approx(0.6)  # 0.4 now + 0.2 for one more
+
+    load.accept("c")
+    assert load.pending == 1 and load.projected() == pytest.approx(0.8) and load.full()
+
+    # "c" is running by the next report: no longer pending, now part of the CPU
+    cpu.advance(0.6)
+    assert load(_worker("a", "b", "c")) == pytest.approx(0.8)
+    assert load.pending == 0 and load.jobs == 3
+
+
+def test_stale_pending_jobs_expire(cpu):
+    load = WorkerLoad(threshold=0.8, smoothing=1.0)
+    load.accept("never-started")
+    load.accepted["never-started"] = time.monotonic() - admission.PENDING_TIMEOUT - 1
+
+    cpu.advance(0.1)
+    load(_worker())
+
+    assert load.pending == 0
+
+
+def test_max_jobs_cap(cpu):
+    load = WorkerLoad(threshold=0.8, max_jobs=4, smoothing=1.0)
+    cpu.advance(0.05)
+    load(_worker("a", "b", "c"))
+    assert not load.full()
+
+    load.accept("d")
+    # four of four jobs: full even though the CPU is idle
+    assert load.projected() == pytest.approx(0.8) and load.full()
+
+
+def test_admit_accepts_until_full(cpu, monkeypatch):
+    load = WorkerLoad(threshold=0.8, max_jobs=2, smoothing=1.0)
+    monkeypatch.setattr(admission, "WORKER_LOAD", load)
+    cpu.advance(0.1)
+    load(_worker())
+
+    requests = [FakeRequest(job_id) for job_id in ("a", "b", "c")]
+
+    async def dispatch():
+        for request in requests:
+            await admit(request)
+
+    asyncio.run(dispatch())
+
+    assert [request.outcome for request in requests] == ["accepted", "accepted", "rejected"]
+    assert set(load.accepted) == {"a", "b"}
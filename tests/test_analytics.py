@@ -0,0 +1,65 @@
+"""
+Cross-session analytics: the regression verdict of `compare`, its rank test,
+and reading segments that contain a torn or foreign line.
+"""
+import json
+import random
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from agent.analytics import _read_jsonl, compare, load_session, mann_whitney_p
+
+
+def _samples(metric, values):
+    return pd.DataFrame({"metric": [metric] * len(values), "value": values})
+
+
+def test_mann_whitney_p():
+    low = pd.Series([0.1 * i for i in range(30)])
+    high = low + 5.0
+
+    assert mann_whitney_p(low, high) < 1e-6
+    assert mann_whitney_p(high, low) > 0.999
+    assert mann_whitney_p(low, low.copy()) == pytest.approx(0.5, abs=0.01)
+
+
+def test_compare_verdicts():
+    rng = random.Random(11)
+    base = [rng.gauss(0.5, 0.05) for _ in range(200)]
+    slower = [value * 1.5 for value in base]
+    baseline = pd.concat([_samples("llm.ttft", base), _samples("tts.ttfb", base),
+                          _samples("llm.tokens_per_second", base), _samples("stt.duration", base[:5])])
+    candidate = pd.concat([_samples("llm.ttft", slower), _samples("tts.ttfb", base),
+                           _samples("llm.tokens_per_second", slower), _samples("stt.duration", slower[:5])])
+
+    result = compare(baseline, candidate).set_index("metric")
+
+    assert result.loc["llm.ttft", "verdict"] == "REGRESSION"
+    assert result.loc["llm.ttft", "p50_change_pct"] == pytest.approx(50.0, abs=0.1)
+    assert result.loc["tts.ttfb", "verdict"] == "ok"
+    # more tokens per second is an improvement, not a regression
+    assert result.loc["llm.tokens_per_second", "verdict"] == "improved"
+    assert result.loc["stt.duration", "verdict"] == "too few samples"
+
+
+def test_unreadable_lines_are_skipped(tmp_path, capsys):
+    segment = tmp_path / "llm_000001.jsonl"
+    lines = [
+        json.dumps({"timestamp": 1.0, "ttft": 0.4, "label": "x"}),
+        '{"timestamp": 2.0, "ttft": 0.',  # torn write
+        json.dumps([1, 2, 3]),
+        "",
+        json.dumps({"timestamp": 3.0, "ttft": 0.5}),
+    ]
+    segment.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    records = _read_jsonl(segment, ("timestamp", "ttft"))
+
+    assert records == [{"timestamp": 1.0, "ttft": 0.4}, {"timestamp": 3.0, "ttft": 0.5}]
+    assert "skipped 2 unreadable line(s)" in capsys.readouterr().err
+
+    # the session loader keeps the readable samples
+    frame = load_session(tmp_path)
+    assert sorted(frame.loc[frame["metric"] == "llm.ttft", "value"]) == [0.4, 0.5]
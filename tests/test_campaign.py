@@ -0,0 +1,97 @@
+"""
+Outbound campaign against a fake LiveKit API: bounded concurrency, retries
+on transient errors only, and one JSONL result per number.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("livekit.api")
+
+from livekit import api
+
+import call
+
+
+class FakeSIP:
+    """`create_sip_participant` that fails each number's first attempts as scripted"""
+
+    def __init__(self, failures):
+        self.failures = {number: list(errors) for number, errors in failures.items()}
+        self.attempts = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create_sip_participant(self, request):
+        number = request.sip_call_to
+        self.attempts[number] = self.attempts.get(number, 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.02)
+            errors = self.failures.get(number)
+            if errors:
+                raise errors.pop(0)
+            return SimpleNamespace(participant_id=f"PA_{number}", sip_call_id=f"SC_{number}")
+        finally:
+            self.in_flight -= 1
+
+
+class FakeAPI:
+    def __init__(self, sip):
+        self.sip = sip
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_campaign_retries_transient_errors_only(tmp_path):
+    busy = api.TwirpError("unavailable", "busy", status=503, metadata={"sip_status_code": "486"})
+    invalid = api.TwirpError("invalid_argument", "bad number", status=400)
+    sip = FakeSIP({
+        "+100": [],
+        "+101": [asyncio.TimeoutError(), busy],
+        "+102": [invalid],
+        "+103": [busy, busy, busy],
+        "+104": [],
+        "+105": [],
+    })
+    results_path = tmp_path / "results.jsonl"
+    client = FakeAPI(sip)
+
+    summary = asyncio.run(call.run_campaign(
+        list(sip.failures), results_path=str(results_path), concurrency=2,
+        calls_per_second=1000, burst=10, retries=2, backoff=0.01, livekit_api=client,
+    ))
+
+    assert summary == {"total": 6, "connected": 4, "failed": 2}
+    assert sip.max_in_flight == 2
+    # a caller-owned client is left open
+    assert not client.closed
+
+    results = {row["phone_number"]: row for row in map(json.loads, results_path.read_text().splitlines())}
+    assert results["+101"]["outcome"] == "connected" and results["+101"]["attempts"] == 3
+    assert results["+101"]["sip_call_id"] == "SC_+101" and results["+101"]["error"] is None
+    # permanent errors are not retried
+    assert results["+102"]["attempts"] == 1 and results["+102"]["permanent"]
+    assert results["+103"]["attempts"] == 3 and not results["+103"]["permanent"]
+    assert len({row["room"] for row in results.values()}) == 6
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = call.RateLimiter(rate=50.0)
+
+    async def starts():
+        loop = asyncio.get_running_loop()
+        times = []
+        for _ in range(5):
+            await limiter.acquire()
+            times.append(loop.time())
+        return times
+
+    times = asyncio.run(starts())
+    # no burst: the first call starts at once, then one every 20ms
+    assert times[-1] - times[0] >= 4 * 0.02 * 0.9
@@ -0,0 +1,28 @@
+"""
+Context size per user turn: the turn's context plus the user's new message,
+which livekit only appends after `on_user_turn_completed`.
+"""
+import pytest
+
+pytest.importorskip("livekit.agents")
+
+from livekit.agents import llm
+
+from agent.context import ContextManager, estimate_tokens
+from agent.fakes import FakeLLM
+
+
+def test_turn_metrics_count_the_new_message():
+    manager = ContextManager(agent=None, summarizer=FakeLLM())
+    turn_ctx = llm.ChatContext.empty()
+    turn_ctx.add_message(role="system", content="You are a helpful assistant.")
+    turn_ctx.add_message(role="user", content="Hi there")
+    turn_ctx.add_message(role="assistant", content="Hello! How can I help you today?")
+    new_message = llm.ChatMessage(role="user", content=["Can I book a table for four people at seven tonight?"])
+
+    without = manager.turn_metrics(turn_ctx)
+    metrics = manager.turn_metrics(turn_ctx, new_message)
+
+    assert metrics.messages == without.messages + 1 == 4
+    assert metrics.context_tokens == without.context_tokens + estimate_tokens(new_message.text_content)
+    assert metrics.full_tokens == metrics.context_tokens and metrics.tokens_saved == 0
@@ -0,0 +1,37 @@
+"""
+The live panel under the process executor: job processes relay their records
+and the worker's main process renders one row per session.
+"""
+import pytest
+
+from agent import display
+from agent.display import LogDisplay, RelayDisplay, WorkerDashboard, make_display
+from agent.sketch import LatencyStats
+
+
+def test_process_executor_relays_or_falls_back(monkeypatch):
+    monkeypatch.setattr(display.EXPORTER, "_client", None)
+    assert type(make_display("live", "s", LatencyStats(), job_executor="process")) is LogDisplay
+
+    monkeypatch.setattr(display.EXPORTER, "_client", object())
+    assert type(make_display("live", "s", LatencyStats(), job_executor="process")) is RelayDisplay
+
+
+def test_worker_dashboard_rows_from_forwarded_records(monkeypatch):
+    dashboard = WorkerDashboard(refresh_per_second=1.0)
+    monkeypatch.setattr(display, "_dashboard", None)
+
+    for ttft in (0.4, 0.4, 0.6):
+        dashboard.record("llm", {"timestamp": 1e12, "ttft": ttft}, "session-a")
+    dashboard.record("turn", {"timestamp": 1e12, "voice_to_voice": 1.2, "critical_stage": "llm_ttft"}, "session-a")
+    try:
+        (session,) = display._dashboard._sessions.values()
+        snapshot = session.snapshot(now=1e12)
+        assert snapshot["counts"] == {"llm": 3}
+        assert snapshot["last_turn"] == "1.200s (llm_ttft)"
+        p50, _ = snapshot["llm.ttft"].split(" / ")
+        assert float(p50) == pytest.approx(0.4, rel=0.01)
+    finally:
+        dashboard.record("closed", {}, "session-a")
+
+    assert not display._dashboard._sessions
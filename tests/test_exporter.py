@@ -0,0 +1,110 @@
+"""
+Scrape the Prometheus exporter over HTTP: a local server on an ephemeral
+port has to serve every metric family with the labels Grafana queries by.
+"""
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from agent.exporter import ADDRESS_ENV, AUTHKEY_ENV, PrometheusExporter
+
+
+@pytest.fixture
+def exporter():
+    exporter = PrometheusExporter(max_rooms=2)
+    assert exporter.start(0, host="127.0.0.1")
+    yield exporter
+    exporter.stop()
+
+
+def _scrape(exporter, path="/metrics"):
+    with urllib.request.urlopen(f"http://127.0.0.1:{exporter.port}{path}", timeout=5) as response:
+        assert response.status == 200
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        return response.read().decode("utf-8")
+
+
+def test_scrape_families_and_labels(exporter):
+    exporter.observe("llm", {
+        "label": "openai.LLM", "cancelled": False, "prompt_tokens": 120,
+        "completion_tokens": 30, "ttft": 0.4, "duration": 1.2,
+    }, "room-a")
+    exporter.observe("tts", {
+        "label": "openai.TTS", "cancelled": True, "characters_count": 42,
+        "audio_duration": 2.5, "ttfb": 0.2, "duration": 0.9,
+    }, "room-a")
+    exporter.observe("turn", {"voice_to_voice": 1.1}, "room-a")
+    exporter.loop_lag.observe((), 0.003)
+    exporter.phrase_cache.inc(("hit",))
+
+    body = _scrape(exporter)
+
+    for family, kind in (
+        ("agent_requests_total", "counter"),
+        ("agent_llm_tokens_total", "counter"),
+        ("agent_llm_ttft_seconds", "histogram"),
+        ("agent_tts_ttfb_seconds", "histogram"),
+        ("agent_voice_to_voice_seconds", "histogram"),
+        ("agent_loop_lag_seconds", "histogram"),
+        ("agent_phrase_cache_requests_total", "counter"),
+        ("agent_active_sessions", "gauge"),
+        ("agent_metrics_queue_depth", "gauge"),
+    ):
+        assert f"# TYPE {family} {kind}" in body
+
+    assert 'agent_requests_total{room="room-a",label="openai.LLM",kind="llm"} 1.0' in body
+    assert 'agent_cancelled_requests_total{room="room-a",label="openai.TTS",kind="tts"} 1.0' in body
+    assert 'agent_llm_tokens_total{room="room-a",label="openai.LLM",direction="prompt"} 120.0' in body
+    assert 'agent_llm_ttft_seconds_bucket{room="room-a",label="openai.LLM",le="0.5"} 1.0' in body
+    assert 'agent_llm_ttft_seconds_bucket{room="room-a",label="openai.LLM",le="+Inf"} 1.0' in body
+    assert 'agent_llm_ttft_seconds_count{room="room-a",label="openai.LLM"} 1.0' in body
+    assert 'agent_voice_to_voice_seconds_sum{room="room-a"} 1.1' in body
+    assert 'agent_phrase_cache_requests_total{result="hit"} 1.0' in body
+    assert "agent_active_sessions 0.0" in body
+
+
+def test_oldest_room_is_forgotten(exporter):
+    for room in ("room-a", "room-b", "room-c"):
+        exporter.observe("turn", {"voice_to_voice": 0.8}, room)
+
+    body = _scrape(exporter)
+
+    assert 'room="room-a"' not in body
+    assert 'agent_voice_to_voice_seconds_count{room="room-b"} 1.0' in body
+    assert 'agent_voice_to_voice_seconds_count{room="room-c"} 1.0' in body
+
+
+def test_label_values_are_escaped(exporter):
+    exporter.observe("turn", {"voice_to_voice": 0.5}, 'room "quoted"\nnext')
+
+    assert 'agent_voice_to_voice_seconds_count{room="room \\"quoted\\"\\nnext"} 1.0' in _scrape(exporter)
+
+
+def test_unknown_path_is_404(exporter):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _scrape(exporter, "/nope")
+    assert error.value.code == 404
+
+
+def test_job_records_reach_the_worker(monkeypatch):
+    # serve_jobs publishes its address to job processes through the environment
+    monkeypatch.setenv(ADDRESS_ENV, "")
+    monkeypatch.setenv(AUTHKEY_ENV, "")
+    worker = PrometheusExporter()
+    received = []
+    worker.on_record = lambda *args: received.append(args)
+    worker.serve_jobs()
+    job = PrometheusExporter()
+    try:
+        assert job.connect_to_worker() and job.forwarding
+        job.forward_record("llm", {"ttft": 0.4}, "session-a")
+
+        deadline = time.monotonic() + 5
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        worker._listener.close()
+
+    assert received == [("llm", {"ttft": 0.4}, "session-a")]
@@ -0,0 +1,90 @@
+"""
+A closed session must not be kept alive by the worker process: after
+`SessionLifecycle.aclose()` the MetricsAgent (and with it its store, writer
+thread and segment files) has to be garbage collected.
+"""
+import asyncio
+import gc
+import weakref
+
+import pytest
+
+from agent.lifecycle import PROCESS_JOBS, SessionLifecycle
+
+
+class FakeStore:
+    nbytes = 0
+
+
+class FakeMetricsAgent:
+    room = "test-room"
+
+    def __init__(self) -> None:
+        self.store = FakeStore()
+        self.closed = False
+
+    def timed(self, name):
+        return lambda callback: callback
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.handlers = {}
+        self.closed = False
+
+    def on(self, event, callback=None):
+        self.handlers[event] = callback
+        return callback
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+def _run_call(metrics_agent, session) -> None:
+    async def call() -> None:
+        lifecycle = SessionLifecycle(metrics_agent, session)
+        lifecycle.spawn(asyncio.sleep(3600))
+        # the session closing ends the job
+        session.handlers["close"](None)
+        await lifecycle.wait()
+        assert lifecycle.closed
+        assert lifecycle.report["reason"] == "session closed"
+
+    asyncio.run(call())
+
+
+def test_closed_session_is_collected():
+    finished = PROCESS_JOBS["finished"]
+    metrics_agent, session = FakeMetricsAgent(), FakeSession()
+    _run_call(metrics_agent, session)
+
+    assert metrics_agent.closed and session.closed
+    assert PROCESS_JOBS["finished"] == finished + 1
+    agent_ref, session_ref = weakref.ref(metrics_agent), weakref.ref(session)
+    del metrics_agent, session
+    gc.collect()
+    assert agent_ref() is None
+    assert session_ref() is None
+
+
+def test_metrics_agent_is_collected_after_close(tmp_path, monkeypatch):
+    pytest.importorskip("livekit.agents")
+    from agent import settings
+    from agent.agent import MetricsAgent
+    from agent.fakes import FakeLLM, FakeSTT, FakeTTS
+
+    monkeypatch.setattr(settings, "METRICS_DIR", tmp_path)
+    monkeypatch.setattr(settings, "METRICS_DISPLAY", "off")
+
+    async def call():
+        metrics_agent = MetricsAgent(room="test-room", stt=FakeSTT(), llm=FakeLLM(), tts=FakeTTS(), vad=object())
+        lifecycle = SessionLifecycle(metrics_agent, FakeSession())
+        await lifecycle.aclose("test")
+        return weakref.ref(metrics_agent)
+
+    agent_ref = asyncio.run(call())
+    gc.collect()
+    assert agent_ref() is None
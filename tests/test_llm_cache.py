@@ -0,0 +1,67 @@
+"""
+LLM response cache: a repeated question is answered from disk, but only in
+the scope (room) it was first answered in, and lookups stay off the loop.
+"""
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("livekit.agents")
+
+from livekit.agents import llm
+
+from agent.fakes import FakeLLM
+from agent.llm_cache import CachingLLM, ResponseCache
+
+
+async def _ask(model, question="What are your opening hours?"):
+    chat_ctx = llm.ChatContext.empty()
+    chat_ctx.add_message(role="system", content="You are a helpful assistant.")
+    chat_ctx.add_message(role="user", content=question)
+    parts = []
+    async with model.chat(chat_ctx=chat_ctx) as stream:
+        async for chunk in stream:
+            if chunk.delta is not None and chunk.delta.content:
+                parts.append(chunk.delta.content)
+    return "".join(parts)
+
+
+def _caching(cache, scope, response):
+    model = CachingLLM(FakeLLM(ttft=0.01, tokens_per_second=1000, response=response), cache=cache, scope=scope)
+    records = []
+    model.on("cache_metrics", records.append)
+    return model, records
+
+
+def test_answers_are_replayed_within_their_scope(tmp_path):
+    cache = ResponseCache(tmp_path)
+    first, first_records = _caching(cache, "room-a", "Nine to five, Alice.")
+    again, again_records = _caching(cache, "room-a", "fresh answer")
+    other, other_records = _caching(cache, "room-b", "Nine to five.")
+
+    async def calls():
+        return await _ask(first), await _ask(again), await _ask(other)
+
+    answers = asyncio.run(calls())
+
+    assert [answer.strip() for answer in answers] == ["Nine to five, Alice.", "Nine to five, Alice.", "Nine to five."]
+    assert [r.hit for r in first_records + again_records + other_records] == [False, True, False]
+    assert cache.stats()["entries"] == 2
+
+
+def test_lookup_runs_off_the_loop(tmp_path, monkeypatch):
+    cache = ResponseCache(tmp_path)
+    lookup_threads = []
+    get = cache.get
+
+    def tracked_get(key, count=True):
+        lookup_threads.append(threading.get_ident())
+        return get(key, count)
+
+    monkeypatch.setattr(cache, "get", tracked_get)
+    model, _ = _caching(cache, "", "Nine to five.")
+
+    asyncio.run(_ask(model))
+
+    assert lookup_threads and threading.get_ident() not in lookup_threads
@@ -0,0 +1,69 @@
+"""
+Loop monitor: per-callback timing, and a blocked loop reported as a stall
+with the stack the watchdog sampled while it was blocked.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from agent.loop_monitor import LoopMonitor
+
+
+class FakeMetricsAgent:
+    def __init__(self, speech_id=""):
+        self.records = []
+        self.session = SimpleNamespace(current_speech=SimpleNamespace(id=speech_id) if speech_id else None)
+
+    def submit_metrics(self, metrics):
+        self.records.append(metrics)
+        return True
+
+
+def test_timed_callbacks():
+    monitor = LoopMonitor(asyncio.new_event_loop(), callback_threshold=0.02)
+    subscriber = FakeMetricsAgent("speech-1")
+    monitor._subscribers.add(subscriber)
+
+    @monitor.timed("room.track_subscribed")
+    def handler(value):
+        if value == "slow":
+            time.sleep(0.05)
+        return value
+
+    assert [handler("fast"), handler("fast"), handler("slow")] == ["fast", "fast", "slow"]
+    assert handler.__name__ == "handler"
+
+    (row,) = monitor.rows()
+    assert row["callback"] == "room.track_subscribed" and row["calls"] == 3 and row["slow"] == 1
+    assert row["max_ms"] >= 50
+    (record,) = subscriber.records
+    assert record.source == "callback" and record.name == "room.track_subscribed"
+    assert record.duration >= 0.05 and record.speech_id == "speech-1"
+
+
+def block_the_loop():
+    time.sleep(0.3)
+
+
+def test_stall_is_emitted_with_a_stack():
+    subscriber = FakeMetricsAgent()
+
+    async def call():
+        monitor = LoopMonitor(asyncio.get_running_loop(), interval=0.01, stall_threshold=0.1)
+        monitor.subscribe(subscriber)
+        await asyncio.sleep(0.05)
+        monitor.timed("session.user_input_transcribed", block_the_loop)()
+        await asyncio.sleep(0.05)
+        monitor.unsubscribe(subscriber)
+        return monitor
+
+    monitor = asyncio.run(call())
+
+    stalls = [record for record in subscriber.records if record.source == "loop"]
+    assert len(stalls) == 1 and stalls[0].duration >= 0.2
+    # sampled by the watchdog while the callback was still blocking
+    assert stalls[0].name == "session.user_input_transcribed"
+    assert "block_the_loop" in stalls[0].stack
+    assert monitor.stalls == 1
+    lag = monitor.session_lag(subscriber)
+    assert lag.stalls == 1 and lag.sketch.count >= 2
@@ -0,0 +1,44 @@
+"""
+Phrase cache: a miss synthesizes and stores the phrase, the next lookup plays
+the same audio from the mapping, and lookups stay off the event loop.
+"""
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("livekit.agents")
+
+from agent.fakes import FakeTTS
+from agent.phrase_cache import PhraseCache, phrase_audio
+
+
+async def _pcm(frames) -> bytes:
+    return b"".join([bytes(frame.data.cast("B")) async for frame in frames])
+
+
+def test_miss_then_hit_off_the_loop(tmp_path):
+    cache = PhraseCache(tmp_path, max_bytes=2**20)
+    tts = FakeTTS(ttfb=0.0, realtime_factor=0.0)
+    lookup_threads = []
+    open_phrase = cache.open
+
+    def tracked_open(key):
+        lookup_threads.append(threading.get_ident())
+        return open_phrase(key)
+
+    cache.open = tracked_open
+
+    async def play_twice():
+        audio, hit = await phrase_audio(tts, "Hello there.", cache)
+        assert not hit
+        synthesized = await _pcm(audio)
+        audio, hit = await phrase_audio(tts, "Hello there.", cache)
+        assert hit
+        return synthesized, await _pcm(audio)
+
+    synthesized, cached = asyncio.run(play_twice())
+
+    assert synthesized and cached == synthesized
+    assert threading.get_ident() not in lookup_threads
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1 and cache.stats()["writes"] == 1
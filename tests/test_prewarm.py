@@ -0,0 +1,22 @@
+"""
+prewarm runs in a fresh job process before any job is assigned to it, so it
+must not touch anything that needs a job context.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("livekit.plugins.silero")
+
+from agent import prewarm as prewarm_module
+
+
+def test_prewarm_outside_a_job(monkeypatch):
+    monkeypatch.setattr(prewarm_module, "_models", {})
+    proc = SimpleNamespace(userdata={})
+
+    prewarm_module.prewarm(proc)
+
+    assert proc.userdata["prewarmed"] is True
+    assert prewarm_module._models["vad"] is not None
+    assert set(prewarm_module._models) == {"vad", "model_load_seconds"}
@@ -0,0 +1,162 @@
+"""
+Hedging, failover and cooldown of the provider router, offline: pools of
+fake LLM/TTS backends with fixed latency and error profiles.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("livekit.agents")
+
+from livekit.agents import APIConnectionError, llm
+
+from agent import providers, settings
+from agent.fakes import FakeLLM, FakeTTS
+from agent.routing import LatencyRouter, RoutingLLM, RoutingTTS, SharedRouterState
+
+
+def _llm_pool(router, max_hedges=1, **backends):
+    pool = RoutingLLM(backends, router, max_hedges=max_hedges)
+    records = []
+    pool.on("routing_metrics", records.append)
+    return pool, records
+
+
+async def _complete(pool) -> str:
+    chat_ctx = llm.ChatContext.empty()
+    chat_ctx.add_message(role="user", content="what are your opening hours")
+    parts = []
+    async with pool.chat(chat_ctx=chat_ctx) as stream:
+        async for chunk in stream:
+            if chunk.delta is not None and chunk.delta.content:
+                parts.append(chunk.delta.content)
+    return "".join(parts)
+
+
+def test_slow_backend_is_hedged():
+    # both unmeasured, so the slow one (listed first) is tried first
+    router = LatencyRouter(["slow", "fast"], hedge_after=0.1)
+    pool, records = _llm_pool(
+        router,
+        slow=FakeLLM(ttft=2.0, tokens_per_second=1000, response="slow answer"),
+        fast=FakeLLM(ttft=0.05, tokens_per_second=1000, response="fast answer"),
+    )
+
+    text = asyncio.run(_complete(pool))
+
+    assert text.strip() == "fast answer"
+    (record,) = records
+    assert record.backend == "fast" and record.hedged and record.failovers == 0
+    assert record.ttft < 1.0
+    # the cancelled loser is a lower bound, not a latency sample
+    assert router.health["slow"].lost == 1
+    assert router.health["slow"].recent().count == 0
+    assert router.health["fast"].recent().count == 1
+    assert router.ranked()[0] == "fast"
+
+
+def test_no_hedge_without_budget():
+    router = LatencyRouter(["slow", "fast"], hedge_after=0.05)
+    pool, records = _llm_pool(
+        router,
+        max_hedges=0,
+        slow=FakeLLM(ttft=0.3, tokens_per_second=1000, response="slow answer"),
+        fast=FakeLLM(ttft=0.01, tokens_per_second=1000, response="fast answer"),
+    )
+
+    assert asyncio.run(_complete(pool)).strip() == "slow answer"
+    assert not records[0].hedged
+
+
+def test_error_fails_over_and_repeated_errors_cool_down():
+    router = LatencyRouter(["broken", "ok"], cooldown=30.0)
+    pool, records = _llm_pool(
+        router,
+        max_hedges=0,
+        broken=FakeLLM(ttft=0.01, error_rate=1.0),
+        ok=FakeLLM(ttft=0.02, tokens_per_second=1000, response="fine"),
+    )
+
+    async def calls():
+        return [await _complete(pool) for _ in range(3)]
+
+    assert [text.strip() for text in asyncio.run(calls())] == ["fine"] * 3
+    assert all(record.backend == "ok" for record in records)
+    # two errors in a row take the backend out of rotation ...
+    assert [record.failovers for record in records] == [1, 1, 0]
+    broken = router.health["broken"]
+    assert broken.errors == 2 and broken.consecutive_errors == 2
+    assert not broken.healthy(broken.down_until - 1)
+    # ... and the third request went straight to the healthy one
+    assert router.ranked() == ["ok", "broken"]
+
+
+def test_every_backend_failing_raises():
+    router = LatencyRouter(["a", "b"])
+    pool, _ = _llm_pool(router, max_hedges=0, a=FakeLLM(ttft=0.01, error_rate=1.0), b=FakeLLM(ttft=0.01, error_rate=1.0))
+
+    with pytest.raises(APIConnectionError):
+        asyncio.run(_complete(pool))
+    assert router.health["a"].errors == 1 and router.health["b"].errors == 1
+
+
+def test_tts_fails_over_per_sentence():
+    router = LatencyRouter(["broken", "ok"])
+    pool = RoutingTTS(
+        {"broken": FakeTTS(ttfb=0.01, error_rate=1.0), "ok": FakeTTS(ttfb=0.02, realtime_factor=0.0)},
+        router,
+        max_hedges=0,
+    )
+    records = []
+    pool.on("routing_metrics", records.append)
+
+    async def synthesize():
+        frames = 0
+        async with pool.synthesize("Hello there.") as stream:
+            async for _ in stream:
+                frames += 1
+        return frames
+
+    assert asyncio.run(synthesize()) > 0
+    (record,) = records
+    assert record.kind == "tts" and record.backend == "ok" and record.failovers == 1
+
+
+def test_shared_state_seeds_other_processes(tmp_path):
+    # two job processes' routers for the same pool
+    first = LatencyRouter(["a", "b"], shared=SharedRouterState(tmp_path, "llm-pool", interval=0.0, member="1"))
+    second = LatencyRouter(
+        ["a", "b"], hedge_min=0.05, shared=SharedRouterState(tmp_path, "llm-pool", interval=0.0, member="2")
+    )
+    for _ in range(5):
+        first.observe("a", 0.9)
+        first.observe("b", 0.2)
+    for _ in range(2):
+        first.failure("a")
+
+    async def sync():
+        await first.sync()
+        await second.sync()
+
+    asyncio.run(sync())
+
+    # the fresh process ranks by the other's window instead of probing
+    assert second.ranked() == ["b", "a"]
+    assert second.health["b"].recent().count == 5
+    assert not second.health["a"].healthy(first.health["a"].down_until - 1)
+    # five samples: the hedge deadline follows their p95 instead of hedge_max
+    assert second.hedge_delay("b") == pytest.approx(0.2, rel=0.02)
+    assert sorted(path.name for path in (tmp_path / "llm-pool").iterdir()) == ["1.json", "2.json"]
+
+
+def test_summarizer_pool_has_its_own_router(monkeypatch):
+    monkeypatch.setattr(settings, "ROUTER_SYNC_SECONDS", 0.0)
+    monkeypatch.setattr(providers, "ROUTERS", {})
+    spec = "fake:0.1,fake:0.2"
+
+    conversation = providers.build_llm(spec)
+    summarizer = providers.build_llm(spec, kind="summary")
+
+    assert conversation.router is providers.build_llm(spec).router
+    assert summarizer.router is not conversation.router
+    assert set(providers.ROUTERS) == {("llm", spec), ("summary", spec)}
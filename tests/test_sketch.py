@@ -0,0 +1,75 @@
+"""
+Latency sketches: quantiles within the configured relative accuracy, and
+merging per-call sketches equals sketching all the samples at once.
+"""
+import random
+
+import pytest
+
+from agent.sketch import LatencySketch, LatencyStats, RollingSketch
+
+
+def _exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def _sketch(values):
+    sketch = LatencySketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_quantiles_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(-1.0, 0.8) for _ in range(5000)]
+    sketch = _sketch(values)
+
+    for q in (0.5, 0.95, 0.99):
+        assert sketch.quantile(q) == pytest.approx(_exact(values, q), rel=0.01)
+    assert sketch.quantile(1.0) == pytest.approx(max(values), rel=0.01)
+    assert sketch.count == 5000 and sketch.mean == pytest.approx(sum(values) / 5000)
+
+
+def test_empty_and_zero_values():
+    assert LatencySketch().quantile(0.5) is None
+
+    sketch = _sketch([0.0, 0.0, 0.0, 0.5])
+
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(0.5, rel=0.01)
+
+
+def test_merge_equals_one_sketch_of_all_samples():
+    rng = random.Random(3)
+    calls = [[rng.uniform(0.05, 2.0) for _ in range(rng.randint(1, 200))] for _ in range(12)]
+
+    merged = LatencySketch()
+    for values in calls:
+        # through latency.json, as the analytics CLI reads them
+        merged.merge(LatencySketch.from_dict(_sketch(values).to_dict()))
+
+    everything = _sketch([value for values in calls for value in values])
+    assert merged.buckets == everything.buckets
+    assert merged.count == everything.count and merged.max == everything.max
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == everything.quantile(q)
+
+
+def test_rolling_window_drops_old_slots():
+    rolling = RollingSketch(slot_seconds=15.0, horizon_seconds=900.0)
+    rolling.add(5.0, now=0.0)
+    rolling.add(0.2, now=600.0)
+
+    assert rolling.window(60.0, now=610.0).count == 1
+    assert rolling.window(900.0, now=610.0).count == 2
+    assert rolling.window(None).count == 2
+
+
+def test_stats_keep_only_latency_fields():
+    stats = LatencyStats()
+    stats.add("llm", {"ttft": 0.4, "duration": 1.2, "prompt_tokens": 100, "tokens_per_second": -1}, now=0.0)
+
+    assert set(stats.window(None)) == {"llm.ttft", "llm.duration"}
+    assert {row["window"] for row in stats.rows(now=0.0)} == {"1m", "15m", "session"}
@@ -0,0 +1,44 @@
+"""
+The columnar store interns only low-cardinality strings: per-record IDs and
+stacks must not grow the shared string table.
+"""
+import pytest
+
+from agent.store import MetricsStore
+
+
+def _llm_row(i):
+    # timestamp, type, label, request_id, duration, ttft, cancelled, completion, prompt, total, tps, speech_id
+    return (1.0 + i, "llm_metrics", "openai.LLM", f"req-{i}", 0.9, 0.4, False, 30, 120, 150, 33.0, f"speech-{i}")
+
+
+def test_ids_are_not_interned():
+    store = MetricsStore(chunk_size=4)
+    for i in range(10):
+        store.append("llm", _llm_row(i))
+
+    # "llm_metrics" and "openai.LLM" only
+    assert len(store.strings) == 2
+    rows = list(store.rows("llm"))
+    assert [row["request_id"] for row in rows] == [f"req-{i}" for i in range(10)]
+    assert rows[3]["speech_id"] == "speech-3" and rows[3]["cancelled"] is False
+    assert [sum(view) for view in store.column_views("llm", "ttft")] == pytest.approx([1.6, 1.6, 0.8])
+
+
+def test_text_columns_have_no_views():
+    store = MetricsStore()
+    store.append("llm", _llm_row(0))
+
+    with pytest.raises(TypeError):
+        store.column_views("llm", "request_id")
+
+
+def test_stacks_are_kept_per_row():
+    store = MetricsStore()
+    stack = "Traceback ...\n" * 200
+    for name in ("a", "b", "a"):
+        store.append("loop", (1.0, "loop_metrics", "stall", name, 0.3, "", stack))
+
+    # type, source and the two handler names
+    assert len(store.strings) == 4
+    assert all(row["stack"] == stack for row in store.rows("loop"))
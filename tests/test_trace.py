@@ -0,0 +1,74 @@
+"""
+Trace timeline: spans reconstructed backwards from metric records, Chrome
+trace events with flow arrows per reply, and the bounded span buffer.
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from agent.trace import TraceRecorder, spans, trace_events
+
+LLM = {
+    "timestamp": 100.0, "duration": 2.0, "ttft": 0.5, "cancelled": True, "request_id": "req-1",
+    "prompt_tokens": 120, "completion_tokens": 30, "tokens_per_second": 15.0, "speech_id": "speech-1",
+}
+TTS = {
+    "timestamp": 101.0, "duration": 1.5, "ttfb": 0.3, "cancelled": False, "request_id": "req-2",
+    "audio_duration": 2.4, "characters_count": 42, "speech_id": "speech-1",
+}
+EOU = {
+    "timestamp": 98.0, "end_of_utterance_delay": 0.6, "transcription_delay": 0.2,
+    "on_user_turn_completed_delay": 0.1, "speech_id": "speech-1",
+}
+
+
+def test_spans_end_at_the_record_timestamp():
+    request, ttft = spans("llm", LLM)
+    assert request[:4] == ("LLM", "LLM (cancelled)", 98.0, 2.0)
+    assert request[4]["speech_id"] == "speech-1" and request[4]["ttft"] == 0.5
+    assert ttft[:4] == ("LLM", "ttft", 98.0, 0.5)
+
+    eou, transcript, callback = spans("eou", EOU)
+    # both delays count from the end of user speech
+    assert eou[:4] == ("EOU", "end of utterance", pytest.approx(97.3), 0.6)
+    assert transcript[:4] == ("STT", "final transcript", pytest.approx(97.3), 0.2)
+    assert callback[:4] == ("EOU", "on_user_turn_completed", pytest.approx(97.9), 0.1)
+
+    assert spans("loop", {"timestamp": 5.0, "duration": 0.3, "source": "loop", "name": "", "speech_id": ""}) == [
+        ("Event loop", "loop: stall", 4.7, 0.3, {})
+    ]
+    assert spans("turn", {"timestamp": 1.0}) == []
+
+
+def test_trace_events_link_a_reply():
+    recorded = spans("eou", EOU) + spans("llm", LLM) + spans("tts", TTS)
+
+    events = trace_events(recorded, origin=90.0, process_name="room-a session")
+
+    complete = [event for event in events if event["ph"] == "X"]
+    assert len(complete) == len(recorded)
+    assert [event["ts"] for event in complete] == sorted(event["ts"] for event in complete)
+    llm = next(event for event in complete if event["name"] == "LLM (cancelled)")
+    assert llm["ts"] == 8e6 and llm["dur"] == 2e6
+    # one flow through the eou, llm and tts spans of speech-1, in time order
+    flow = [event["ph"] for event in events if event.get("cat") == "reply"]
+    assert flow == ["s", "t", "t", "f"]
+    names = {event["args"]["name"] for event in events if event["ph"] == "M" and event["name"] == "thread_name"}
+    assert {"LLM", "TTS", "EOU", "Event loop"} <= names
+
+
+def test_ring_buffer_drops_the_oldest(tmp_path):
+    recorder = TraceRecorder("session-1", "room-a", max_events=3)
+    for index in range(4):
+        # two spans per LLM record
+        recorder.add("llm", {**LLM, "timestamp": 100.0 + index, "speech_id": ""})
+    recorder.on_agent_state(SimpleNamespace(new_state="speaking", created_at=recorder.started_at))
+
+    assert len(recorder) == 3 and recorder.dropped == 5
+    events = recorder.events()
+    # the open agent state is exported as an open span
+    assert any(event["name"] == "speaking" and event["args"] == {"open": True} for event in events)
+
+    written = json.loads(recorder.write(tmp_path / "trace.json").read_text())
+    assert written["otherData"]["dropped"] == 5 and written["otherData"]["spans"] == 3
@@ -0,0 +1,56 @@
+"""
+Turn correlation: EOU, LLM and TTS records sharing a speech_id become one
+turn record, whichever of LLM and TTS finishes last.
+"""
+import pytest
+
+from agent.turns import TurnCorrelator
+
+
+def _records(speech_id="speech-1"):
+    return {
+        "eou": {"timestamp": 10.0, "speech_id": speech_id, "end_of_utterance_delay": 0.5,
+                "on_user_turn_completed_delay": 0.01, "transcription_delay": 0.2},
+        "llm": {"timestamp": 11.0, "speech_id": speech_id, "ttft": 0.4},
+        "tts": {"timestamp": 11.2, "speech_id": speech_id, "ttfb": 0.3},
+    }
+
+
+@pytest.mark.parametrize("order", [("eou", "llm", "tts"), ("eou", "tts", "llm")])
+def test_turn_emitted_in_either_order(order):
+    correlator = TurnCorrelator()
+    records = _records()
+
+    results = [correlator.add(kind, records[kind]) for kind in order]
+
+    assert results[:2] == [None, None]
+    turn = results[2]
+    assert turn["speech_id"] == "speech-1" and turn["has_eou"]
+    assert turn["timestamp"] == 11.2
+    assert turn["voice_to_voice"] == pytest.approx(0.5 + 0.01 + 0.4 + 0.3)
+    assert turn["critical_stage"] == "end_of_utterance"
+    assert correlator.turns == 1 and correlator.pending == 0
+
+
+def test_reply_without_eou_and_duplicates():
+    correlator = TurnCorrelator()
+    records = _records("greeting")
+
+    assert correlator.add("tts", records["tts"]) is None
+    turn = correlator.add("llm", records["llm"])
+
+    assert not turn["has_eou"] and turn["voice_to_voice"] == pytest.approx(0.7)
+    # a tool follow-up LLM call for the same speech does not emit again
+    assert correlator.add("llm", records["llm"]) is None
+    assert correlator.turns == 1
+
+
+def test_stale_partial_turns_are_evicted():
+    correlator = TurnCorrelator(ttl=5.0)
+    correlator.add("eou", _records("old")["eou"])
+
+    later = _records("new")
+    later["llm"]["timestamp"] = 30.0
+    correlator.add("llm", later["llm"])
+
+    assert correlator.evicted == 1 and correlator.pending == 1